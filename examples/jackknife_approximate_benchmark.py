@@ -0,0 +1,84 @@
+"""
+Benchmark of the approximate (count-sketched) infinitesimal jackknife error bars against the exact ones, as computed by
+plot_helper.random_forest_error_modified for the rf_error_method values jackknife_approximate and jackknife_calibrated.
+
+For each training set size a random forest is fit on synthetic data, and the script reports the time of both
+computations and the relative error of the approximate standard deviations. The basic (uncorrected) jackknife variance
+is compared as well, since it isolates the sketching error from the bias correction and calibration.
+
+Both computations go through the (n_trees, n_trees) Gram matrix of the centered inbag matrix when there are more test
+rows than trees. Use an n_test of at most n_trees to compare against the direct (chunked) forestci computation instead.
+The sketch is only used if it is cheaper than the exact computation, see plot_helper.use_inbag_sketch, so the training
+sets should be well above the sketch size, which defaults to MAST-ML's JACKKNIFE_SKETCH_SIZE.
+
+Example:
+
+    python jackknife_approximate_benchmark.py --n_train 10000 50000 --n_test 1000 --n_trees 500 --sketch_size 2000
+"""
+
+import argparse
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+from mastml import plot_helper
+
+def make_data(n_rows, n_features, random_state):
+    rng = np.random.RandomState(random_state)
+    X = rng.rand(n_rows, n_features)
+    y = np.sin(4 * X[:, 0]) + X[:, 1] ** 2 + 0.5 * X[:, 2] + 0.1 * rng.randn(n_rows)
+    return X, y
+
+def timed(func, **kwargs):
+    start = time.perf_counter()
+    result = func(**kwargs)
+    return result, time.perf_counter() - start
+
+def relative_error(approximate, exact):
+    valid = (exact > 0) & np.isfinite(approximate)
+    return np.median(np.abs(approximate[valid] - exact[valid]) / exact[valid])
+
+def benchmark(n_train, n_test, n_trees, n_features, sketch_size, n_jobs, random_state):
+    X, y = make_data(n_train + n_test, n_features, random_state)
+    X_train, X_test, y_train = X[:n_train], X[n_train:], y[:n_train]
+    forest = RandomForestRegressor(n_estimators=n_trees, min_samples_leaf=5, n_jobs=n_jobs,
+                                   random_state=random_state).fit(X_train, y_train)
+    inbag = plot_helper.calc_inbag_modified(n_train, forest, False)
+
+    results = dict()
+    for name, kwargs in [('basic', dict(basic_IJ=True, calibrate=False)),
+                         ('calibrated', dict(basic_IJ=False, calibrate=True))]:
+        np.random.seed(random_state)
+        exact, exact_time = timed(plot_helper.random_forest_error_modified, forest=forest, is_ensemble=False,
+                                  X_train=X_train, X_test=X_test, inbag=inbag, **kwargs)
+        np.random.seed(random_state)
+        approximate, approximate_time = timed(plot_helper.random_forest_error_modified, forest=forest,
+                                              is_ensemble=False, X_train=X_train, X_test=X_test, inbag=inbag,
+                                              approximate=True, sketch_size=sketch_size, random_state=random_state,
+                                              **kwargs)
+        results[name] = (exact_time, approximate_time,
+                         relative_error(np.sqrt(np.maximum(approximate, 0)), np.sqrt(np.maximum(exact, 0))))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the approximate jackknife error bars of MAST-ML')
+    parser.add_argument('--n_train', type=int, nargs='+', default=[5000, 20000, 50000])
+    parser.add_argument('--n_test', type=int, default=1000)
+    parser.add_argument('--n_trees', type=int, default=500)
+    parser.add_argument('--n_features', type=int, default=5)
+    parser.add_argument('--sketch_size', type=int, default=plot_helper.JACKKNIFE_SKETCH_SIZE)
+    parser.add_argument('--n_jobs', type=int, default=-1)
+    parser.add_argument('--random_state', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f'{"n_train":>8} {"method":>11} {"exact (s)":>10} {"sketch (s)":>11} {"speedup":>8} {"median rel. err.":>17}')
+    for n_train in args.n_train:
+        results = benchmark(n_train, args.n_test, args.n_trees, args.n_features, args.sketch_size, args.n_jobs,
+                            args.random_state)
+        for name, (exact_time, approximate_time, error) in results.items():
+            print(f'{n_train:>8} {name:>11} {exact_time:>10.3f} {approximate_time:>11.3f} '
+                  f'{exact_time / approximate_time:>8.1f} {error:>17.3f}')
+
+if __name__ == '__main__':
+    main()
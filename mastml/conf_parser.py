@@ -41,7 +41,8 @@ def parse_conf_file(filepath, from_dict=False):
     set_required_sections_to_empty()
 
     def check_unknown_sections():
-        all_sections = main_sections + feature_sections + ['MiscSettings']
+        # FeatureScreening is not set to empty when missing, as giving the section (even empty) turns the screening on
+        all_sections = main_sections + feature_sections + ['MiscSettings', 'FeatureScreening']
         for section_name in conf:
             if section_name not in all_sections:
                 raise Exception(f'[{section_name}] is not a valid section!'
@@ -98,7 +99,7 @@ def parse_conf_file(filepath, from_dict=False):
         #all_settings =  ['input_features', 'target_feature', 'metrics',
         #                 'randomizer', 'validation_columns', 'not_input_features', 'grouping_feature']
         all_settings =  ['input_features', 'input_target', 'metrics',
-                         'randomizer', 'input_testdata', 'input_other', 'input_grouping']
+                         'randomizer', 'input_testdata', 'input_other', 'input_grouping', 'precision']
         for name in GS:
             if name not in all_settings:
                 raise utils.InvalidConfParameters(
@@ -147,6 +148,13 @@ def parse_conf_file(filepath, from_dict=False):
             GS['randomizer'] = False
     set_randomizer_setting()
 
+    def set_precision_setting():
+        if 'precision' not in GS:
+            GS['precision'] = 'float64'
+        elif GS['precision'] not in ['float32', 'float64']:
+            raise utils.InvalidConfParameters(
+                    f"[GeneralSetup] precision must be either float32 or float64, not {GS['precision']}")
+    set_precision_setting()
 
     def set_default_features():
         for name in ['input_features', 'input_target']:
@@ -204,7 +212,7 @@ def parse_conf_file(filepath, from_dict=False):
 
     def check_and_boolify_plot_settings():
         default_false = ['plot_each_feature_vs_target', 'rf_error_method', 'rf_error_percentile',
-                         'normalize_target_feature']
+                         'normalize_target_feature', 'feature_selection_cache']
         default_true = ['plot_target_histogram', 'plot_train_test_plots', 'plot_predicted_vs_true', 'plot_error_plots',
                          'plot_predicted_vs_true_average', 'plot_best_worst_per_point']
         all_settings = default_false + default_true
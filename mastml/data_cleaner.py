@@ -5,46 +5,82 @@ The data_cleaner module is used to clean missing or NaN values from pandas dataf
 import pandas as pd
 import numpy as np
 import logging
+import warnings
 from sklearn.impute import SimpleImputer as Imputer
 
 import os
 from scipy.linalg import orth
 
+from mastml import utils
+
 log = logging.getLogger('mastml')
 
-def flag_outliers(df, conf_not_input_features, savepath, n_stdevs=3):
+def flag_outliers(df, conf_not_input_features, savepath, n_stdevs=3, method='zscore', report_format='csv'):
     """
-    Method that scans values in each X feature matrix column and flags values that are larger than 3 standard deviations
-    from the average of that column value. The index and column values of potentially problematic points are listed and
-    written to an output file.
+    Method that scans values in each X feature matrix column and flags values that are larger than n_stdevs standard
+    deviations from the average of that column value. All columns are scanned at once as a single array. The row, column
+    and value of potentially problematic points are listed and written to an output file.
 
     Args:
         df: (dataframe), pandas dataframe containing data
 
+        conf_not_input_features: (list), list of column names that are not scanned for outliers
+
+        savepath: (str), path of directory to save the outlier report to
+
+        n_stdevs: (int/float), number of standard deviations (or scaled MADs) away from the column center beyond which
+        a value is flagged
+
+        method: (str), either 'zscore' (column mean and standard deviation) or 'mad' (column median and median absolute
+        deviation, scaled to be consistent with the standard deviation of normally distributed data)
+
+        report_format: (str), either 'csv' or 'parquet'. Writing parquet requires pyarrow or fastparquet, and falls back
+        to csv if neither is installed
+
     Returns:
-        None, just writes results to file
+        outliers: (dataframe), dataframe with one row per flagged value, with columns 'Row', 'Column' and 'Value'. 'Row'
+        is the index label of the flagged row in df, not its position
 
     """
-    n_rows = df.shape[0]
-    outlier_dict = dict()
-    for col in df.columns:
-        outlier_rows = list()
-        outlier_vals = list()
-        if col not in conf_not_input_features:
-            avg = np.average(df[col])
-            stdev = np.std(df[col])
-            for row in range(n_rows):
-                if df[col].iloc[row] > avg + n_stdevs*stdev:
-                    outlier_rows.append(row)
-                    outlier_vals.append(df[col].iloc[row])
-                elif df[col].iloc[row] < avg - n_stdevs*stdev:
-                    outlier_rows.append(row)
-                    outlier_vals.append(df[col].iloc[row])
-                else:
-                    pass
-        outlier_dict[col] = (outlier_rows, outlier_vals)
-    pd.DataFrame().from_dict(data=outlier_dict,orient='index', columns=['Indices', 'Values']).to_excel(os.path.join(savepath,'data_potential_outliers.xlsx'))
-    return
+    columns = [col for col in df.columns if col not in conf_not_input_features]
+    df_numeric = df[columns].select_dtypes(include=[np.number])
+    values = df_numeric.values.astype(float)
+
+    with warnings.catch_warnings():
+        # All-NaN columns are expected here, they simply flag nothing
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        if method == 'zscore':
+            center = np.nanmean(values, axis=0)
+            scale = np.nanstd(values, axis=0)
+        elif method == 'mad':
+            center = np.nanmedian(values, axis=0)
+            deviations = np.abs(values - center)
+            scale = 1.4826*np.nanmedian(deviations, axis=0)
+            # More than half the column sits at the median, fall back to the (scaled) mean absolute deviation
+            no_mad = scale == 0
+            scale[no_mad] = 1.2533*np.nanmean(deviations[:, no_mad], axis=0)
+        else:
+            raise utils.InvalidValue(f"Outlier method '{method}' is not valid. Choose from: zscore, mad")
+
+    # Columns without any spread can't have outliers, so exclude them rather than flag every differing value
+    scale[scale == 0] = np.nan
+    with np.errstate(invalid='ignore'):
+        mask = np.abs(values - center) > n_stdevs*scale
+    rows, cols = np.nonzero(mask)
+
+    outliers = pd.DataFrame({'Row': df_numeric.index.values[rows],
+                             'Column': df_numeric.columns.values[cols],
+                             'Value': values[rows, cols]})
+    log.info(f'Flagged {outliers.shape[0]} potential outlier values in {len(np.unique(cols))} columns')
+
+    if report_format == 'parquet':
+        try:
+            outliers.to_parquet(os.path.join(savepath, 'data_potential_outliers.parquet'), index=False)
+            return outliers
+        except ImportError:
+            log.warning('Writing the outlier report as parquet requires pyarrow or fastparquet, writing csv instead')
+    outliers.to_csv(os.path.join(savepath, 'data_potential_outliers.csv'), index=False)
+    return outliers
 
 def remove(df, axis):
     """
@@ -91,31 +127,48 @@ def imputation(df, strategy, cols_to_leave_out=None):
         col_names = df.columns.tolist()
     return df
 
-def ppca(df, cols_to_leave_out=None):
+def ppca(df, cols_to_leave_out=None, n_components=None, max_iter=1000, tol=1e-4, dtype='float64', batch_size=None,
+         random_state=None):
     """
     Method that performs a recursive PCA routine to use PCA of known columns to fill in missing values in particular column
 
     Args:
         df: (dataframe), pandas dataframe containing data
+
         cols_to_leave_out: (list), list of column indices to not include in imputation
 
+        n_components: (int), dimension of the latent space. If None, the number of imputed columns is used
+
+        max_iter: (int), maximum number of EM iterations
+
+        tol: (float), relative change in the likelihood bound below which the EM iterations have converged
+
+        dtype: (str), 'float64' or 'float32'. Using float32 halves the memory held by the data matrix
+
+        batch_size: (int), number of rows processed at once in each EM pass. If None, all rows are processed at once
+
+        random_state: (int), seed used to initialize the loading matrix
+
     Returns:
         df: (dataframe): dataframe with NaN or missing values resolved via imputation
 
     """
     col_names = df.columns.tolist()
-    pca_magic = PPCA()
     if cols_to_leave_out is None:
-        pca_magic.fit(np.array(df))
+        df_include = df
     else:
-        pca_magic.fit(np.array(df.drop(cols_to_leave_out, axis=1)))
-    # Need to un-standardize the pca-transformed data
-    df_ppca = pd.DataFrame(pca_magic.data*pca_magic.stds+pca_magic.means)
+        df_include = df.drop(cols_to_leave_out, axis=1)
+    pca_magic = IncrementalPPCA(n_components=n_components, max_iter=max_iter, tol=tol, dtype=dtype,
+                                batch_size=batch_size, random_state=random_state)
+    pca_magic.fit(np.array(df_include, dtype=dtype))
+    # Need to un-standardize the pca-transformed data. Columns with too few observations to be imputed are left as is.
+    df_ppca = df_include.copy()
+    df_ppca.iloc[:, np.where(pca_magic.valid_series)[0]] = pca_magic.inverse_standardize()
     if cols_to_leave_out is None:
         df = df_ppca
     else:
         df = pd.concat([df_ppca, df[cols_to_leave_out]], axis=1)
-    df.columns = col_names
+    df = df[col_names]
     return df
 
 def columns_with_strings(df):
@@ -133,142 +186,213 @@ def columns_with_strings(df):
     str_columns = str_summary.index[str_summary[0] == True].tolist()
     return str_columns
 
-class PPCA():
+class IncrementalPPCA():
     """
-    Class to perform probabilistic principal component analysis (PPCA) to fill in missing data.
+    Class to perform probabilistic principal component analysis (PPCA) to fill in missing data, processing the rows of the
+    data in chunks so that no temporary array larger than batch_size x n_features is formed.
 
-    This PPCA routine was taken directly from https://github.com/allentran/pca-magic. Due to import errors, for ease of use
-    we have elected to copy the module here. This github repo was last accessed on 8/27/18. The code comprising the PPCA
-    class below was not developed by and is not owned by the University of Wisconsin-Madison MAST-ML development team.
+    This PPCA routine is based on https://github.com/allentran/pca-magic, last accessed on 8/27/18, which was not developed by
+    and is not owned by the University of Wisconsin-Madison MAST-ML development team. The EM updates are the same, but the
+    sufficient statistics of each E and M step are accumulated one chunk of rows at a time, the latent dimension, iteration
+    budget and floating point precision are configurable, and small matrix inverses are replaced by linear solves.
 
-    """
-    def __init__(self):
+    The data is imputed in place, so the full data matrix stays in memory during the fit, together with a boolean mask of
+    its observed values (one byte per entry) and the latent positions (n_rows x n_components). batch_size only bounds the
+    temporary arrays of each EM pass, which are otherwise as large as the data matrix. Peak memory is therefore about
+    n_rows x n_features x (itemsize of dtype + 1) bytes, plus batch_size x n_features temporaries.
 
-        self.raw = None
-        self.data = None
-        self.C = None
-        self.means = None
-        self.stds = None
-        self.eig_vals = None
+    Args:
 
-    def _standardize(self, X):
+        n_components: (int), dimension of the latent space. If None, the number of imputed columns is used
 
-        if self.means is None or self.stds is None:
-            raise RuntimeError("Fit model first")
+        max_iter: (int), maximum number of EM iterations
 
-        return (X - self.means) / self.stds
+        tol: (float), relative change in the likelihood bound below which the EM iterations have converged
 
-    def fit(self, data, d=None, tol=1e-4, min_obs=10, verbose=False):
+        min_obs: (int), columns with fewer observed values than this are not imputed
 
-        self.raw = data
-        self.raw[np.isinf(self.raw)] = np.max(self.raw[np.isfinite(self.raw)])
+        dtype: (str), 'float64' or 'float32', precision of the data matrix and of the large matrix products
 
-        valid_series = np.sum(~np.isnan(self.raw), axis=0) >= min_obs
+        batch_size: (int), number of rows processed at once. If None, all rows are processed at once
 
-        data = self.raw[:, valid_series].copy()
-        N = data.shape[0]
-        D = data.shape[1]
+        random_state: (int), seed used to initialize the loading matrix
 
-        self.means = np.nanmean(data, axis=0)
-        self.stds = np.nanstd(data, axis=0)
+    Methods:
 
-        data = self._standardize(data)
-        observed = ~np.isnan(data)
-        missing = np.sum(~observed)
-        data[~observed] = 0
+        fit: runs EM on the data, imputing missing values in place
 
-        # initial
+            Args:
 
-        if d is None:
-            d = data.shape[1]
+                data: (numpy array), array of data containing NaN in place of missing values
 
-        if self.C is None:
-            C = np.random.randn(D, d)
-        else:
-            C = self.C
-        CC = np.dot(C.T, C)
-        X = np.dot(np.dot(data, C), np.linalg.inv(CC))
-        recon = np.dot(X, C.T)
-        recon[~observed] = 0
-        ss = np.sum((recon - data) ** 2) / (N * D - missing)
+            Returns:
 
-        v0 = np.inf
-        counter = 0
+                (self, the object instance)
 
-        while True:
+        transform: projects data onto the fitted principal components
 
-            Sx = np.linalg.inv(np.eye(d) + CC / ss)
+            Args:
+
+                data: (numpy array), standardized data to project. If None, the fitted data is used
+
+            Returns:
+
+                (numpy array), array of projected data
+
+        inverse_standardize: returns the imputed data on the original scale of each column. The data is rescaled in place
+        and released from the instance, so this can only be called once per fit
 
-            # e-step
+            Returns:
+
+                (numpy array), array of imputed data for the columns in valid_series
+
+    """
+    def __init__(self, n_components=None, max_iter=1000, tol=1e-4, min_obs=10, dtype='float64', batch_size=None,
+                 random_state=None):
+        self.n_components = n_components
+        self.max_iter = max_iter
+        self.tol = tol
+        self.min_obs = min_obs
+        self.dtype = np.dtype(dtype)
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+        self.data = None
+        self.C = None
+        self.means = None
+        self.stds = None
+        self.eig_vals = None
+        self.valid_series = None
+        self.n_iter_ = 0
+
+    def _batches(self, n_rows):
+        batch_size = n_rows if self.batch_size is None else max(int(self.batch_size), 1)
+        for start in range(0, n_rows, batch_size):
+            yield slice(start, min(start+batch_size, n_rows))
+
+    def fit(self, data):
+        data = np.asarray(data, dtype=self.dtype)
+        infinite = np.isinf(data)
+        if infinite.any():
+            # Infinite values are replaced by the largest finite value
+            data[infinite] = np.nanmax(np.where(infinite, np.nan, data))
+
+        self.valid_series = np.sum(~np.isnan(data), axis=0) >= self.min_obs
+        if not self.valid_series.all():
+            data = data[:, self.valid_series]
+        N, D = data.shape
+
+        # Standardize in place, one chunk of rows at a time
+        self.means = np.nanmean(data, axis=0, dtype=np.float64)
+        self.stds = np.nanstd(data, axis=0, dtype=np.float64)
+        self.stds[self.stds == 0] = 1
+        observed = ~np.isnan(data)
+        for rows in self._batches(N):
+            data[rows] -= self.means.astype(self.dtype)
+            data[rows] /= self.stds.astype(self.dtype)
+            data[rows][~observed[rows]] = 0
+        missing = np.sum(~observed)
+
+        d = D if self.n_components is None else min(int(self.n_components), D)
+        rng = np.random.RandomState(self.random_state)
+        C = rng.randn(D, d)
+        CC = np.dot(C.T, C)
+
+        # Initial latent positions and noise variance
+        X = np.empty((N, d), dtype=self.dtype)
+        ss = 0.
+        CCinv_Ct = np.linalg.solve(CC, C.T).T.astype(self.dtype)
+        for rows in self._batches(N):
+            X[rows] = np.dot(data[rows], CCinv_Ct)
+            recon = np.dot(X[rows], C.T.astype(self.dtype))
+            recon[~observed[rows]] = 0
+            ss += np.sum((recon - data[rows]) ** 2, dtype=np.float64)
+        ss /= (N * D - missing)
+
+        v0 = np.inf
+        converged = False
+        for counter in range(int(self.max_iter)):
+            Sx = np.linalg.inv(np.eye(d) + CC / ss)
             ss0 = ss
-            if missing > 0:
-                proj = np.dot(X, C.T)
-                data[~observed] = proj[~observed]
-            X = np.dot(np.dot(data, C), Sx) / ss
+
+            # e-step, accumulating the sufficient statistics of the m-step chunk by chunk
+            C_ = C.astype(self.dtype)
+            CSx = (np.dot(C, Sx) / ss).astype(self.dtype)
+            XX = np.zeros((d, d))
+            DX = np.zeros((D, d))
+            for rows in self._batches(N):
+                chunk = data[rows]
+                if missing > 0:
+                    proj = np.dot(X[rows], C_.T)
+                    chunk[~observed[rows]] = proj[~observed[rows]]
+                X[rows] = np.dot(chunk, CSx)
+                XX += np.dot(X[rows].T, X[rows])
+                DX += np.dot(chunk.T, X[rows])
 
             # m-step
-            XX = np.dot(X.T, X)
-            C = np.dot(np.dot(data.T, X), np.linalg.pinv(XX + N * Sx))
+            C = np.linalg.solve((XX + N * Sx).T, DX.T).T
             CC = np.dot(C.T, C)
-            recon = np.dot(X, C.T)
-            recon[~observed] = 0
-            ss = (np.sum((recon - data) ** 2) + N * np.sum(CC * Sx) + missing * ss0) / (N * D)
+            C_ = C.astype(self.dtype)
+            err = 0.
+            for rows in self._batches(N):
+                recon = np.dot(X[rows], C_.T)
+                recon[~observed[rows]] = 0
+                err += np.sum((recon - data[rows]) ** 2, dtype=np.float64)
+            ss = (err + N * np.sum(CC * Sx) + missing * ss0) / (N * D)
 
             # calc diff for convergence
-            det = np.log(np.linalg.det(Sx))
-            if np.isinf(det):
-                det = abs(np.linalg.slogdet(Sx)[1])
+            det = np.linalg.slogdet(Sx)[1]
             v1 = N * (D * np.log(ss) + np.trace(Sx) - det) \
                  + np.trace(XX) - missing * np.log(ss0)
             diff = abs(v1 / v0 - 1)
-            if verbose:
-                print(diff)
-            if (diff < tol) and (counter > 5):
+            log.debug(f'PPCA iteration {counter}: relative change {diff}')
+            self.n_iter_ = counter + 1
+            if (diff < self.tol) and (counter > 5):
+                converged = True
                 break
-
-            counter += 1
             v0 = v1
 
+        if not converged:
+            log.warning(f'PPCA imputation did not converge within {self.max_iter} iterations')
+
         C = orth(C)
-        vals, vecs = np.linalg.eig(np.cov(np.dot(data, C).T))
+        vals, vecs = np.linalg.eig(np.cov(np.dot(data, C.astype(self.dtype)).T))
         order = np.flipud(np.argsort(vals))
         vecs = vecs[:, order]
         vals = vals[order]
 
-        C = np.dot(C, vecs)
-
         # attach objects to class
-        self.C = C
+        self.C = np.dot(C, vecs)
         self.data = data
         self.eig_vals = vals
         self._calc_var()
+        return self
 
     def transform(self, data=None):
-
         if self.C is None:
             raise RuntimeError('Fit the data model first.')
         if data is None:
             return np.dot(self.data, self.C)
         return np.dot(data, self.C)
 
-    def _calc_var(self):
-
+    def inverse_standardize(self):
         if self.data is None:
             raise RuntimeError('Fit the data model first.')
+        for rows in self._batches(self.data.shape[0]):
+            self.data[rows] *= self.stds.astype(self.dtype)
+            self.data[rows] += self.means.astype(self.dtype)
+        data = self.data
+        self.data = None
+        return data
 
-        data = self.data.T
-
-        # variance calc
-        var = np.nanvar(data, axis=1)
+    def _calc_var(self):
+        # Column variances accumulated in chunks to avoid a full-size centered copy of the data
+        N = self.data.shape[0]
+        sums = np.zeros(self.data.shape[1])
+        sums_sq = np.zeros(self.data.shape[1])
+        for rows in self._batches(N):
+            sums += np.sum(self.data[rows], axis=0, dtype=np.float64)
+            sums_sq += np.sum(self.data[rows].astype(np.float64) ** 2, axis=0)
+        var = sums_sq / N - (sums / N) ** 2
         total_var = var.sum()
         self.var_exp = self.eig_vals.cumsum() / total_var
-
-    def save(self, fpath):
-
-        np.save(fpath, self.C)
-
-    def load(self, fpath):
-
-        assert os.path.isfile(fpath)
-
-        self.C = np.load(fpath)
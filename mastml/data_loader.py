@@ -7,7 +7,7 @@ import logging
 from mastml import utils
 log = logging.getLogger('mastml')
 
-def load_data(file_path, input_features=None, input_target=None, input_grouping= None, feature_blacklist=list()):
+def load_data(file_path, input_features=None, input_target=None, input_grouping= None, feature_blacklist=list(), dtype=None):
     """
     Method that accepts the filepath of an input data file and returns a full dataframe and parsed X and y dataframes
 
@@ -21,6 +21,9 @@ def load_data(file_path, input_features=None, input_target=None, input_grouping=
 
         grouping_feature: (str), column names used to group data in user-defined grouping scheme
 
+        dtype: (str), floating point type to store the numeric X feature columns as, e.g. 'float32'. If None, the types
+        inferred when reading the data file are kept
+
     Returns:
         df: (dataframe), full dataframe of the input X data (y data is removed)
 
@@ -63,6 +66,8 @@ def load_data(file_path, input_features=None, input_target=None, input_grouping=
             raise Exception(f"Data file does not have column '{feature}'")
 
     X, y = df[input_features], df[input_target]
+    if dtype is not None:
+        X = set_precision(X, dtype)
 
     log.info('blacklisted features, either from "input_other" or a "input_grouping":' +
                  str(feature_blacklist))
@@ -97,3 +102,23 @@ def load_data(file_path, input_features=None, input_target=None, input_grouping=
                                   '"input_other" fields. Please correct your input file and re-run MAST-ML')
 
     return df, X, X_noinput, X_grouped, y
+
+def set_precision(df, dtype):
+    """
+    Method that casts the numeric columns of a dataframe to a given floating point type, leaving other columns untouched
+
+    Args:
+        df: (dataframe), pandas dataframe containing data
+
+        dtype: (str), floating point type to cast to, e.g. 'float32' or 'float64'
+
+    Returns:
+        df: (dataframe), dataframe with numeric columns cast to dtype. The input dataframe is returned as is if no column
+        needs casting
+
+    """
+    to_cast = [col for col, col_dtype in df.dtypes.items()
+               if pd.api.types.is_numeric_dtype(col_dtype) and not pd.api.types.is_bool_dtype(col_dtype) and col_dtype != dtype]
+    if len(to_cast) == 0:
+        return df
+    return df.astype({col: dtype for col in to_cast})
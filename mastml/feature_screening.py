@@ -0,0 +1,253 @@
+"""
+This module contains methods to screen very wide sets of generated features without holding them all in memory. Features
+are written to an on-disk feature store in chunks, and the screening reads them back in column blocks to compute the
+per-column variance, correlation with the target and redundancy between candidate columns. Only the surviving columns
+are then loaded as a dataframe for the rest of the pipeline.
+
+Each generator still builds its full output dataframe in memory before it is written to the store, so the peak memory of
+the feature generation is that of the largest generator's output (plus one block of columns being written). The store
+bounds the memory of the combined output of all generators and of the screening.
+"""
+
+import os
+import shutil
+import logging
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger('mastml')
+
+class FeatureStore(object):
+    """
+    Class that stores the numeric columns of a series of dataframes on disk, as column-major memory-mapped .npy files or
+    as parquet files, and reads them back by blocks of columns
+
+    Args:
+
+        path: (str), directory to write the store files to
+
+        store_format: (str), either 'memmap' or 'parquet'. Parquet requires pyarrow or fastparquet, and falls back to
+        memmap with a warning if neither is installed
+
+        dtype: (str), floating point type to store the features as
+
+        chunk_size: (int), the number of columns written to each chunk of the store. Only this many columns are converted
+        to dtype at a time when appending
+
+    Methods:
+
+        append: writes the numeric columns of a dataframe to new chunks of the store, chunk_size columns at a time.
+        Non-numeric columns are kept in memory and passed through the screening
+
+            Args:
+
+                df: (dataframe), dataframe of features with the same row index as previously appended dataframes
+
+            Returns:
+
+                None
+
+        iter_blocks: reads the stored numeric columns in blocks
+
+            Args:
+
+                block_size: (int), the number of columns per block
+
+            Returns:
+
+                (generator), yields (list of column names, numpy array of shape (n_rows, n_columns in block)) tuples
+
+        read: reads a selection of columns into a dataframe
+
+            Args:
+
+                columns: (list), names of the columns to read
+
+            Returns:
+
+                (dataframe), dataframe of the selected columns with the original row index
+
+        remove: deletes the store files. The store can't be read afterwards
+
+            Args:
+
+                None
+
+            Returns:
+
+                None
+
+    """
+
+    def __init__(self, path, store_format='memmap', dtype='float64', chunk_size=1000):
+        if store_format not in ['memmap', 'parquet']:
+            raise ValueError(f"store_format must be either memmap or parquet, not {store_format}")
+        self.path = path
+        self.store_format = store_format
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        self.index = None
+        self.columns = list()
+        self.passthrough = pd.DataFrame()
+        self._chunks = list()
+        os.makedirs(self.path, exist_ok=True)
+
+    def append(self, df):
+        if self.index is None:
+            self.index = df.index
+        numeric = [col for col, col_dtype in df.dtypes.items()
+                   if pd.api.types.is_numeric_dtype(col_dtype) and not pd.api.types.is_bool_dtype(col_dtype)]
+        others = [col for col in df.columns if col not in numeric]
+        if len(others) > 0:
+            self.passthrough = pd.concat([self.passthrough, df[others]], axis=1)
+        # Write the columns in chunks, so at most chunk_size columns are copied and converted at a time
+        for start in range(0, len(numeric), self.chunk_size):
+            self._write_chunk(df, numeric[start:start + self.chunk_size])
+
+    def _write_chunk(self, df, chunk_columns):
+        filename = os.path.join(self.path, f'chunk_{len(self._chunks)}')
+        if self.store_format == 'parquet':
+            try:
+                # Parquet needs string column names
+                pd.DataFrame(df[chunk_columns].to_numpy(dtype=self.dtype), columns=[str(col) for col in chunk_columns])\
+                    .to_parquet(filename + '.parquet', index=False)
+                filename += '.parquet'
+            except ImportError:
+                log.warning('A parquet feature store requires pyarrow or fastparquet, using a memmap store instead')
+                self.store_format = 'memmap'
+        if self.store_format == 'memmap':
+            filename += '.npy'
+            array = np.lib.format.open_memmap(filename, mode='w+', dtype=self.dtype,
+                                              shape=(df.shape[0], len(chunk_columns)), fortran_order=True)
+            array[:] = df[chunk_columns].to_numpy(dtype=self.dtype)
+            array.flush()
+            del array
+        self._chunks.append((filename, chunk_columns))
+        self.columns.extend(chunk_columns)
+
+    def _read_chunk(self, filename, chunk_columns, positions):
+        if filename.endswith('.parquet'):
+            names = [str(chunk_columns[i]) for i in positions]
+            return pd.read_parquet(filename, columns=names).to_numpy()
+        # Column blocks of a fortran ordered memmap are contiguous on disk
+        return np.asarray(np.load(filename, mmap_mode='r')[:, positions])
+
+    def iter_blocks(self, block_size):
+        for filename, chunk_columns in self._chunks:
+            for start in range(0, len(chunk_columns), block_size):
+                positions = list(range(start, min(start + block_size, len(chunk_columns))))
+                yield [chunk_columns[i] for i in positions], self._read_chunk(filename, chunk_columns, positions)
+
+    def read(self, columns):
+        wanted = set(columns)
+        blocks = list()
+        for filename, chunk_columns in self._chunks:
+            positions = [i for i, col in enumerate(chunk_columns) if col in wanted]
+            if len(positions) > 0:
+                blocks.append(pd.DataFrame(self._read_chunk(filename, chunk_columns, positions),
+                                           columns=[chunk_columns[i] for i in positions], index=self.index))
+        passthrough = [col for col in self.passthrough.columns if col in wanted]
+        if len(passthrough) > 0:
+            blocks.append(self.passthrough[passthrough])
+        if len(blocks) == 0:
+            return pd.DataFrame(index=self.index)
+        dataframe = pd.concat(blocks, axis=1)
+        return dataframe[[col for col in columns if col in dataframe.columns]]
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        self._chunks = list()
+        self.columns = list()
+
+def standardize_columns(array):
+    """
+    Method that centers each column of an array and scales it to unit norm, so that the product of two standardized
+    arrays gives the Pearson correlations between their columns. Constant columns become NaN
+
+    Args:
+
+        array: (numpy array), 2D array of data
+
+    Returns:
+
+        (numpy array), array of standardized columns
+
+    """
+    centered = array - array.mean(axis=0)
+    norms = np.sqrt(np.einsum('ij,ij->j', centered, centered))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return centered / np.where(norms > 0, norms, np.nan)
+
+def screen_features(store, y, variance_threshold=0.0, target_correlation_threshold=0.0, redundancy_threshold=None,
+                    block_size=1000):
+    """
+    Method that screens the features of a FeatureStore block by block. Columns with a variance at or below
+    variance_threshold (i.e. constant columns by default) or an absolute Pearson correlation with the target below
+    target_correlation_threshold are removed. The remaining candidates are then ranked by their target correlation and,
+    within each block of block_size candidates, a column is removed if its absolute correlation with a better ranked kept
+    column of the block is at or above redundancy_threshold
+
+    Args:
+
+        store: (FeatureStore), the feature store to screen
+
+        y: (pd.Series), series of target data
+
+        variance_threshold: (float), columns with a variance at or below this value are removed
+
+        target_correlation_threshold: (float), columns with an absolute correlation to the target below this value are
+        removed
+
+        redundancy_threshold: (float), absolute correlation at or above which a candidate is redundant with a better
+        ranked candidate of its block. If None, no redundancy screening is done
+
+        block_size: (int), the number of columns read from the store at a time
+
+    Returns:
+
+        report: (dataframe), dataframe indexed by feature name with the variance, target correlation, whether the feature
+        was kept and the reason it was removed
+
+    """
+    standardized_y = standardize_columns(np.asarray(y, dtype=np.float64).reshape(-1, 1))
+
+    variances = list()
+    target_corrs = list()
+    for _, block in store.iter_blocks(block_size):
+        block = block.astype(np.float64)
+        variances.append(np.nanvar(block, axis=0))
+        target_corrs.append((standardize_columns(block).T @ standardized_y).ravel())
+    report = pd.DataFrame({'variance': np.concatenate(variances) if variances else np.array([]),
+                           'target_correlation': np.concatenate(target_corrs) if target_corrs else np.array([])},
+                          index=pd.Index(store.columns, name='feature'))
+    report['kept'] = True
+    report['removed_because'] = ''
+
+    low_variance = ~(report['variance'] > variance_threshold)
+    report.loc[low_variance, ['kept', 'removed_because']] = [False, 'variance']
+    # NaN correlations (e.g. columns containing NaN) are left for the data cleaning to deal with
+    low_correlation = report['kept'] & (report['target_correlation'].abs() < target_correlation_threshold)
+    report.loc[low_correlation, ['kept', 'removed_because']] = [False, 'target_correlation']
+
+    if redundancy_threshold is not None:
+        candidates = report.index[report['kept']]
+        candidates = report.loc[candidates, 'target_correlation'].abs().sort_values(ascending=False, na_position='last').index
+        for start in range(0, len(candidates), block_size):
+            names = list(candidates[start:start + block_size])
+            standardized = standardize_columns(store.read(names).to_numpy(dtype=np.float64))
+            redundant = np.abs(standardized.T @ standardized) >= redundancy_threshold
+            kept = np.ones(len(names), dtype=bool)
+            for i in range(1, len(names)):
+                kept[i] = not np.any(redundant[i, :i] & kept[:i])
+            report.loc[[name for name, keep in zip(names, kept) if not keep], ['kept', 'removed_because']] = \
+                [False, 'redundancy']
+
+    passthrough = pd.DataFrame({'variance': np.nan, 'target_correlation': np.nan, 'kept': True, 'removed_because': ''},
+                               index=pd.Index(store.passthrough.columns, name='feature'))
+    report = pd.concat([report, passthrough])
+    removed = report.index[~report['kept']]
+    if len(removed) > 0:
+        log.warning(f'Feature screening removed {len(removed)}/{report.shape[0]} generated columns.')
+        log.debug("Feature screening removed the following columns: " + str(list(removed)))
+    return report
@@ -21,7 +21,7 @@ warnings.filterwarnings(action="ignore", module="scipy",
 
 log = logging.getLogger('mastml')
 
-def sample_learning_curve(X, y, estimator, cv, scoring, Xgroups=None):
+def sample_learning_curve(X, y, estimator, cv, scoring, Xgroups=None, n_jobs=None, incremental=False):
     """
     Method that calculates data used to plot a sample learning curve, e.g. the RMSE of a cross-validation routine using a
     specified model and a given fraction of the total training data
@@ -39,6 +39,14 @@ def sample_learning_curve(X, y, estimator, cv, scoring, Xgroups=None):
 
         Xgroups: (list), list of row indices corresponding to each group
 
+        n_jobs: (int), number of processes used to fit the training data fractions and cv folds in parallel. None runs
+        serially, -1 uses all processors
+
+        incremental: (bool), whether to grow the training data of each cv fold incrementally with partial_fit instead of
+        refitting from scratch for every fraction. Only used for estimators with partial_fit (e.g. SGDRegressor,
+        MLPRegressor), which see each new chunk of training data once, so their curve differs from that of full refits.
+        Other estimators, including tree ensembles, are refit as usual
+
     Returns:
         train_sizes: (numpy array), array of fractions of training data used in learning curve
 
@@ -58,8 +66,18 @@ def sample_learning_curve(X, y, estimator, cv, scoring, Xgroups=None):
     else:
         Xgroups = np.zeros(len(y))
 
-    train_sizes, train_scores, valid_scores = learning_curve(estimator=estimator, X=X, y=y, train_sizes=train_sizes,
-                                                             scoring=scoring, cv=cv, groups=Xgroups)
+    if incremental and hasattr(estimator, 'partial_fit'):
+        train_sizes, train_scores, valid_scores = learning_curve(estimator=estimator, X=X, y=y, train_sizes=train_sizes,
+                                                                 scoring=scoring, cv=cv, groups=Xgroups, n_jobs=n_jobs,
+                                                                 exploit_incremental_learning=True)
+    else:
+        if incremental:
+            # warm_start is not used instead: tree ensembles would add trees fit on the larger data to those fit on the
+            # smaller one, and other models would only start from the previous solution, which saves little
+            log.warning(f"{estimator.__class__.__name__} does not support partial_fit, so the sample learning curve is "
+                        f"refit from scratch for every training data fraction")
+        train_sizes, train_scores, valid_scores = learning_curve(estimator=estimator, X=X, y=y, train_sizes=train_sizes,
+                                                                 scoring=scoring, cv=cv, groups=Xgroups, n_jobs=n_jobs)
     train_mean = np.mean(train_scores, axis=1)
     test_mean = np.mean(valid_scores, axis=1)
     train_stdev = np.std(train_scores, axis=1)
@@ -67,7 +85,8 @@ def sample_learning_curve(X, y, estimator, cv, scoring, Xgroups=None):
 
     return train_sizes, train_mean, test_mean, train_stdev, test_stdev
 
-def feature_learning_curve(X, y, estimator, cv, scoring, selector_name, savepath, n_features_to_select=None, Xgroups=None):
+def feature_learning_curve(X, y, estimator, cv, scoring, selector_name, savepath, n_features_to_select=None, Xgroups=None,
+                           selection_cache=None):
     """
     Method that calculates data used to plot a feature learning curve, e.g. the RMSE of a cross-validation routine using a
     specified model and a given number of features
@@ -89,6 +108,9 @@ def feature_learning_curve(X, y, estimator, cv, scoring, selector_name, savepath
 
         Xgroups: (list), list of row indices corresponding to each group
 
+        selection_cache: (SelectionCache), cache to look up the feature sets of each number of features in and store
+        them to. If None, the feature selection is always run
+
     Returns:
         train_sizes: (numpy array), array of fractions of training data used in learning curve
 
@@ -110,50 +132,39 @@ def feature_learning_curve(X, y, estimator, cv, scoring, selector_name, savepath
     test_mean = list()
     test_stdev = list()
     if not n_features_to_select:
-        n_features_to_select = X.shape[1].tolist()
+        n_features_to_select = X.shape[1]
     train_sizes = range(n_features_to_select)
     train_sizes = [1+f for f in train_sizes]
-    features_selected = list()
-    n_features = list()
-    for feature in train_sizes:
-        n_features.append(feature)
-        if selector_name == 'RFE':
-            log.warning("Using RFE as feature selector does not support a custom CV or grouping scheme. Your learning"
-                        "curve will be generated properly, but will not use the custom CV or grouping scheme")
-            try:
-                Xnew = fs.name_to_constructor[selector_name](estimator, feature).fit(X, y).transform(X)
-            except RuntimeError:
-                log.error("You have specified an estimator for RFE that does not have a coef_ or feature_importances_ attribute. "
-                          "Acceptable models to use with RFE include: LinearRegression, Lasso, SVR, DecisionTreeRegressor, "
-                          "RandomForestRegressor, ExtraTreesRegressor, AdaBoostRegressor, etc.")
-        elif selector_name == 'SelectKBest':
-            log.warning("Using SelectKBest as feature selector does not support a custom estimator model, CV or grouping scheme. "
-                        "Your learning curve will be generated properly, but will not use the custom model, CV or grouping scheme")
-            Xnew = fs.name_to_constructor[selector_name](f_regression, feature).fit(X, y).transform(X)
-        elif selector_name == 'MASTMLFeatureSelector':
-            Xnew = fs.name_to_constructor[selector_name](estimator, feature, cv).fit(X, y, pd.DataFrame(Xgroups)).transform(X)
-        elif selector_name == 'SequentialFeatureSelector':
-            log.warning("Using SequentialFeatureSelector as feature selector does not support a custom CV or grouping scheme. "
-                        "Your learning curve will be generated properly, but will not use the custom CV or grouping scheme")
-            Xnew = fs.name_to_constructor[selector_name](estimator, feature).fit(pd.DataFrame(X), pd.DataFrame(y)).transform(X)
-        elif selector_name == None:
-            log.warning("A selector name for learning curve calculation was not found. Defaulting to using the "
-                        "MASTMLFeatureSelector for learning curve")
-            Xnew = fs.name_to_constructor["MASTMLFeatureSelector"](estimator, feature, cv).fit(X, y, pd.DataFrame(Xgroups)).transform(X)
-        else:
-            log.error("You have specified an invalid selector_name for learning curve. Either leave blank to use the default"
-                      " MASTMLFeatureSelector or use one of SelectKBest, RFE, SequentialFeatureSelector, MASTMLFeatureSelector")
-            exit()
-        # Need to use arrays to avoid indexing issues when leaving out validation data
-        features_selected.append(Xnew.columns.tolist())
-
-        Xnew = np.array(Xnew)
-        y = np.array(y)
-        Xgroups = np.array(Xgroups)
+    # Greedy and ranking based selectors select nested feature sets, so run the selection once for the largest number
+    # of features and read the feature set for every smaller number off its path
+    cached_selection = None
+    if selection_cache is not None:
+        cache_key = selection_cache.make_key(X, y, Xgroups, ('feature_learning_curve', selector_name, estimator, cv,
+                                                             n_features_to_select))
+        cached_selection = selection_cache.get(cache_key)
+    if cached_selection is not None and cached_selection['path'] is not None:
+        log.info("    Reusing cached feature learning curve selection")
+        features_selected = cached_selection['path']
+    else:
+        features_selected = _feature_selection_path(X=X, y=y, estimator=estimator, cv=cv, selector_name=selector_name,
+                                                    n_features_to_select=n_features_to_select, Xgroups=Xgroups,
+                                                    savepath=savepath)
+        if selection_cache is not None:
+            selection_cache.put(cache_key, f'feature_learning_curve_{selector_name}', features_selected[-1],
+                                features_selected)
+    n_features = list(train_sizes)
+
+    # Need to use arrays to avoid indexing issues when leaving out validation data
+    X_values = np.array(X)
+    y = np.array(y)
+    Xgroups = np.array(Xgroups)
+    splits = list(cv.split(X_values, y, Xgroups))
+    for features in features_selected:
+        Xnew = X_values[:, [X.columns.get_loc(feature) for feature in features]]
         cv_number=1
         train_scores = dict()
         test_scores = dict()
-        for trains, tests in cv.split(Xnew, y, Xgroups):
+        for trains, tests in splits:
             model = estimator.fit(Xnew[trains], y[trains])
             train_vals = model.predict(Xnew[trains])
             test_vals = model.predict(Xnew[tests])
@@ -169,3 +180,68 @@ def feature_learning_curve(X, y, estimator, cv, scoring, selector_name, savepath
     pd.DataFrame().from_dict(data=datadict).to_csv(os.path.join(savepath, 'features_selected_in_learning_curve.csv'))
 
     return np.array(train_sizes), np.array(train_mean), np.array(test_mean), np.array(train_stdev), np.array(test_stdev)
+
+def _feature_selection_path(X, y, estimator, cv, selector_name, n_features_to_select, Xgroups, savepath):
+    """
+    Method that runs a feature selector once and returns the features it selects for each number of features, from 1 up
+    to n_features_to_select
+
+    Args:
+        X: (dataframe), dataframe of X data values
+
+        y: (numpy array), array of y data values
+
+        estimator: (scikit-learn model object), a scikit-learn model used for fitting
+
+        cv: (scikit-learn cross validation object), a scikit-learn cross validation object to construct train/test splits
+
+        selector_name: (str), name of a scikit-learn or MAST-ML feature selection routine
+
+        n_features_to_select: (int), total number of features to select
+
+        Xgroups: (numpy array), array of group labels
+
+        savepath: (str), path to save the MASTMLFeatureSelector output to
+
+    Returns:
+        features_selected: (list), list of the lists of feature names selected for 1 to n_features_to_select features
+
+    """
+    columns = X.columns.tolist()
+    train_sizes = range(1, n_features_to_select+1)
+    if selector_name == 'RFE':
+        log.warning("Using RFE as feature selector does not support a custom CV or grouping scheme. Your learning"
+                    "curve will be generated properly, but will not use the custom CV or grouping scheme")
+        try:
+            # Eliminating down to one feature ranks every feature by when it was eliminated
+            ranking = fs.name_to_constructor[selector_name](estimator, n_features_to_select=1).fit(X, y).ranking_
+        except RuntimeError:
+            log.error("You have specified an estimator for RFE that does not have a coef_ or feature_importances_ attribute. "
+                      "Acceptable models to use with RFE include: LinearRegression, Lasso, SVR, DecisionTreeRegressor, "
+                      "RandomForestRegressor, ExtraTreesRegressor, AdaBoostRegressor, etc.")
+            raise
+        return [[col for col, rank in zip(columns, ranking) if rank <= k] for k in train_sizes]
+    elif selector_name == 'SelectKBest':
+        log.warning("Using SelectKBest as feature selector does not support a custom estimator model, CV or grouping scheme. "
+                    "Your learning curve will be generated properly, but will not use the custom model, CV or grouping scheme")
+        scores = fs.name_to_constructor[selector_name](f_regression, k='all').fit(X, y).scores_
+        # Same tie breaking as SelectKBest, which keeps the last k of a stable ascending sort
+        order = np.argsort(scores, kind="mergesort")[::-1]
+        return [[columns[i] for i in sorted(order[:k])] for k in train_sizes]
+    elif selector_name == 'SequentialFeatureSelector':
+        log.warning("Using SequentialFeatureSelector as feature selector does not support a custom CV or grouping scheme. "
+                    "Your learning curve will be generated properly, but will not use the custom CV or grouping scheme")
+        selector = fs.name_to_constructor[selector_name](estimator, n_features_to_select).fit(pd.DataFrame(X), pd.DataFrame(y))
+        return [[columns[i] for i in sorted(selector.subsets_[k]['feature_idx'])] for k in train_sizes]
+    elif selector_name in ['MASTMLFeatureSelector', None]:
+        if selector_name is None:
+            log.warning("A selector name for learning curve calculation was not found. Defaulting to using the "
+                        "MASTMLFeatureSelector for learning curve")
+        selector = fs.name_to_constructor["MASTMLFeatureSelector"](estimator, n_features_to_select, cv,
+                                                                   manually_selected_features=list())
+        selected = selector.fit(X, y, savepath, pd.DataFrame(Xgroups)).selected_feature_names
+        return [selected[:k] for k in train_sizes]
+    else:
+        log.error("You have specified an invalid selector_name for learning curve. Either leave blank to use the default"
+                  " MASTMLFeatureSelector or use one of SelectKBest, RFE, SequentialFeatureSelector, MASTMLFeatureSelector")
+        exit()
@@ -5,6 +5,7 @@ scikit-learn methods. See http://scikit-learn.org/stable/modules/classes.html#mo
 
 from functools import wraps
 
+import numpy as np
 import pandas as pd
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.preprocessing import MinMaxScaler, Binarizer, StandardScaler, MaxAbsScaler, Normalizer, \
@@ -33,8 +34,10 @@ def dataframify(transform):
 
     @wraps(transform)
     def new_transform(self, df):
-        arr = transform(self, df.values)
-        return pd.DataFrame(arr, columns=df.columns, index=df.index)
+        # The values are passed without a copy of their own, the transform makes the only copy of the data (unless the
+        # normalizer was constructed with copy=False), and the result is wrapped without copying it again
+        arr = transform(self, df.to_numpy())
+        return pd.DataFrame(arr, columns=df.columns, index=df.index, copy=False)
     return new_transform
 
 class MeanStdevScaler(BaseEstimator, TransformerMixin):
@@ -94,6 +97,16 @@ class MeanStdevScaler(BaseEstimator, TransformerMixin):
         return self
 
     def transform(self, df):
+        if list(df.columns) == list(self.features):
+            # Every column is normalized, so scale one copy of the data in place and skip the drop/concat round-trip
+            array = df.to_numpy(copy=True)
+            if not np.issubdtype(array.dtype, np.floating):
+                array = array.astype(float)
+            array -= self.old_mean
+            array /= self.old_stdev
+            array *= self.stdev
+            array += self.mean
+            return pd.DataFrame(array, columns=df.columns, index=df.index, copy=False)
         array = df[self.features].values
         array = ((array - self.old_mean) / self.old_stdev) * self.stdev + self.mean
         same = df.drop(columns=self.features)
@@ -9,19 +9,21 @@ from functools import wraps
 import warnings
 import numpy as np
 from mastml.metrics import root_mean_squared_error
+from mastml.feature_screening import standardize_columns
 
 import pandas as pd
+from joblib import Parallel, delayed
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.decomposition import PCA
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.kernel_ridge import KernelRidge
 import sklearn.feature_selection as fs
+from scipy.linalg import solve_triangular
 from mlxtend.feature_selection import SequentialFeatureSelector
-import os, logging
+import os, logging, time
 
 ## XIYU's import for PearsonSelector
-import copy
-from numpy import cov
 import xlsxwriter
-from scipy.stats import pearsonr
 ##
 
 log = logging.getLogger('mastml')
@@ -68,8 +70,14 @@ def dataframify_new_column_names(transform, name):
 
     def new_transform(self, df):
         arr = transform(self, df.values)
-        labels = [name+str(i) for i in range(arr.shape[1])]
-        return pd.DataFrame(arr, columns=labels)
+        # Selectors that pick a subset of the columns (e.g. SequentialFeatureSelector) keep the indices of the chosen
+        # features, so the original names can be used directly
+        feature_idx = getattr(self, 'k_feature_idx_', None)
+        if feature_idx is not None and len(feature_idx) == arr.shape[1]:
+            labels = [df.columns[i] for i in feature_idx]
+        else:
+            labels = [name+str(i) for i in range(arr.shape[1])]
+        return pd.DataFrame(arr, columns=labels, index=df.index)
     return new_transform
 
 def fitify_just_use_values(fit):
@@ -147,11 +155,58 @@ class EnsembleModelFeatureSelector(object):
         return df
 
 class PearsonSelector(object):
-    def __init__(self, threshold_between_features, threshold_with_target, remove_highly_correlated_features, k_features):
+    """
+    Class custom-written for MAST-ML to select the features with the highest Pearson correlation to the target, optionally
+    after removing features that are highly correlated with each other
+
+    Args:
+
+        threshold_between_features: (float), absolute Pearson correlation above which two features are considered
+        highly correlated
+
+        threshold_with_target: (float), absolute Pearson correlation with the target above which features are selected
+
+        remove_highly_correlated_features: (bool), whether to remove features highly correlated with an earlier feature
+
+        k_features: (int), the number of features to select
+
+        block_size: (int), number of columns of the correlation matrix computed at a time. None computes the full matrix
+        at once and saves it to Full_correlation_matrix.xlsx; set it to bound memory for very wide feature sets
+
+    Methods:
+
+        fit: performs feature selection
+
+            Args:
+
+                X: (dataframe), dataframe of X features
+
+                savepath: (str), path to save the correlation spreadsheets to
+
+                y: (dataframe), dataframe of y data
+
+            Returns:
+
+                None
+
+        transform: performs the transform to generate output of only selected features
+
+            Args:
+
+                X: (dataframe), dataframe of X features
+
+            Returns:
+
+                dataframe: (dataframe), dataframe of selected X features
+
+    """
+    def __init__(self, threshold_between_features, threshold_with_target, remove_highly_correlated_features, k_features,
+                 block_size=None):
         self.threshold_between_features = threshold_between_features
         self.threshold_with_target = threshold_with_target
         self.remove_highly_correlated_features = remove_highly_correlated_features
         self.k_features = k_features
+        self.block_size = block_size
         self.selected_features = list()
 
     def fit(self, X, savepath, y=None, Xgroups=None):
@@ -159,88 +214,62 @@ class PearsonSelector(object):
         df_features = df.columns.tolist()
         n_col = df.shape[1]
 
-        if self.remove_highly_correlated_features == True:
-            array_data = list()
-
-            for i in range(n_col):
-                col_data = df.iloc[:, i]
-                col = list()
-                for j in range(n_col):
-                    row_data = df.iloc[:, j]
-                    corr, _ = pearsonr(row_data, col_data)  # Pearson Correlation
-                    col.append(corr)
-                array_data.append(col)
-
-            array_df = pd.DataFrame(array_data, index=df_features[:n_col], columns=df_features[:n_col])
+        # Standardize every column once so all correlations are plain matrix products
+        standardized = standardize_columns(df.to_numpy(dtype=np.float64))
 
-            array_df.to_excel(os.path.join(savepath, 'Full_correlation_matrix.xlsx'))
-
-            #### Print features highly-correlated to each other into excel
+        if self.remove_highly_correlated_features == True:
+            block_size = n_col if self.block_size is None else int(self.block_size)
+            threshold = np.float64(self.threshold_between_features)
             hcorr = dict()
-            highly_correlated_features = list()
-            for i in range(len(array_df.iloc[0, :])):  # This includes all the data in the array_df
-                # feature1 = array_df.iloc[:, i] # This does not work because feature1 is not the col name but a list of values
-                feature1 = array_df.columns[i]
-                for j in range(len(array_df.iloc[0, :])):  # This includes all the data in the array_df
-                    # feature2 = array_df.iloc[:, j] # This does not work because feature2 is not the col name but a list of values
-                    feature2 = array_df.columns[j]
-                    if abs(array_df.iloc[i - 1, j - 1]) >= np.float64(self.threshold_between_features):
-                        if i != j:  # Ignore diagonal features
-                            if not (feature2, feature1) in hcorr:  # Ignore the same correlations
-                                hcorr[(feature1, feature2)] = array_df.iloc[i - 1, j - 1]
-                                highly_correlated_features.append(feature2)
+            highly_correlated = np.zeros(n_col, dtype=bool)
+            for start in range(0, n_col, block_size):
+                stop = min(start + block_size, n_col)
+                # Rows start:stop of the correlation matrix, only for the columns from start onward
+                corr_block = standardized[:, start:stop].T @ standardized[:, start:]
+                if self.block_size is None:
+                    array_df = pd.DataFrame(corr_block, index=df_features, columns=df_features)
+                    array_df.to_excel(os.path.join(savepath, 'Full_correlation_matrix.xlsx'))
+                # Each pair is counted once from the upper triangle, and the later feature of the pair is flagged
+                rows, cols = np.nonzero(np.triu(np.abs(corr_block) >= threshold, k=1))
+                for i, j in zip(rows, cols):
+                    hcorr[(df_features[start + i], df_features[start + j])] = corr_block[i, j]
+                highly_correlated[start + cols] = True
+            if self.block_size is not None:
+                log.info('PearsonSelector block_size is set, so Full_correlation_matrix.xlsx is not saved')
 
+            #### Print features highly-correlated to each other into excel
             hcorr_df = pd.DataFrame(hcorr, index=["Corr"])
             hcorr_df.to_excel(os.path.join(savepath, 'Highly_correlated_features.xlsx'))
 
-            highly_correlated_features = list(np.unique(np.array(highly_correlated_features)))
-
-            #### Print the removed features and the new smaller dataframe with features removed
-            # Deep copy the original dataframe
-            removed_features_df = copy.deepcopy(X)
-            new_df = copy.deepcopy(X)
-
-            # Drop the features that can be removed
-            all_features = list(new_df.columns)
-            removed_features = list()
-            for feature in all_features:
-                if feature not in highly_correlated_features:
-                    removed_features.append(feature)
-                    new_df = new_df.drop(columns=feature)
-
-            # Print the highly correlated features that were removed
-            for feature in all_features:
-                if feature not in removed_features:
-                    removed_features_df = removed_features_df.drop(columns=feature)
-            removed_features_df.to_excel(os.path.join(savepath, "Highly_correlated_features_removed.xlsx"),
-                                         index=False)
-
-            # Define self.selected_features
-            remaining_features = list(new_df.columns)
+            #### Print the removed features and define the remaining features
+            removed_features = [feature for feature, flagged in zip(df_features, highly_correlated) if flagged]
+            X[removed_features].to_excel(os.path.join(savepath, "Highly_correlated_features_removed.xlsx"), index=False)
+            remaining_features = [feature for feature, flagged in zip(df_features, highly_correlated) if not flagged]
         else:
             remaining_features = list(df.columns)
 
-        # Compute Pearson correlations between each feature and target feature
-        all_corrs = {}
-        for i in range(len(remaining_features)):
-            feature_name = df.columns[i]
-            feature_data = df.iloc[:, i]
-            corr, _ = pearsonr(y, feature_data)
-            all_corrs[feature_name] = corr
-        all_corrs = abs(pd.Series(all_corrs))
+        # Compute Pearson correlations between each remaining feature and target feature in one product
+        standardized_y = standardize_columns(np.asarray(y, dtype=np.float64).reshape(-1, 1))
+        remaining_columns = [df.columns.get_loc(feature) for feature in remaining_features]
+        target_corrs = (standardized[:, remaining_columns].T @ standardized_y).ravel()
+        all_corrs = abs(pd.Series(target_corrs, index=remaining_features))
+        # Features without a finite correlation to the target (e.g. constant columns) can't be ranked, so they are never
+        # selected
+        all_corrs = all_corrs[np.isfinite(all_corrs)]
+        n_col = len(all_corrs)
 
         self.selected_features = list(all_corrs[all_corrs > self.threshold_with_target].sort_values(
                                                 ascending=False).keys())
 
         # Sometimes the specificed threshold is too high. Make it lower until at least 1 feature is selected
         while len(self.selected_features) < self.k_features:
+            if len(self.selected_features) == n_col or self.threshold_with_target < 0:
+                log.debug('WARNING: Pearson selector reduce the threshold such that all features were included')
+                break
             log.debug('WARNING: Pearson selector threshold was too high to result in selecting any features, lowering threshold to get specified feature number')
             self.threshold_with_target -= 0.05
             self.selected_features = list(all_corrs[all_corrs > self.threshold_with_target].sort_values(
                 ascending=False).keys())
-            if len(self.selected_features) == n_col:
-                log.debug('WARNING: Pearson selector reduce the threshold such that all features were included')
-                break
             log.debug('Pearson selector selected features with an adjusted threshold value')
         if len(self.selected_features) > self.k_features:
             self.selected_features = list(all_corrs[all_corrs > self.threshold_with_target].sort_values(ascending=False).keys())[:self.k_features]
@@ -293,6 +322,17 @@ class MASTMLFeatureSelector(object):
         manually_selected_features: (list), a list of features manually set by the user. The feature selector will first
         start from this list of features and sequentially add features until n_features_to_select is met.
 
+        n_jobs: (int), number of processes used to fit the candidate features and cv folds in parallel. None or 1 runs
+        serially, -1 uses all processors
+
+        patience: (int), stop once this many features in a row have not improved the best avg RMSE by more than
+        min_improvement. The selected features are then the ones up to the best avg RMSE. None disables early stopping
+
+        min_improvement: (float), decrease in avg RMSE a new feature needs to count as an improvement when patience is set
+
+        max_time: (float), wall-clock budget in seconds. No new features are added once it is exceeded. None means no
+        budget
+
     Methods:
 
         fit: performs feature selection
@@ -321,12 +361,18 @@ class MASTMLFeatureSelector(object):
 
     """
 
-    def __init__(self, estimator, n_features_to_select, cv, manually_selected_features=list()):
+    def __init__(self, estimator, n_features_to_select, cv, manually_selected_features=list(), n_jobs=None,
+                 patience=None, min_improvement=0.0, max_time=None):
         self.estimator = estimator
         self.n_features_to_select = n_features_to_select
         self.cv = cv
         self.manually_selected_features = manually_selected_features
-        self.selected_feature_names = self.manually_selected_features
+        # Copy, so selecting features doesn't grow the (shared default) manually selected list
+        self.selected_feature_names = list(self.manually_selected_features)
+        self.n_jobs = n_jobs
+        self.patience = patience
+        self.min_improvement = min_improvement
+        self.max_time = max_time
 
     def fit(self, X, y, savepath, Xgroups=None):
         if Xgroups.shape[0] == 0:
@@ -340,6 +386,13 @@ class MASTMLFeatureSelector(object):
         x_features = X.columns.tolist()
         if self.n_features_to_select >= len(x_features):
             self.n_features_to_select = len(x_features)
+        start_time = time.time()
+        best_avg_rmse = np.inf
+        best_num_features_selected = 0
+        stopped_because = 'n_features_to_select reached'
+        X_values = X.to_numpy()
+        y_values = np.array(y).reshape(-1, 1)
+        folds = self._make_folds(X=X_values, y=y_values, groups=Xgroups)
         while num_features_selected < self.n_features_to_select:
             log.info('On number of features selected')
             log.info(str(num_features_selected))
@@ -347,7 +400,7 @@ class MASTMLFeatureSelector(object):
             # Catch pandas warnings here
             with warnings.catch_warnings():
                 warnings.simplefilter('ignore')
-                ranked_features = self._rank_features(X=X, y=y, groups=Xgroups)
+                ranked_features = self._rank_features(X=X, X_values=X_values, y_values=y_values, folds=folds)
                 top_feature_name, top_feature_avg_rmse, top_feature_std_rmse = self._choose_top_feature(ranked_features=ranked_features)
 
             self.selected_feature_names.append(top_feature_name)
@@ -369,12 +422,38 @@ class MASTMLFeatureSelector(object):
             # Save for every loop of selecting features
             pd.DataFrame(basic_forward_selection_dict).to_csv(os.path.join(savepath,'MASTMLFeatureSelector_data_feature_'+str(num_features_selected)+'.csv'))
             num_features_selected += 1
-        basic_forward_selection_dict[str(self.n_features_to_select - 1)][
+
+            # Early stopping
+            if best_avg_rmse - top_feature_avg_rmse > self.min_improvement:
+                best_avg_rmse = top_feature_avg_rmse
+                best_num_features_selected = num_features_selected
+            if self.patience is not None and num_features_selected - best_num_features_selected >= self.patience:
+                stopped_because = f'no improvement in the last {self.patience} features'
+                break
+            if self.max_time is not None and time.time() - start_time > self.max_time:
+                stopped_because = f'max_time of {self.max_time} seconds exceeded'
+                break
+
+        if self.patience is not None and best_num_features_selected < num_features_selected:
+            # Drop the features added after the best avg RMSE, they didn't help
+            n_dropped = num_features_selected - best_num_features_selected
+            self.selected_feature_names = self.selected_feature_names[:len(self.selected_feature_names) - n_dropped]
+            selected_feature_avg_rmses = selected_feature_avg_rmses[:best_num_features_selected]
+            selected_feature_std_rmses = selected_feature_std_rmses[:best_num_features_selected]
+        if num_features_selected < self.n_features_to_select:
+            log.info(f'Stopped forward selection after {num_features_selected} features: {stopped_because}. '
+                     f'Selected features: {self.selected_feature_names}')
+        basic_forward_selection_dict[str(num_features_selected - 1)][
             'Full feature set Names'] = self.selected_feature_names
-        basic_forward_selection_dict[str(self.n_features_to_select - 1)][
+        basic_forward_selection_dict[str(num_features_selected - 1)][
             'Full feature set Avg RMSEs'] = selected_feature_avg_rmses
-        basic_forward_selection_dict[str(self.n_features_to_select - 1)][
+        basic_forward_selection_dict[str(num_features_selected - 1)][
             'Full feature set Stdev RMSEs'] = selected_feature_std_rmses
+        basic_forward_selection_dict[str(num_features_selected - 1)][
+            'Stopped because'] = stopped_because
+        pd.DataFrame(basic_forward_selection_dict).to_csv(os.path.join(savepath,'MASTMLFeatureSelector_data_feature_'+str(num_features_selected - 1)+'.csv'))
+        self.selected_feature_avg_rmses = selected_feature_avg_rmses
+        self.selected_feature_std_rmses = selected_feature_std_rmses
         #self._plot_featureselected_learningcurve(selected_feature_avg_rmses=selected_feature_avg_rmses,
         #                                         selected_feature_std_rmses=selected_feature_std_rmses)
 
@@ -384,27 +463,41 @@ class MASTMLFeatureSelector(object):
         dataframe = self._get_featureselected_dataframe(X=X, selected_feature_names=self.selected_feature_names)
         return dataframe
 
-    def _rank_features(self, X, y, groups):
-        y = np.array(y).reshape(-1, 1)
-        ranked_features = dict()
-        trains_metrics = list()
-        tests_metrics = list()
+    def _make_folds(self, X, y, groups):
+        # The cv splits only depend on the rows, so split once and keep the train and test indices of every fold for all
+        # the ranking passes. Only the indices are kept, the fold data is sliced from X when it is used
         if groups is not None:
             groups = groups.iloc[:,0].tolist()
-        for col in X.columns:
-            if col not in self.selected_feature_names:
-                X_ = X.loc[:, self.selected_feature_names]
-                X__ = X.loc[:, col]
-                X_ = np.array(pd.concat([X_, X__], axis=1))
-
-                for trains, tests in self.cv.split(X_, y, groups):
-                    self.estimator.fit(X_[trains], y[trains])
-                    predict_tests = self.estimator.predict(X_[tests])
-                    tests_metrics.append(root_mean_squared_error(y[tests], predict_tests))
-                avg_rmse = np.mean(tests_metrics)
-
-                std_rmse = np.std(tests_metrics)
-                ranked_features[col] = {"avg_rmse": avg_rmse, "std_rmse": std_rmse}
+        return list(self.cv.split(X, y, groups))
+
+    def _rank_features(self, X, X_values, y_values, folds):
+        ranked_features = dict()
+        selected_columns = [X.columns.get_loc(name) for name in self.selected_feature_names]
+        candidates = [col for col in X.columns if col not in self.selected_feature_names]
+        candidate_columns = [X.columns.get_loc(col) for col in candidates]
+        linear_params = _linear_least_squares_params(self.estimator)
+        if linear_params is not None:
+            # Linear models can score every candidate from one factorization of the selected features per fold
+            alpha, fit_intercept = linear_params
+            rmses = _score_candidates_linear(X_values, y_values, folds, selected_columns, candidate_columns, alpha,
+                                             fit_intercept)
+            # Refit the few candidate/fold pairs the factor update can't solve, e.g. columns collinear with the selected ones
+            unsolved = list(zip(*np.where(np.isnan(rmses))))
+            refit_rmses = Parallel(n_jobs=self.n_jobs, max_nbytes='1M')(
+                delayed(_fit_and_score_fold)(self.estimator, X_values, y_values, *folds[fold],
+                                             selected_columns + [candidate_columns[i]])
+                for i, fold in unsolved)
+            for (i, fold), rmse in zip(unsolved, refit_rmses):
+                rmses[i, fold] = rmse
+        else:
+            # joblib memmaps the data for the worker processes instead of pickling it for every task. Results come back
+            # in submission order, so the ranking is the same regardless of n_jobs
+            rmses = Parallel(n_jobs=self.n_jobs, max_nbytes='1M')(
+                delayed(_fit_and_score_fold)(self.estimator, X_values, y_values, *fold, selected_columns + [column])
+                for column in candidate_columns for fold in folds)
+            rmses = np.array(rmses).reshape(len(candidates), len(folds))
+        for col, tests_metrics in zip(candidates, rmses):
+            ranked_features[col] = {"avg_rmse": np.mean(tests_metrics), "std_rmse": np.std(tests_metrics)}
         return ranked_features
 
     def _choose_top_feature(self, ranked_features):
@@ -442,6 +535,128 @@ class MASTMLFeatureSelector(object):
         return X_selected
 
 
+def _fit_and_score_fold(estimator, X, y, trains, tests, columns):
+    """
+    Method that fits an estimator on a subset of feature columns of one cv fold and scores it on the fold's test data.
+    Kept at module level so it can be sent to worker processes by MASTMLFeatureSelector
+
+    Args:
+
+        estimator: (scikit-learn model/estimator object), a scikit-learn model/estimator
+
+        X: (numpy array), array of all X features
+
+        y: (numpy array), array of y data
+
+        trains: (numpy array), row indices of the train fold
+
+        tests: (numpy array), row indices of the test fold
+
+        columns: (list), positions of the feature columns to fit on
+
+    Returns:
+
+        (float), root mean squared error on the test fold
+
+    """
+    estimator.fit(X[np.ix_(trains, columns)], y[trains])
+    predict_tests = estimator.predict(X[np.ix_(tests, columns)])
+    return root_mean_squared_error(y[tests], predict_tests)
+
+def _linear_least_squares_params(estimator):
+    """
+    Method that checks whether an estimator is a plain least squares model that MASTMLFeatureSelector can score with
+    incremental factor updates instead of refitting
+
+    Args:
+
+        estimator: (scikit-learn model/estimator object), a scikit-learn model/estimator
+
+    Returns:
+
+        (tuple), the ridge penalty alpha (0 for ordinary least squares) and whether an intercept is fit, or None if the
+        estimator isn't supported
+
+    """
+    if getattr(estimator, 'positive', False) is True or getattr(estimator, 'normalize', False) is True:
+        return None
+    if type(estimator) is LinearRegression:
+        return 0.0, estimator.fit_intercept
+    if type(estimator) is Ridge and np.ndim(estimator.alpha) == 0:
+        return float(estimator.alpha), estimator.fit_intercept
+    if type(estimator) is KernelRidge and estimator.kernel == 'linear' and np.ndim(estimator.alpha) == 0:
+        # A linear kernel ridge model is ridge regression without an intercept
+        return float(estimator.alpha), False
+    return None
+
+def _score_candidates_linear(X, y, folds, selected_columns, candidate_columns, alpha, fit_intercept):
+    """
+    Method that scores adding each candidate column to the selected columns for a (ridge) least squares model on every
+    cv fold. The Cholesky factor of the selected columns' normal equations is computed once per fold, and each candidate
+    is solved as a rank-one extension of it, giving the same fits as refitting the model on every candidate
+
+    Args:
+
+        X: (numpy array), array of all X features
+
+        y: (numpy array), array of y data
+
+        folds: (list), list of (train indices, test indices) tuples of the cv folds
+
+        selected_columns: (list), positions of the already selected feature columns
+
+        candidate_columns: (list), positions of the candidate feature columns
+
+        alpha: (float), ridge penalty, 0 for ordinary least squares
+
+        fit_intercept: (bool), whether the model fits an intercept
+
+    Returns:
+
+        rmses: (numpy array), test root mean squared error of each candidate (rows) on each fold (columns). Entries are
+        NaN where the extended normal equations are singular and the model has to be refit instead
+
+    """
+    n_selected = len(selected_columns)
+    rmses = np.full((len(candidate_columns), len(folds)), np.nan)
+    for fold, (trains, tests) in enumerate(folds):
+        X_train, X_test = np.asarray(X[trains], dtype=np.float64), np.asarray(X[tests], dtype=np.float64)
+        y_train, y_test = np.asarray(y[trains], dtype=np.float64).ravel(), np.asarray(y[tests], dtype=np.float64).ravel()
+        y_mean = 0.0
+        if fit_intercept:
+            X_mean = X_train.mean(axis=0)
+            y_mean = y_train.mean()
+            X_train = X_train - X_mean
+            X_test = X_test - X_mean
+            y_train = y_train - y_mean
+        selected, candidates = X_train[:, selected_columns], X_train[:, candidate_columns]
+        selected_test, candidates_test = X_test[:, selected_columns], X_test[:, candidate_columns]
+        candidate_norms = np.einsum('ij,ij->j', candidates, candidates) + alpha
+        candidate_y = candidates.T @ y_train
+        if n_selected > 0:
+            try:
+                L = np.linalg.cholesky(selected.T @ selected + alpha * np.eye(n_selected))
+            except np.linalg.LinAlgError:
+                continue
+            # Z holds the new off-diagonal row of the extended factor for every candidate
+            Z = solve_triangular(L, selected.T @ candidates, lower=True)
+            z = solve_triangular(L, selected.T @ y_train, lower=True)
+            selected_coef = solve_triangular(L.T, z, lower=False)
+            base_pred = selected_test @ selected_coef
+            candidates_test = candidates_test - selected_test @ solve_triangular(L.T, Z, lower=False)
+            pivots = candidate_norms - np.einsum('ij,ij->j', Z, Z)
+            numerators = candidate_y - Z.T @ z
+        else:
+            base_pred = np.zeros(len(y_test))
+            pivots = candidate_norms
+            numerators = candidate_y
+        solvable = pivots > 1e-10 * candidate_norms
+        candidate_coef = np.divide(numerators, pivots, out=np.zeros_like(pivots), where=solvable)
+        predict_tests = y_mean + base_pred[:, np.newaxis] + candidates_test * candidate_coef
+        fold_rmses = np.sqrt(np.mean((y_test[:, np.newaxis] - predict_tests) ** 2, axis=0))
+        rmses[solvable, fold] = fold_rmses[solvable]
+    return rmses
+
 # Include Principal Component Analysis
 PCA.transform = dataframify_new_column_names(PCA.transform, 'pca_')
 
@@ -1,11 +1,17 @@
 import sklearn.model_selection as ms
-from sklearn.model_selection import RandomizedSearchCV, GridSearchCV
-from skopt import BayesSearchCV
+from sklearn.model_selection import RandomizedSearchCV, GridSearchCV, ParameterGrid, ParameterSampler
+from sklearn.base import clone
+from sklearn.metrics import check_scoring
+import joblib
+from joblib import Parallel, delayed
+from skopt import Optimizer
 from skopt.space import Real, Categorical, Integer
 import scipy.stats
 import pandas as pd
 import numpy as np
 import os
+import shutil
+import tempfile
 from mastml import utils
 import logging
 
@@ -61,7 +67,47 @@ class HyperOptUtils():
 
                 param_dict (dict) : dict of {param_name : param_value} pairs.
 
+        _search_data : returns the data and cv the search is run on. With memmap, X and y are dumped once to memory
+        mapped files, which joblib passes to the workers by reference instead of pickling a copy of the data for each
+        task, and the cv folds are generated once as index arrays
+
+            Args:
+
+                X (np array) : array of X data
+
+                y (np array) : array of y data
+
+            Returns:
+
+                X_search (np array) : X data, memory mapped with memmap
+
+                y_search (np array) : y data, memory mapped with memmap
+
+                cv (sklearn cross-validator object or list) : the cv, or a list of (train, test) index arrays with memmap
+
+        _release_search_data : deletes the memory mapped files of _search_data
+
+        _fit_with_pruning : cross validates candidates fold by fold, and abandons a candidate once its mean score over
+        the folds evaluated so far is below the prune_percentile percentile of the other candidates at the same fold
+
+            Args:
+
+                X (np array) : array of X data
+
+                y (np array) : array of y data
+
+                cv (sklearn cross-validator object or list) : the cv from _search_data
+
+                candidates (list) : list of dicts of {param_name : param_value} pairs to evaluate
+
+            Returns:
+
+                None, sets cv_results_ and best_params_
+
     """
+    # Columns of cv_results_ written to the output csv, when the search reports them
+    _output_columns = ['mean_test_score', 'std_test_score', 'n_folds', 'pruned']
+
     def __init__(self, param_names, param_values):
         self.param_names = param_names
         self.param_values = param_values
@@ -85,7 +131,7 @@ class HyperOptUtils():
     def _save_output(self, savepath, data):
         for key in data:
             d = data[key]
-            c = dict((k, d.cv_results_[k]) for k in ('mean_test_score', 'std_test_score'))
+            c = dict((k, d.cv_results_[k]) for k in self._output_columns if k in d.cv_results_)
                      # Bayesian search does not report test scores and will error out
                      #('mean_test_score', 'std_test_score', 'mean_train_score', 'std_train_score'))
             out = pd.DataFrame(c, d.cv_results_['params'])
@@ -95,6 +141,56 @@ class HyperOptUtils():
             with open(savepath, 'a') as f:
                 best.to_csv(f)
 
+    def _search_data(self, X, y):
+        if not self.memmap:
+            return X, y, self.cv
+        self._memmap_folder = tempfile.mkdtemp(prefix='mastml_hyperopt_')
+        arrays = list()
+        for name, data in [('X', X), ('y', y)]:
+            filename = os.path.join(self._memmap_folder, name + '.pkl')
+            joblib.dump(np.ascontiguousarray(data), filename)
+            arrays.append(joblib.load(filename, mmap_mode='r'))
+        return arrays[0], arrays[1], list(self.cv.split(arrays[0], arrays[1]))
+
+    def _release_search_data(self):
+        if getattr(self, '_memmap_folder', None) is not None:
+            shutil.rmtree(self._memmap_folder, ignore_errors=True)
+            self._memmap_folder = None
+
+    def _fit_with_pruning(self, X, y, cv, candidates):
+        X_array = np.asarray(X)
+        y_array = np.asarray(y)
+        splits = list(ms.check_cv(cv).split(X_array, y_array))
+        scorer = check_scoring(self.estimator, scoring=self.scoring)
+
+        # Candidates are evaluated in batches of one per process, each compared to the candidates of earlier batches
+        batch_size = max(1, joblib.effective_n_jobs(self.n_jobs))
+        running_means = list()
+        results = list()
+        for start in range(0, len(candidates), batch_size):
+            reference = list()
+            for fold in range(len(splits)):
+                reached = [means[fold] for means in running_means if len(means) > fold]
+                reference.append(np.array(reached) if len(reached) >= self.prune_min_trials else None)
+            batch = Parallel(n_jobs=self.n_jobs)(
+                delayed(_fit_and_score_pruned)(self.estimator, params, X_array, y_array, splits, scorer, reference,
+                                               self.prune_percentile, self.prune_min_folds)
+                for params in candidates[start:start + batch_size])
+            for fold_scores, pruned in batch:
+                running_means.append(np.cumsum(fold_scores) / np.arange(1, len(fold_scores) + 1))
+                results.append((np.mean(fold_scores), np.std(fold_scores), len(fold_scores), pruned))
+        n_pruned = sum(result[3] for result in results)
+        log.info(f"    {self._estimator_name} hyperparameter search pruned {n_pruned}/{len(candidates)} candidates")
+
+        self.cv_results_ = {'params': candidates,
+                            'mean_test_score': np.array([result[0] for result in results]),
+                            'std_test_score': np.array([result[1] for result in results]),
+                            'n_folds': np.array([result[2] for result in results]),
+                            'pruned': np.array([result[3] for result in results])}
+        # Candidates that ran all folds are always ranked above pruned ones
+        best = max(range(len(candidates)), key=lambda i: (not results[i][3], results[i][0]))
+        self.best_params_ = candidates[best]
+
     def _get_grid_param_dict(self):
         param_dict = dict()
         try:
@@ -211,6 +307,22 @@ class GridSearch(HyperOptUtils):
 
         scoring (sklearn scoring object or str) : an sklearn scorer
 
+        n_jobs (int) : number of processes used to evaluate the candidates
+
+        prune (bool) : whether to evaluate the cv folds of each candidate in turn, and abandon candidates scoring below
+        the other candidates after the same number of folds. Pruned candidates are flagged in the output csv
+
+        prune_percentile (float) : a candidate is pruned when its mean score over the folds evaluated so far is below
+        this percentile of the running mean scores of the other candidates at the same fold (50 is the median)
+
+        prune_min_folds (int) : the number of folds a candidate always completes before it can be pruned
+
+        prune_min_trials (int) : the number of candidates that must have reached a fold before candidates can be
+        pruned at that fold
+
+        memmap (bool) : whether to share X, y and precomputed cv folds with the worker processes through memory mapped
+        files, instead of sending a copy of the data with each task
+
     Methods:
 
         fit : optimizes hyperparameters
@@ -230,7 +342,8 @@ class GridSearch(HyperOptUtils):
         _estimator_name : returns string of estimator name
 
     """
-    def __init__(self, estimator, cv, param_names, param_values, scoring=None, n_jobs=1):
+    def __init__(self, estimator, cv, param_names, param_values, scoring=None, n_jobs=1, prune=False,
+                 prune_percentile=50, prune_min_folds=2, prune_min_trials=5, memmap=False):
         super(GridSearch, self).__init__(param_names=param_names, param_values=param_values)
         self.estimator = estimator
         self.cv = cv
@@ -238,6 +351,11 @@ class GridSearch(HyperOptUtils):
         self.param_values = param_values
         self.scoring = scoring
         self.n_jobs = int(n_jobs)
+        self.prune = str(prune).lower() == 'true'
+        self.prune_percentile = float(prune_percentile)
+        self.prune_min_folds = int(prune_min_folds)
+        self.prune_min_trials = int(prune_min_trials)
+        self.memmap = str(memmap).lower() == 'true'
 
     def fit(self, X, y, savepath=None, refit=True, iid=True):
         rst = dict()
@@ -252,18 +370,30 @@ class GridSearch(HyperOptUtils):
         if self.cv is None:
             self.cv = ms.RepeatedKFold()
 
-        model = GridSearchCV(self.estimator, param_dict, scoring=self.scoring, cv=self.cv, refit=refit,
-                             iid=iid, n_jobs=self.n_jobs, verbose=2)
-
         try:
-            rst[estimator_name] = model.fit(X, y)
+            X_search, y_search, cv = self._search_data(X, y)
+            if self.prune:
+                self._fit_with_pruning(X_search, y_search, cv, list(ParameterGrid(param_dict)))
+                rst[estimator_name] = self
+            else:
+                model = GridSearchCV(self.estimator, param_dict, scoring=self.scoring, cv=cv,
+                                     refit=refit and not self.memmap, iid=iid, n_jobs=self.n_jobs, verbose=2)
+                rst[estimator_name] = model.fit(X_search, y_search)
         except:
             log.error('Hyperparameter optimization failed, likely due to inappropriate domain of values to optimize'
                                ' one or more parameters over. Please check your input file and the sklearn docs for the mode'
                                ' you are optimizing for the domain of correct values')
             exit()
+        finally:
+            self._release_search_data()
 
-        best_estimator = rst[estimator_name].best_estimator_
+        if self.prune or self.memmap:
+            # The best estimator is fit on the original X and y, rather than on the memory mapped arrays
+            best_estimator = clone(self.estimator).set_params(**rst[estimator_name].best_params_)
+            if refit:
+                best_estimator.fit(X, y)
+        else:
+            best_estimator = rst[estimator_name].best_estimator_
 
         self._save_output(savepath, rst)
         return best_estimator
@@ -290,6 +420,22 @@ class RandomizedSearch(HyperOptUtils):
 
             n_iter (int) : number of optimizer iterations
 
+            n_jobs (int) : number of processes used to evaluate the candidates
+
+            prune (bool) : whether to evaluate the cv folds of each candidate in turn, and abandon candidates scoring below
+            the other candidates after the same number of folds. Pruned candidates are flagged in the output csv
+
+            prune_percentile (float) : a candidate is pruned when its mean score over the folds evaluated so far is below
+            this percentile of the running mean scores of the other candidates at the same fold (50 is the median)
+
+            prune_min_folds (int) : the number of folds a candidate always completes before it can be pruned
+
+            prune_min_trials (int) : the number of candidates that must have reached a fold before candidates can be
+            pruned at that fold
+
+            memmap (bool) : whether to share X, y and precomputed cv folds with the worker processes through memory mapped
+            files, instead of sending a copy of the data with each task
+
         Methods:
 
             fit : optimizes hyperparameters
@@ -309,7 +455,8 @@ class RandomizedSearch(HyperOptUtils):
             _estimator_name : returns string of estimator name
 
         """
-    def __init__(self, estimator, cv, param_names, param_values, scoring=None, n_iter=50, n_jobs=1):
+    def __init__(self, estimator, cv, param_names, param_values, scoring=None, n_iter=50, n_jobs=1, prune=False,
+                 prune_percentile=50, prune_min_folds=2, prune_min_trials=5, memmap=False):
         super(RandomizedSearch, self).__init__(param_names=param_names, param_values=param_values)
         self.estimator = estimator
         self.cv = cv
@@ -318,6 +465,11 @@ class RandomizedSearch(HyperOptUtils):
         self.scoring = scoring
         self.n_iter = int(n_iter)
         self.n_jobs = int(n_jobs)
+        self.prune = str(prune).lower() == 'true'
+        self.prune_percentile = float(prune_percentile)
+        self.prune_min_folds = int(prune_min_folds)
+        self.prune_min_trials = int(prune_min_trials)
+        self.memmap = str(memmap).lower() == 'true'
 
     def fit(self, X, y, savepath=None, refit=True):
         rst = dict()
@@ -331,18 +483,30 @@ class RandomizedSearch(HyperOptUtils):
         if self.cv is None:
             self.cv = ms.RepeatedKFold()
 
-        model = RandomizedSearchCV(self.estimator, param_dict, n_iter=self.n_iter, scoring=self.scoring, cv=self.cv,
-                                   refit=refit, n_jobs=self.n_jobs, verbose=2)
-
         try:
-            rst[estimator_name] = model.fit(X, y)
+            X_search, y_search, cv = self._search_data(X, y)
+            if self.prune:
+                self._fit_with_pruning(X_search, y_search, cv, list(ParameterSampler(param_dict, self.n_iter)))
+                rst[estimator_name] = self
+            else:
+                model = RandomizedSearchCV(self.estimator, param_dict, n_iter=self.n_iter, scoring=self.scoring,
+                                           cv=cv, refit=refit and not self.memmap, n_jobs=self.n_jobs, verbose=2)
+                rst[estimator_name] = model.fit(X_search, y_search)
         except:
             log.error('Hyperparameter optimization failed, likely due to inappropriate domain of values to optimize'
                                ' one or more parameters over. Please check your input file and the sklearn docs for the mode'
                                ' you are optimizing for the domain of correct values')
             exit()
+        finally:
+            self._release_search_data()
 
-        best_estimator = rst[estimator_name].best_estimator_
+        if self.prune or self.memmap:
+            # The best estimator is fit on the original X and y, rather than on the memory mapped arrays
+            best_estimator = clone(self.estimator).set_params(**rst[estimator_name].best_params_)
+            if refit:
+                best_estimator.fit(X, y)
+        else:
+            best_estimator = rst[estimator_name].best_estimator_
 
         self._save_output(savepath, rst)
         return best_estimator
@@ -353,7 +517,9 @@ class RandomizedSearch(HyperOptUtils):
 
 class BayesianSearch(HyperOptUtils):
     """
-    Class to conduct a Bayesian search to find optimized model hyperparameter values
+    Class to conduct a Bayesian search to find optimized model hyperparameter values. The optimizer state and all
+    evaluated (params, score) pairs are saved after each iteration, so that a rerun of the same search, or a run with a
+    larger n_iter, resumes from the saved state instead of evaluating the same candidates again.
 
     Args:
 
@@ -369,6 +535,15 @@ class BayesianSearch(HyperOptUtils):
 
         n_iter (int) : number of optimizer iterations
 
+        state_dir (str) : directory to save the optimizer state to and resume it from. If None, the state is saved next
+        to the output csv file. The MAST-ML driver sets it to the mastml_bayesian_state folder next to the output
+        directory, so that reruns resume the search
+
+        random_state (int) : seed of the optimizer
+
+        memmap (bool) : whether to share X, y and precomputed cv folds with the worker processes through memory mapped
+        files, instead of sending a copy of the data with each task
+
     Methods:
 
         fit : optimizes hyperparameters
@@ -388,7 +563,8 @@ class BayesianSearch(HyperOptUtils):
         _estimator_name : returns string of estimator name
     """
 
-    def __init__(self, estimator, cv, param_names, param_values, scoring=None, n_iter=50, n_jobs=1):
+    def __init__(self, estimator, cv, param_names, param_values, scoring=None, n_iter=50, n_jobs=1, state_dir=None,
+                 random_state=None, memmap=False):
         super(BayesianSearch, self).__init__(param_names=param_names, param_values=param_values)
         self.estimator = estimator
         self.cv = cv
@@ -397,9 +573,11 @@ class BayesianSearch(HyperOptUtils):
         self.scoring = scoring
         self.n_iter = int(n_iter)
         self.n_jobs = int(n_jobs)
+        self.state_dir = state_dir
+        self.random_state = None if random_state is None else int(random_state)
+        self.memmap = str(memmap).lower() == 'true'
 
     def fit(self, X, y, savepath=None, refit=True):
-        rst = dict()
         param_dict = self._get_bayesian_param_dict()
 
         if savepath is None:
@@ -410,24 +588,296 @@ class BayesianSearch(HyperOptUtils):
         if self.cv is None:
             self.cv = ms.RepeatedKFold()
 
-        model = BayesSearchCV(estimator=self.estimator, search_spaces=param_dict, n_iter=self.n_iter,
-                              scoring=self.scoring, cv=self.cv, refit=refit, n_jobs=self.n_jobs, verbose=2)
+        names = sorted(param_dict.keys())
+        state_path = self._state_path(X, y, savepath)
+        if os.path.exists(state_path):
+            state = joblib.load(state_path)
+            log.info(f"    Resuming {estimator_name} Bayesian search from {len(state['params'])} evaluated candidates"
+                     f" in {state_path}")
+        else:
+            state = {'optimizer': Optimizer([param_dict[name] for name in names], random_state=self.random_state),
+                     'params': list(), 'mean_test_score': list(), 'std_test_score': list()}
 
         try:
-            rst[estimator_name] = model.fit(X, y)
+            X_search, y_search, cv = self._search_data(X, y)
+            splits = list(ms.check_cv(cv).split(X_search, y_search))
+            scorer = check_scoring(self.estimator, scoring=self.scoring)
+            while len(state['params']) < self.n_iter:
+                point = state['optimizer'].ask()
+                params = dict(zip(names, point))
+                fold_scores = ms.cross_val_score(clone(self.estimator).set_params(**params), X_search, y_search,
+                                                 scoring=scorer, cv=splits, n_jobs=self.n_jobs)
+                # The optimizer minimizes, while scorers are greater is better
+                state['optimizer'].tell(point, -np.mean(fold_scores))
+                state['params'].append(params)
+                state['mean_test_score'].append(np.mean(fold_scores))
+                state['std_test_score'].append(np.std(fold_scores))
+                joblib.dump(state, state_path)
+
+            best = int(np.argmax(state['mean_test_score']))
+            self.best_params_ = state['params'][best]
+            self.cv_results_ = {'params': state['params'],
+                                'mean_test_score': np.array(state['mean_test_score']),
+                                'std_test_score': np.array(state['std_test_score'])}
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_)
+            if refit:
+                self.best_estimator_.fit(X, y)
         except:
             log.error('Hyperparameter optimization failed, likely due to inappropriate domain of values to optimize'
                                ' one or more parameters over. Please check your input file and the sklearn docs for the mode'
                                ' you are optimizing for the domain of correct values')
             exit()
+        finally:
+            self._release_search_data()
+
+        self._save_output(savepath, {estimator_name: self})
+        return self.best_estimator_
+
+    def _state_path(self, X, y, savepath):
+        # The state is only resumed by a search of the same estimator, search space, scoring and cv on the same data
+        key = joblib.hash((np.asarray(X), np.asarray(y), self.estimator.get_params(), self.param_names,
+                           self.param_values, self.scoring, self.cv, self.random_state))
+        state_dir = self.state_dir
+        if state_dir is None:
+            state_dir = savepath if os.path.isdir(savepath) else os.path.dirname(os.path.abspath(savepath))
+        os.makedirs(state_dir, exist_ok=True)
+        return os.path.join(state_dir, f'{self._estimator_name}_bayesian_state_{key}.pkl')
+
+    @property
+    def _estimator_name(self):
+        return self.estimator.__class__.__name__
 
-        best_estimator = rst[estimator_name].best_estimator_
+class SuccessiveHalving(HyperOptUtils):
+    """
+    Class to conduct a successive halving (or Hyperband) search to find optimized model hyperparameter values. All
+    candidates are first cross validated with a small resource, e.g. a subset of the training rows of each fold or a
+    small number of trees or epochs. Only the best 1/factor of the candidates are promoted to the next round, which uses
+    factor times more resource, until the remaining candidates are cross validated with the full resource.
 
-        self._save_output(savepath, rst)
-        return best_estimator
+    Args:
+
+        estimator (sklearn estimator object) : an sklearn estimator
+
+        cv (sklearn cross-validator object or iterator) : an sklearn cross-validator
+
+        param_names (list) : list containing names of hyperparams to optimize
+
+        param_values (list) : list containing values of hyperparams to optimize, in the GridSearch format for
+        search_type = grid, or in the RandomizedSearch format for search_type = random
+
+        scoring (sklearn scoring object or str) : an sklearn scorer
+
+        search_type (str) : either 'grid' to start from all points of the grid, or 'random' to start from n_iter
+        randomly sampled points
+
+        n_iter (int) : number of candidates sampled when search_type = random
+
+        resource (str) : the resource increased in each round. Either 'n_samples' for the number of training rows of
+        each cv fold, or the name of an estimator parameter such as 'n_estimators' or 'epochs'
+
+        min_resource (int or str) : the resource of the first round. If 'auto', it is chosen so that about one candidate
+        is left for the last round
+
+        max_resource (int or str) : the resource of the last round. If 'auto', all training rows of each fold for
+        resource = n_samples, or the value of the resource parameter of the estimator otherwise
+
+        factor (float) : the resource multiplier, and the inverse of the fraction of candidates kept, between rounds
+
+        hyperband (bool) : whether to run the Hyperband brackets of successive halving, from many candidates with
+        min_resource to few candidates with max_resource, instead of a single successive halving
+
+        random_state (int) : seed of the training row subsets and of the sampled candidates
+
+        n_jobs (int) : number of processes used to evaluate the candidates and cv folds of a round
+
+        memmap (bool) : whether to share X, y and precomputed cv folds with the worker processes through memory mapped
+        files, instead of sending a copy of the data with each task
+
+    Methods:
+
+        fit : optimizes hyperparameters
+
+            Args:
+
+                X (np array) : array of X data
+
+                y (np array) : array of y data
+
+                savepath (str) : path of output directory
+
+            Returns:
+
+                best_estimator (sklearn estimator object) : the optimized sklearn estimator
+
+        _estimator_name : returns string of estimator name
+
+    """
+    _output_columns = ['mean_test_score', 'std_test_score', 'bracket', 'iteration', 'resource']
+
+    def __init__(self, estimator, cv, param_names, param_values, scoring=None, search_type='grid', n_iter=50,
+                 resource='n_samples', min_resource='auto', max_resource='auto', factor=3, hyperband=False,
+                 random_state=None, n_jobs=1, memmap=False):
+        super(SuccessiveHalving, self).__init__(param_names=param_names, param_values=param_values)
+        if search_type not in ['grid', 'random']:
+            raise utils.InvalidValue(f"SuccessiveHalving search_type must be either grid or random, not {search_type}")
+        self.estimator = estimator
+        self.cv = cv
+        self.param_names = param_names
+        self.param_values = param_values
+        self.scoring = scoring
+        self.search_type = search_type
+        self.n_iter = int(n_iter)
+        self.resource = resource
+        self.min_resource = min_resource
+        self.max_resource = max_resource
+        self.factor = float(factor)
+        self.hyperband = str(hyperband).lower() == 'true'
+        self.random_state = None if random_state is None else int(random_state)
+        self.n_jobs = int(n_jobs)
+        self.memmap = str(memmap).lower() == 'true'
+
+    def fit(self, X, y, savepath=None, refit=True):
+        if savepath is None:
+            savepath = os.getcwd()
+
+        estimator_name = self._estimator_name
+
+        if self.cv is None:
+            self.cv = ms.RepeatedKFold()
+
+        rng = np.random.RandomState(self.random_state)
+        try:
+            X_search, y_search, cv = self._search_data(X, y)
+            X_array = np.asarray(X_search)
+            y_array = np.asarray(y_search)
+            # Training rows are shuffled once per fold, so the row subsets of successive rounds are nested
+            splits = [(rng.permutation(train), test) for train, test in ms.check_cv(cv).split(X_array, y_array)]
+            scorer = check_scoring(self.estimator, scoring=self.scoring)
+
+            candidates = self._candidates(rng)
+            min_resource, max_resource = self._resource_bounds(max(len(train) for train, _ in splits), len(candidates))
+            if self.hyperband:
+                brackets = self._hyperband_brackets(candidates, min_resource, max_resource, rng)
+            else:
+                brackets = [(candidates, min_resource)]
+
+            results = list()
+            final = list()
+            for bracket, (bracket_candidates, resource) in enumerate(brackets):
+                iteration = 0
+                while True:
+                    resource = min(resource, max_resource)
+                    scores = self._evaluate(X_array, y_array, splits, scorer, bracket_candidates, resource)
+                    for params, fold_scores in zip(bracket_candidates, scores):
+                        results.append((params, np.mean(fold_scores), np.std(fold_scores), bracket, iteration,
+                                        int(round(resource))))
+                    if resource >= max_resource:
+                        final.extend(zip(bracket_candidates, scores.mean(axis=1)))
+                        break
+                    n_keep = int(np.ceil(len(bracket_candidates) / self.factor))
+                    order = np.argsort(-scores.mean(axis=1), kind='mergesort')[:n_keep]
+                    bracket_candidates = [bracket_candidates[i] for i in order]
+                    resource *= self.factor
+                    iteration += 1
+
+            best_params, _ = max(final, key=lambda candidate: candidate[1])
+            self.best_params_ = dict(best_params)
+            if self.resource != 'n_samples':
+                self.best_params_[self.resource] = int(round(max_resource))
+            self.cv_results_ = {'params': [result[0] for result in results],
+                                'mean_test_score': np.array([result[1] for result in results]),
+                                'std_test_score': np.array([result[2] for result in results]),
+                                'bracket': np.array([result[3] for result in results]),
+                                'iteration': np.array([result[4] for result in results]),
+                                'resource': np.array([result[5] for result in results])}
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_)
+            if refit:
+                self.best_estimator_.fit(X, y)
+        except:
+            log.error('Hyperparameter optimization failed, likely due to inappropriate domain of values to optimize'
+                               ' one or more parameters over. Please check your input file and the sklearn docs for the mode'
+                               ' you are optimizing for the domain of correct values')
+            exit()
+        finally:
+            self._release_search_data()
+
+        self._save_output(savepath, {estimator_name: self})
+        return self.best_estimator_
+
+    def _candidates(self, rng, n_candidates=None):
+        if self.search_type == 'grid':
+            grid = list(ParameterGrid(self._search_space_generator(self._get_grid_param_dict())))
+            if n_candidates is None or n_candidates >= len(grid):
+                return grid
+            return [grid[i] for i in sorted(rng.choice(len(grid), n_candidates, replace=False))]
+        if n_candidates is None:
+            n_candidates = self.n_iter
+        return list(ParameterSampler(self._get_randomized_param_dict(), n_candidates,
+                                     random_state=rng.randint(np.iinfo(np.int32).max)))
+
+    def _resource_bounds(self, n_train, n_candidates):
+        if self.max_resource == 'auto':
+            if self.resource == 'n_samples':
+                max_resource = n_train
+            else:
+                max_resource = self.estimator.get_params()[self.resource]
+        else:
+            max_resource = float(self.max_resource)
+        if self.min_resource == 'auto':
+            # Enough rounds to reduce the candidates to about one, without going below a sensible smallest resource
+            n_rounds = int(np.ceil(np.log(max(n_candidates, 1)) / np.log(self.factor))) + 1
+            smallest = min(10, max_resource) if self.resource == 'n_samples' else 1
+            min_resource = max(max_resource / self.factor ** (n_rounds - 1), smallest)
+        else:
+            min_resource = float(self.min_resource)
+        return min(min_resource, max_resource), max_resource
+
+    def _hyperband_brackets(self, candidates, min_resource, max_resource, rng):
+        # Each bracket trades the number of candidates against the resource they start from
+        s_max = int(np.floor(np.log(max_resource / min_resource) / np.log(self.factor) + 1e-9))
+        brackets = list()
+        for s in range(s_max, -1, -1):
+            n_candidates = int(np.ceil((s_max + 1) / (s + 1) * self.factor ** s))
+            if self.search_type == 'grid':
+                bracket_candidates = self._candidates(rng, n_candidates)
+            else:
+                bracket_candidates = self._candidates(rng, min(n_candidates, self.n_iter))
+            brackets.append((bracket_candidates, max_resource / self.factor ** s))
+        return brackets
+
+    def _evaluate(self, X, y, splits, scorer, candidates, resource):
+        scores = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fit_and_score_resource)(self.estimator, params, self.resource, int(round(resource)), X, y,
+                                             train, test, scorer)
+            for params in candidates for train, test in splits)
+        return np.array(scores, dtype=float).reshape(len(candidates), len(splits))
 
     @property
     def _estimator_name(self):
         return self.estimator.__class__.__name__
 
-name_to_constructor = {'GridSearch': GridSearch, 'RandomizedSearch': RandomizedSearch, 'BayesianSearch': BayesianSearch}
\ No newline at end of file
+def _fit_and_score_pruned(estimator, params, X, y, splits, scorer, reference, percentile, min_folds):
+    # Scores a candidate fold by fold, and stops once its running mean score is below the percentile of the reference
+    # running means at the same fold
+    scores = list()
+    for fold, (train, test) in enumerate(splits):
+        fold_estimator = clone(estimator).set_params(**params)
+        fold_estimator.fit(X[train], y[train])
+        scores.append(scorer(fold_estimator, X[test], y[test]))
+        if fold + 1 >= min_folds and fold + 1 < len(splits) and reference[fold] is not None:
+            if np.mean(scores) < np.percentile(reference[fold], percentile):
+                return scores, True
+    return scores, False
+
+def _fit_and_score_resource(estimator, params, resource_name, resource, X, y, train, test, scorer):
+    # Fits a candidate on one cv fold with the given resource, and returns its test score
+    estimator = clone(estimator).set_params(**params)
+    if resource_name == 'n_samples':
+        train = train[:max(resource, 1)]
+    else:
+        estimator.set_params(**{resource_name: max(resource, 1)})
+    estimator.fit(X[train], y[train])
+    return scorer(estimator, X[test], y[test])
+
+name_to_constructor = {'GridSearch': GridSearch, 'RandomizedSearch': RandomizedSearch, 'BayesianSearch': BayesianSearch,
+                       'SuccessiveHalving': SuccessiveHalving}
\ No newline at end of file
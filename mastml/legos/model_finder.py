@@ -23,8 +23,6 @@ from keras.models import model_from_json
 from keras.models import load_model
 from keras.models import Sequential
 
-import random
-
 import pandas as pd
 
 #from . import keras_models
@@ -195,14 +193,19 @@ class KerasRegressor():
 # NOTE: in order to use this, other models for the custom ensemble must be defined 
 #       in the conf file with "_ensemble" somewhere in the name
 class EnsembleRegressor():
-    def __init__(self, n_estimators, num_samples, model_list, num_models):
+    def __init__(self, n_estimators, num_samples, model_list, num_models, n_jobs=1, random_state=None):
         self.model_list = model_list # should be list of strings
         self.num_models = num_models # how many of each of the specified models should be included in the ensemble
         self.n_estimators = sum(self.num_models)
         self.num_samples = num_samples
         self.max_samples = num_samples
-        self.bootstrapped_datasets = []
-        self.bootstrapped_idxs = []
+        self.n_jobs = n_jobs # number of members fit in parallel
+        self.random_state = random_state
+        self.rng = np.random.RandomState(random_state)
+        # (n_estimators, num_samples) array of the training rows of each member. The bootstrapped datasets themselves
+        # aren't kept, see bootstrapped_dataset
+        self.bootstrapped_idxs = np.empty((0, num_samples), dtype=np.int32)
+        self.X_train = None
         self.all_preds = []
         self.path = ""
         self.model = self.build_models() # actually a list of models for use as the members in the ensemble
@@ -222,66 +225,57 @@ class EnsembleRegressor():
 
     def setup(self, path):
         self.fold += 1
-        self.bootstrapped_idxs = []
-        self.bootstrapped_datasets = []
+        self.bootstrapped_idxs = np.empty((0, self.num_samples), dtype=np.int32)
+        self.X_train = None
         self.path = path
 
+    def bootstrapped_dataset(self, i):
+        # Rebuilds the bootstrapped X data of member i from its training row indices
+        bootstrap_X = self.X_train[self.bootstrapped_idxs[i]]
+        if 1 == len(bootstrap_X.shape):
+            bootstrap_X = np.expand_dims(np.asarray(bootstrap_X), -1)
+        return bootstrap_X
+
     def fit(self, X, Y):
         X = X.values
         Y = Y.values
 
-        idxs = np.arange(len(X))
-        # fit each model in the ensemble
-        for i in range(self.n_estimators):
-            model = self.model[i]
-
-            # do bootstrapping given the validation data
-            bootstrap_idxs = random.choices(idxs, k=self.num_samples)
-            bootstrap_X = X[bootstrap_idxs]
-            bootstrap_Y = Y[bootstrap_idxs]
-            if 1 == len(bootstrap_X.shape):
-                bootstrap_X = np.expand_dims(np.asarray(bootstrap_X), -1)
-            if 1 == len(bootstrap_Y.shape):
-                bootstrap_Y = np.expand_dims(np.asarray(bootstrap_Y), -1)
+        # do bootstrapping given the validation data, before the members are fit so they can be fit in any order
+        self.bootstrapped_idxs = self.rng.randint(0, len(X), size=(self.n_estimators, self.num_samples), dtype=np.int32)
+        self.X_train = X
 
-            self.bootstrapped_idxs.append(bootstrap_idxs)
-            self.bootstrapped_datasets.append(bootstrap_X)
-            model.fit(bootstrap_X, bootstrap_Y)
+        # fit each model in the ensemble, in worker processes. Keras models can't be sent to other processes and aren't
+        # safe to fit from several threads, so ensembles with Keras members are fit one member after the other
+        n_jobs = 1 if any(isinstance(model, KerasRegressor) for model in self.model) else self.n_jobs
+        self.model = joblib.Parallel(n_jobs=n_jobs)(
+            joblib.delayed(_fit_ensemble_member)(model, X, Y, bootstrap_idxs)
+            for model, bootstrap_idxs in zip(self.model, self.bootstrapped_idxs))
 
     def predict(self, X, return_std=False):
 
         if isinstance(X, pd.DataFrame):
             X = X.values
+        if 1 == len(X.shape):
+            X = np.expand_dims(np.asarray(X), 0)
 
-        all_preds = []
-        means = []
+        # One predict call per member on all rows, stacked into an (n_rows, n_estimators) matrix
+        all_preds = np.empty((X.shape[0], self.n_estimators))
+        for i in range(self.n_estimators):
+            all_preds[:, i] = np.reshape(self.model[i].predict(X), X.shape[0])
 
-        for x_i in range(len(X)):
-            preds = []
-            for i in range(self.n_estimators):
-                sample_X = X[x_i]
-                if 1 == len(sample_X.shape):
-                    sample_X = np.expand_dims(np.asarray(sample_X), 0)
-                preds.append(self.model[i].predict(sample_X))
-            all_preds.append(preds)
-            means.append(np.mean(preds))
-
-            # NOTE for ref (if manual jackknife implementation is necessary)
-            # https://www.jpytr.com/post/random_forests_and_jackknife_variance/
-            # https://github.com/scikit-learn-contrib/forest-confidence-interval/tree/master/forestci
-            # http://contrib.scikit-learn.org/forest-confidence-interval/reference/forestci.html
+        # NOTE for ref (if manual jackknife implementation is necessary)
+        # https://www.jpytr.com/post/random_forests_and_jackknife_variance/
+        # https://github.com/scikit-learn-contrib/forest-confidence-interval/tree/master/forestci
+        # http://contrib.scikit-learn.org/forest-confidence-interval/reference/forestci.html
 
         self.all_preds = all_preds
 
-        return np.asarray(means)
+        return all_preds.mean(axis=1)
 
     # check for failed fits, warn users, and re-calculate
     def stats_check_models(self, X, Y):
         if self.n_estimators > 10:
-            maes = []
-            for i in range(self.n_estimators):
-                abs_errors = np.absolute(np.absolute(np.squeeze(np.asarray(self.all_preds)[:,i])) - Y)
-                maes.append(sum(abs_errors) / len(abs_errors))
+            maes = np.mean(np.absolute(np.absolute(self.all_preds) - np.asarray(Y).reshape(-1, 1)), axis=0)
 
             alpha = 0.01
             bad_idxs = []
@@ -298,7 +292,7 @@ class EnsembleRegressor():
                     print("bad estimator mae: {}".format(maes[i]))
                     print("mean mae (for ref):")
                     print(np.mean(maes))
-                    np.savetxt(self.path + "\\{}_{}_bootstrapped_dataset.csv".format(self.fold, i), self.bootstrapped_datasets[i], delimiter=",")
+                    np.savetxt(os.path.join(self.path, "{}_{}_bootstrapped_dataset.csv".format(self.fold, i)), self.bootstrapped_dataset(i), delimiter=",")
                     bad_idxs.append(i)
 
             if len(bad_idxs) == self.n_estimators:
@@ -306,11 +300,18 @@ class EnsembleRegressor():
                 return
             #self.all_preds = np.delete(self.all_preds, bad_idxs, 1)
 
-        y_preds = []
-        for idx, x_i in enumerate(self.all_preds):
-            y_preds.append(np.mean(x_i))
-
-        return np.asarray(y_preds)
+        return self.all_preds.mean(axis=1)
+
+def _fit_ensemble_member(model, X, Y, bootstrap_idxs):
+    # Fits one member of an EnsembleRegressor on its bootstrapped rows, and returns it to the parent process
+    bootstrap_X = X[bootstrap_idxs]
+    bootstrap_Y = Y[bootstrap_idxs]
+    if 1 == len(bootstrap_X.shape):
+        bootstrap_X = np.expand_dims(np.asarray(bootstrap_X), -1)
+    if 1 == len(bootstrap_Y.shape):
+        bootstrap_Y = np.expand_dims(np.asarray(bootstrap_Y), -1)
+    model.fit(bootstrap_X, bootstrap_Y)
+    return model
 
 class ModelImport():
     """
@@ -25,7 +25,8 @@ from sklearn.model_selection import LeaveOneGroupOut
 from sklearn.metrics import make_scorer
 from sklearn.base import clone
 
-from mastml import conf_parser, data_loader, html_helper, plot_helper, utils, learning_curve, data_cleaner, metrics
+from mastml import conf_parser, data_loader, html_helper, plot_helper, utils, learning_curve, data_cleaner, metrics, \
+    feature_screening, selection_cache
 from mastml.legos import (data_splitters, feature_generators, feature_normalizers,
                     feature_selectors, model_finder, util_legos, randomizers, hyper_opt)
 from mastml.legos import clusterers as legos_clusterers
@@ -121,6 +122,12 @@ def mastml_run(conf_path, data_path, outdir):
 
     MiscSettings = conf['MiscSettings']
     is_classification = conf['is_classification']
+    precision = conf['GeneralSetup']['precision']
+    # Feature selection results are cached next to the output folder, so they can be reused by later runs
+    feature_selection_cache = None
+    if MiscSettings['feature_selection_cache'] is True:
+        feature_selection_cache = selection_cache.SelectionCache(
+            join(os.path.dirname(os.path.abspath(outdir)), 'mastml_selection_cache.sqlite'))
     # The df is used by feature generators, clusterers, and grouping_column to 
     # create more features for x.
     # X is model input, y is target feature for model
@@ -128,7 +135,8 @@ def mastml_run(conf_path, data_path, outdir):
                                          conf['GeneralSetup']['input_features'],
                                          conf['GeneralSetup']['input_target'],
                                          conf['GeneralSetup']['input_grouping'],
-                                         conf['GeneralSetup']['input_other'])
+                                         conf['GeneralSetup']['input_other'],
+                                         dtype=precision)
     if not conf['GeneralSetup']['input_grouping']:
         X_grouped = pd.DataFrame()
 
@@ -147,7 +155,9 @@ def mastml_run(conf_path, data_path, outdir):
         # Always scan the input data and flag potential outliers
         data_cleaner.flag_outliers(df=df, conf_not_input_features=conf['GeneralSetup']['input_other'],
                                    savepath=outdir,
-                                   n_stdevs=3)
+                                   n_stdevs=float(dc.get('outlier_n_stdevs', 3)),
+                                   method=dc.get('outlier_method', 'zscore'),
+                                   report_format=dc.get('outlier_report_format', 'csv'))
         if dc['cleaning_method'] == 'remove':
             df, nan_indices = data_cleaner.remove(df, axis=1)
             X, nan_indices = data_cleaner.remove(X, axis=1)
@@ -165,11 +175,18 @@ def mastml_run(conf_path, data_path, outdir):
         elif dc['cleaning_method'] == 'ppca':
             log.warning("You have selected data cleaning with PPCA. Note that PPCA will not work to estimate missing target values, "
                         "at least a 2D matrix is needed. It is recommended you remove missing target data")
-            df = data_cleaner.ppca(df, X_noinput.columns)
-            X = data_cleaner.ppca(X)
+            ppca_kwargs = dict(n_components=int(dc['ppca_n_components']) if 'ppca_n_components' in dc.keys() else None,
+                               max_iter=int(dc.get('ppca_max_iter', 1000)),
+                               tol=float(dc.get('ppca_tol', 1e-4)),
+                               dtype=dc.get('ppca_dtype', precision),
+                               batch_size=int(dc['ppca_batch_size']) if 'ppca_batch_size' in dc.keys() else None)
+            df = data_cleaner.ppca(df, X_noinput.columns, **ppca_kwargs)
+            X = data_cleaner.ppca(X, **ppca_kwargs)
         else:
             log.error("You have specified an invalid data cleaning method. Choose from: remove, imputation, or ppca")
             exit()
+        # Imputation and PPCA return float64 arrays, so restore the requested feature precision
+        X = data_loader.set_precision(X, precision)
 
         # Check if any y target data values are missing or NaN
         shape_before = y.shape
@@ -322,6 +339,7 @@ def mastml_run(conf_path, data_path, outdir):
 
     hyperopts = OrderedDict(hyperopts)
     hyperopts = list(hyperopts.items())
+    _set_default_hyperopt_state_dirs(hyperopts, outdir)
 
     # Snatch splitter for use in feature selection, particularly RFECV
     splitters = OrderedDict(splitters)  # for easier modification
@@ -368,7 +386,6 @@ def mastml_run(conf_path, data_path, outdir):
             filename = join(outdir, "generated_features.csv")
             pd.concat([dataframe, X_noinput, y], 1).to_csv(filename, index=False)
             return dataframe
-        generated_df = generate_features()
 
         def remove_constants():
             dataframe = _remove_constant_features(generated_df)
@@ -376,9 +393,44 @@ def mastml_run(conf_path, data_path, outdir):
             filename = join(outdir, "generated_features_no_constant_columns.csv")
             pd.concat([dataframe, X_noinput, y], 1).to_csv(filename, index=False)
             return dataframe
-        generated_df = remove_constants()
+
+        def generate_and_screen_features():
+            # Write each generator's output to an on-disk store and only load the columns that survive the screening
+            log.info("Doing feature generation with out-of-core feature screening...")
+            # Each generator's output is still built in memory, so the peak memory is that of the largest generator
+            fs_conf = conf['FeatureScreening']
+            block_size = int(fs_conf.get('block_size', 1000))
+            store = feature_screening.FeatureStore(join(outdir, 'feature_store'),
+                                                   store_format=fs_conf.get('store_format', 'memmap'),
+                                                   dtype=precision, chunk_size=block_size)
+            try:
+                for _, instance in generators:
+                    store.append(instance.fit_transform(df, y))
+                report = feature_screening.screen_features(store, y,
+                            variance_threshold=float(fs_conf.get('variance_threshold', 0)),
+                            target_correlation_threshold=float(fs_conf.get('target_correlation_threshold', 0)),
+                            redundancy_threshold=float(fs_conf['redundancy_threshold']) if 'redundancy_threshold' in fs_conf.keys() else None,
+                            block_size=block_size)
+                report.to_csv(join(outdir, "feature_screening.csv"))
+                dataframe = store.read(report.index[report['kept']].tolist())
+            finally:
+                # The store holds every generated column, so it is only kept on disk if asked for
+                if str(fs_conf.get('keep_store', False)).lower() != 'true':
+                    store.remove()
+            log.info("Saving screened generated data to csv...")
+            filename = join(outdir, "generated_features_screened.csv")
+            pd.concat([dataframe, X_noinput, y], 1).to_csv(filename, index=False)
+            return dataframe
+
+        # An empty [FeatureScreening] section turns the screening on with the default settings
+        if 'FeatureScreening' in conf:
+            generated_df = generate_and_screen_features()
+        else:
+            generated_df = generate_features()
+            generated_df = remove_constants()
 
         # add in generated features
+        generated_df = data_loader.set_precision(generated_df, precision)
         X = pd.concat([X, generated_df], axis=1)
         # add in generated features to full dataframe
         df = pd.concat([df, generated_df], axis=1)
@@ -455,6 +507,17 @@ def mastml_run(conf_path, data_path, outdir):
         def make_normalizer_selector_dataframe_triples(models):
             triples = []
             nonlocal y, y_novalidation
+            # Branches whose selected features and target are identical (e.g. selectors choosing the same columns) run
+            # each hyperopt only once. Hyperopts are described before any of them is fit, so their fit results don't
+            # change the description
+            hyperopt_descriptions = dict()
+            for hyperopt_name, hyperopt_instance in hyperopts:
+                try:
+                    hyperopt_descriptions[hyperopt_name] = joblib.hash(hyperopt_instance)
+                except Exception:
+                    # e.g. estimators that can't be pickled, which are then optimized in every branch
+                    hyperopt_descriptions[hyperopt_name] = None
+            hyperopt_results = dict()
             for normalizer_name, normalizer_instance in normalizers:
 
                 # Run feature normalization
@@ -464,8 +527,12 @@ def mastml_run(conf_path, data_path, outdir):
 
                 # HERE- try to address issue with normalizing non-validation part of dataset
                 normalizer = normalizer_instance.fit(X_novalidation, y)
-                X_normalized = normalizer.transform(X)
-                X_novalidation_normalized = normalizer.transform(X_novalidation)
+                X_normalized = data_loader.set_precision(normalizer.transform(X), precision)
+                # Normalizers act row by row once fit, so take the no-validation rows instead of transforming them again
+                if X_novalidation is X:
+                    X_novalidation_normalized = X_normalized
+                else:
+                    X_novalidation_normalized = X_normalized.loc[X_novalidation.index]
 
                 if conf['MiscSettings']['normalize_target_feature'] is True:
                     yreshape = pd.DataFrame(np.array(y).reshape(-1, 1))
@@ -495,6 +562,8 @@ def mastml_run(conf_path, data_path, outdir):
                     learning_curve_scoring = conf['LearningCurve']['scoring']
                     n_features_to_select = int(conf['LearningCurve']['n_features_to_select'])
                     learning_curve_cv = conf['LearningCurve']['cv']
+                    learning_curve_n_jobs = int(conf['LearningCurve']['n_jobs']) if 'n_jobs' in conf['LearningCurve'].keys() else None
+                    learning_curve_incremental = conf_parser.mybool(str(conf['LearningCurve'].get('incremental', False)))
                     try:
                         selector_name = conf['LearningCurve']['selector_name']
                     except KeyError:
@@ -509,7 +578,9 @@ def mastml_run(conf_path, data_path, outdir):
                     train_sizes, train_mean, test_mean, train_stdev, test_stdev = learning_curve.sample_learning_curve(X=X_novalidation_normalized, y=y_novalidation,
                                                             estimator=learning_curve_estimator, cv=learning_curve_cv,
                                                             scoring=learning_curve_scoring,
-                                                            Xgroups=X_grouped_novalidation)
+                                                            Xgroups=X_grouped_novalidation,
+                                                            n_jobs=learning_curve_n_jobs,
+                                                            incremental=learning_curve_incremental)
                     plot_helper.plot_learning_curve(train_sizes, train_mean, test_mean, train_stdev, test_stdev,
                                                     scoring_name_nice, 'sample_learning_curve',
                                                     join(dirname, f'data_learning_curve'))
@@ -519,7 +590,8 @@ def mastml_run(conf_path, data_path, outdir):
                                                             scoring=learning_curve_scoring, selector_name=selector_name,
                                                             savepath=dirname,
                                                             n_features_to_select=n_features_to_select,
-                                                            Xgroups=X_grouped_novalidation)
+                                                            Xgroups=X_grouped_novalidation,
+                                                            selection_cache=feature_selection_cache)
                     plot_helper.plot_learning_curve(train_sizes, train_mean, test_mean, train_stdev, test_stdev,
                                                     scoring_name_nice, 'feature_learning_curve',
                                                     join(dirname, f'feature_learning_curve'))
@@ -533,27 +605,12 @@ def mastml_run(conf_path, data_path, outdir):
                     log.info(f"    Running selector {selector_name} ...")
                     dirname = join(outdir, normalizer_name, selector_name)
                     os.mkdir(dirname)
-                    # NOTE: Changed from .fit_transform to .fit.transform
-                    # because PCA.fit_transform doesn't call PCA.transform
                     if selector_instance.__class__.__name__ == 'MASTMLFeatureSelector':
+                        # MASTMLFeatureSelector saves its output, and the selected features, to the normalizer folder
                         dirname = join(outdir, normalizer_name)
-                        X_selected = selector_instance.fit(X_novalidation_normalized, y_novalidation, dirname, X_grouped_novalidation).transform(X_novalidation_normalized)
-                    elif selector_instance.__class__.__name__ == 'SequentialFeatureSelector':
-                        X_selected = selector_instance.fit(X_novalidation_normalized, y_novalidation).transform(X_novalidation_normalized)
-                        # Need to reset indices in case have test data, otherwise df.equals won't properly find column names
-                        X_novalidation_normalized_reset = X_novalidation_normalized.reset_index()
-                        # SFS renames the columns. Need to replace the column names with correct feature names.
-                        feature_name_dict = dict()
-                        for feature in X_selected.columns.tolist():
-                            for realfeature in X_novalidation_normalized.columns.tolist():
-                                if X_novalidation_normalized_reset[realfeature].equals(X_selected[feature]):
-                                    feature_name_dict[feature] = realfeature
-                        X_selected.rename(columns= feature_name_dict, inplace=True)
-                    elif selector_instance.__class__.__name__ == 'PearsonSelector':
-                        X_selected = selector_instance.fit(X=X_novalidation_normalized, savepath=dirname, y=y_novalidation).transform(X_novalidation_normalized)
-                    else:
-                        X_selected = selector_instance.fit(X_novalidation_normalized, y_novalidation).transform(X_novalidation_normalized)
-                    features_selected = X_selected.columns.tolist()
+                    features_selected = _run_selector(selector_name, selector_instance, X_novalidation_normalized,
+                                                      y_novalidation, X_grouped_novalidation, dirname,
+                                                      feature_selection_cache)
                     # Need to do this instead of taking X_selected directly because otherwise won't concatenate correctly with test data values, which are
                     # left out of the feature selection process.
                     X_selected = X_normalized[features_selected]
@@ -571,7 +628,9 @@ def mastml_run(conf_path, data_path, outdir):
                             dirname = join(outdir, normalizer_name, selector_name, hyperopt_name)
                             os.mkdir(dirname)
                             estimator_name = hyperopt_instance._estimator_name
-                            best_estimator = hyperopt_instance.fit(X_selected, y, savepath=os.path.join(dirname, str(estimator_name)+'.csv'))
+                            savepath = os.path.join(dirname, str(estimator_name)+'.csv')
+                            best_estimator = _run_hyperopt(hyperopt_instance, hyperopt_descriptions[hyperopt_name],
+                                                           X_selected, y, savepath, hyperopt_results)
 
                             new_name = estimator_name + '_' + str(normalizer_name) + '_' + str(selector_name) + '_' + str(hyperopt_name)
                             new_model = best_estimator
@@ -765,6 +824,11 @@ def mastml_run(conf_path, data_path, outdir):
             else:
                 model.fit(train_X, train_y)
 
+            # In float32 mode, refit a float64 copy of the model on the first split to report the metric deviation
+            reference_test_pred = None
+            if precision == 'float32' and split_num == 0 and 'KerasRegressor' not in model.__class__.__name__:
+                reference_test_pred = _float64_reference_predictions(model, train_X, train_y, test_X)
+
             #except ValueError:
             #    raise utils.InvalidValue('MAST-ML has detected an error with one of your feature vectors which has caused an error'
             #                       ' in model fitting.')
@@ -804,9 +868,13 @@ def mastml_run(conf_path, data_path, outdir):
                     train_pred = np.squeeze(train_pred)
                 if test_pred.ndim > 1:
                     test_pred = np.squeeze(test_pred)
+                if reference_test_pred is not None and reference_test_pred.ndim > 1:
+                    reference_test_pred = np.squeeze(reference_test_pred)
                 if conf['MiscSettings']['normalize_target_feature'] is True:
                     train_pred = normalizer_instance.inverse_transform(train_pred)
                     test_pred = normalizer_instance.inverse_transform(test_pred)
+                    if reference_test_pred is not None:
+                        reference_test_pred = normalizer_instance.inverse_transform(reference_test_pred)
                     train_y = pd.Series(normalizer_instance.inverse_transform(train_y))
                     test_y = pd.Series(normalizer_instance.inverse_transform(test_y))
 
@@ -871,6 +939,15 @@ def mastml_run(conf_path, data_path, outdir):
                     test_metrics['R2_adjusted'] = metrics_dict['R2_adjusted'][1](test_y, test_pred, test_X.shape[1])
                     train_metrics['R2_adjusted'] = metrics_dict['R2_adjusted'][1](train_y, train_pred, train_X.shape[1])
 
+                if reference_test_pred is not None:
+                    reference_metrics = OrderedDict((name, function(test_y, reference_test_pred))
+                                                    for name, (_, function) in metrics_dict.items())
+                    if 'rmse_over_stdev' in metrics_dict.keys():
+                        reference_metrics['rmse_over_stdev'] = metrics_dict['rmse_over_stdev'][1](test_y, reference_test_pred, train_y)
+                    if 'R2_adjusted' in metrics_dict.keys():
+                        reference_metrics['R2_adjusted'] = metrics_dict['R2_adjusted'][1](test_y, reference_test_pred, test_X.shape[1])
+                    _write_precision_deviation(test_metrics, reference_metrics, path, split_num)
+
                 split_result = OrderedDict(
                     normalizer=split_path[-4],
                     selector=split_path[-3],
@@ -1425,6 +1502,57 @@ def _write_stats(train_metrics, test_metrics, outdir, prediction_metrics=None, p
                     else:
                         f.write(f"{name}: {'%.3f'%float(score)}\n")
 
+def _float64_reference_predictions(model, train_X, train_y, test_X):
+    """
+    Method that refits an unfitted copy of a model on the float64 upcast of float32 features, used to gauge how much
+    running in float32 precision changes the model predictions
+
+    Args:
+        model: (sklearn estimator), the model that was fit on the float32 training data
+
+        train_X: (dataframe), float32 training features
+
+        train_y: (series), training target data
+
+        test_X: (dataframe), float32 test features
+
+    Returns:
+        (numpy array), test predictions of the float64 model, or None if the model can't be copied
+
+    """
+    try:
+        reference_model = clone(model)
+    except (TypeError, RuntimeError):
+        log.debug(f"Could not clone {model.__class__.__name__}, skipping the float64 precision check")
+        return None
+    reference_model.fit(data_loader.set_precision(train_X, 'float64'), train_y)
+    return np.asarray(reference_model.predict(data_loader.set_precision(test_X, 'float64')))
+
+def _write_precision_deviation(test_metrics, reference_metrics, outdir, split_num):
+    """
+    Method that writes the test metrics of a float32 run next to those of the float64 reference fit. Only one split is
+    refit in float64, so the split number is part of the file name
+
+    Args:
+        test_metrics: (dict), test metrics of the float32 run
+
+        reference_metrics: (dict), test metrics of the float64 reference fit
+
+        outdir: (str), path of the split directory to save the precision_deviation_split_<split_num>.csv file in
+
+        split_num: (int), number of the split the float64 reference was fit on
+
+    Returns:
+        None
+
+    """
+    deviation = pd.DataFrame({'float32': pd.Series(test_metrics), 'float64': pd.Series(reference_metrics)})
+    deviation['abs_deviation'] = (deviation['float32'] - deviation['float64']).abs()
+    deviation.index.name = 'metric'
+    deviation.to_csv(join(outdir, f'precision_deviation_split_{split_num}.csv'))
+    log.info(f"             Max metric deviation of float32 vs float64 on split {split_num}: "
+             f"{deviation['abs_deviation'].max():.3e}")
+
 def _write_stats_tocsv(train_metrics, test_metrics, outdir, prediction_metrics=None, prediction_names=None):
     datadict = dict()
     for name, score in train_metrics.items():
@@ -1456,6 +1584,128 @@ def _exclude_validation(df, validation_column):
 def _only_validation(df, validation_column):
     return df.loc[validation_column == 1]
 
+def _run_selector(selector_name, selector_instance, X, y, X_grouped, savepath, feature_selection_cache=None):
+    """
+    Method that fits a feature selector on a copy of the configured selector instance, or restores its result from the
+    feature selection cache. On a cache hit, the files the selector wrote when it was fit are copied to savepath, so the
+    output folder is the same either way
+
+    Args:
+        selector_name: (str), name of the selector in the conf file
+
+        selector_instance: (object), the unfitted feature selector. It is left unfitted, so every normalizer starts from
+        the same selector settings, and the cache key doesn't depend on earlier fits
+
+        X: (dataframe), dataframe of normalized X features, without validation data
+
+        y: (series), series of y data, without validation data
+
+        X_grouped: (dataframe), dataframe of group labels, may be empty
+
+        savepath: (str), path of the folder the selector saves its output files to
+
+        feature_selection_cache: (SelectionCache), cache to look up and store the selection in. If None, the selector
+        is always fit
+
+    Returns:
+        features_selected: (list), names of the selected features
+
+    """
+    cache_key = None
+    if feature_selection_cache is not None:
+        cache_key = feature_selection_cache.make_key(X, y, X_grouped, selector_instance)
+        cached_selection = feature_selection_cache.get(cache_key)
+        if cached_selection is not None:
+            log.info(f"    Reusing cached feature selection of {selector_name}")
+            log.debug(f"    Cached selection path of {selector_name}: {cached_selection['path']}")
+            for filename in cached_selection['output_files']:
+                shutil.copy2(filename, savepath)
+            return cached_selection['selected']
+
+    try:
+        selector = clone(selector_instance, safe=False)
+    except (TypeError, RuntimeError):
+        log.debug(f"Could not copy {selector_name}, fitting the configured instance instead")
+        selector = selector_instance
+    stamps = selection_cache.file_stamps(savepath)
+    # NOTE: Changed from .fit_transform to .fit.transform
+    # because PCA.fit_transform doesn't call PCA.transform
+    if selector.__class__.__name__ == 'MASTMLFeatureSelector':
+        X_selected = selector.fit(X, y, savepath, X_grouped).transform(X)
+    elif selector.__class__.__name__ == 'SequentialFeatureSelector':
+        # The SFS transform names the selected columns from the indices of the chosen features
+        X_selected = selector.fit(X, y).transform(X)
+    elif selector.__class__.__name__ == 'PearsonSelector':
+        X_selected = selector.fit(X=X, savepath=savepath, y=y).transform(X)
+    else:
+        X_selected = selector.fit(X, y).transform(X)
+    features_selected = X_selected.columns.tolist()
+    if feature_selection_cache is not None:
+        feature_selection_cache.put(cache_key, selector_name, features_selected,
+                                    path=selection_cache.selection_path(selector, X.columns.tolist()),
+                                    selector=selector,
+                                    output_files=selection_cache.changed_files(savepath, stamps))
+    return features_selected
+
+def _run_hyperopt(hyperopt_instance, hyperopt_description, X_selected, y, savepath, hyperopt_results):
+    """
+    Method that runs a hyperparameter optimization, or reuses the result of the same optimization on identical selected
+    features from an earlier branch, in which case the results csv of that branch is copied to savepath
+
+    Args:
+        hyperopt_instance: (object), the hyperparameter optimization instance
+
+        hyperopt_description: (str), joblib hash of the hyperopt instance, taken before any search ran. If None, the
+        search is always run
+
+        X_selected: (dataframe), dataframe of the selected X features
+
+        y: (series), series of y data
+
+        savepath: (str), path of the results csv file of the search
+
+        hyperopt_results: (dict), dict of (best estimator, savepath) tuples of the searches run so far, by key. New
+        results are added to it
+
+    Returns:
+        best_estimator: (object), the optimized estimator
+
+    """
+    hyperopt_key = None
+    if hyperopt_description is not None:
+        hyperopt_key = joblib.hash((X_selected, y, hyperopt_description))
+    if hyperopt_key is not None and hyperopt_key in hyperopt_results:
+        reused_estimator, reused_savepath = hyperopt_results[hyperopt_key]
+        log.info(f"    Reusing hyperopt results of {reused_savepath}, which has the same selected features")
+        shutil.copy2(reused_savepath, savepath)
+        return deepcopy(reused_estimator)
+    best_estimator = hyperopt_instance.fit(X_selected, y, savepath=savepath)
+    if hyperopt_key is not None:
+        hyperopt_results[hyperopt_key] = (best_estimator, savepath)
+    return best_estimator
+
+def _set_default_hyperopt_state_dirs(hyperopts, outdir):
+    """
+    Method that sets where BayesianSearch hyperopts without a state_dir save their optimizer state. The states are kept
+    in the mastml_bayesian_state folder next to the output directory, as check_paths moves an existing output directory
+    aside on a rerun and a state saved inside it would never be resumed
+
+    Args:
+
+        hyperopts: (list), list of (name, instance) pairs of hyperparameter optimizers
+
+        outdir: (str), the path of the output directory
+
+    Returns:
+
+        None
+
+    """
+    state_dir = join(os.path.dirname(os.path.abspath(outdir)), 'mastml_bayesian_state')
+    for hyperopt_name, hyperopt_instance in hyperopts:
+        if isinstance(hyperopt_instance, hyper_opt.BayesianSearch) and hyperopt_instance.state_dir is None:
+            hyperopt_instance.state_dir = state_dir
+
 def check_paths(conf_path, data_path, outdir):
     """
     This method is responsible for error handling of the user-specified paths for the configuration file, data file,
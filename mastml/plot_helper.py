@@ -22,6 +22,7 @@ from math import log, floor, ceil
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import r2_score
 from sklearn.ensemble._forest import _generate_sample_indices, _get_n_samples_bootstrap
+from sklearn.utils import check_random_state
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
 # Ignore the harmless warning about the gelsd driver on mac.
@@ -40,6 +41,7 @@ from matplotlib.figure import Figure, figaspect
 from matplotlib.animation import FuncAnimation
 from matplotlib.font_manager import FontProperties
 from scipy.stats import gaussian_kde, norm
+from scipy.sparse import csr_matrix
 from mpl_toolkits.axes_grid1.inset_locator import mark_inset
 from mpl_toolkits.axes_grid1.inset_locator import zoomed_inset_axes
 
@@ -56,8 +58,10 @@ import nbformat
 from functools import wraps
 
 import forestci as fci
+from joblib import Parallel, delayed
 from forestci.calibration import calibrateEB
 import copy
+import psutil
 
 matplotlib.rc('font', size=18, family='sans-serif') # set all font to bigger
 matplotlib.rc('figure', autolayout=True) # turn on autolayout
@@ -65,6 +69,14 @@ matplotlib.rc('figure', autolayout=True) # turn on autolayout
 # adding dpi as a constant global so it can be changed later
 DPI = 250
 
+# fraction of the available memory the jackknife error bar intermediates may use before they are computed in chunks
+JACKKNIFE_MEMORY_FRACTION = 0.25
+
+# number of rows the centered inbag matrix is sketched to by the approximate jackknife. Each variance estimate has a
+# relative standard error of about sqrt(2 / JACKKNIFE_SKETCH_SIZE). The sketch is only used for training sets with more
+# rows than this, see use_inbag_sketch
+JACKKNIFE_SKETCH_SIZE = 2000
+
 #logger = logging.getLogger() # only used inside ipynb_maker I guess
 
 # HEADERENDER don't delete this line, it's used by ipynb maker
@@ -131,7 +143,8 @@ def ipynb_maker(plot_func):
                       plot_helper.nice_mean, plot_helper.nice_std, plot_helper.rounder, plot_helper._set_tick_labels,
                       plot_helper._set_tick_labels_different, plot_helper._nice_range_helper, plot_helper._nearest_pow_ten,
                       plot_helper._three_sigfigs, plot_helper._n_sigfigs, plot_helper._int_if_int, plot_helper._round_up,
-                      plot_helper.prediction_intervals]
+                      plot_helper.member_predictions, plot_helper.prediction_intervals,
+                      plot_helper.model_error_bars]
         func_strings = '\n\n'.join(inspect.getsource(func) for func in core_funcs)
 
         plot_func_string = inspect.getsource(plot_func)
@@ -279,9 +292,25 @@ def make_error_plots(run, path, is_classification, label, model, train_X, test_X
         #plot_normalized_error(y_train_true, y_train_pred, join(path, title+'.png'), model, error_method, percentile,
         # X=train_X, Xtrain=train_X, Xtest=test_X)
 
+        # The error bars of each set of predictions are computed once per split, stored in the split result and shared
+        # by all error plots. The jackknife inbag matrix of the fitted model is also computed once and shared by the
+        # test and validation error bars
+        inbag = None
+        if str(rf_error_method).startswith('jackknife') and getattr(model, 'bootstrap', False) and \
+                model.__class__.__name__ in ['RandomForestRegressor', 'ExtraTreesRegressor', 'EnsembleRegressor']:
+            if ('error_bars_test' not in run) or (is_validation and 'error_bars_validation' not in run):
+                inbag = calc_inbag_modified(train_X.shape[0], model, model.__class__.__name__ == 'EnsembleRegressor')
+        if 'error_bars_test' not in run:
+            run['error_bars_test'] = model_error_bars(model, test_X, rf_error_method, rf_error_percentile,
+                                                      Xtrain=train_X, Xtest=test_X, inbag=inbag)
+        if is_validation and 'error_bars_validation' not in run:
+            run['error_bars_validation'] = model_error_bars(model, validation_X, rf_error_method, rf_error_percentile,
+                                                            Xtrain=train_X, Xtest=test_X, inbag=inbag)
+
         title = 'test_normalized_error'
         plot_normalized_error(y_test_true, y_test_pred, join(path, title+'.png'), model, rf_error_method,
-                              rf_error_percentile, X=test_X, Xtrain=train_X, Xtest=test_X)
+                              rf_error_percentile, X=test_X, Xtrain=train_X, Xtest=test_X,
+                              error_bars=run['error_bars_test'])
 
         #title = 'train_cumulative_normalized_error'
         #plot_cumulative_normalized_error(y_train_true, y_train_pred, join(path, title+'.png'), model, error_method,
@@ -289,7 +318,8 @@ def make_error_plots(run, path, is_classification, label, model, train_X, test_X
 
         title = 'test_cumulative_normalized_error'
         plot_cumulative_normalized_error(y_test_true, y_test_pred, join(path, title+'.png'), model, rf_error_method,
-                                         rf_error_percentile, X=test_X, Xtrain=train_X, Xtest=test_X)
+                                         rf_error_percentile, X=test_X, Xtrain=train_X, Xtest=test_X,
+                                         error_bars=run['error_bars_test'])
 
         # HERE, add your RMS residual vs. error plot function
         if model.__class__.__name__ in ['RandomForestRegressor', 'ExtraTreesRegressor', 'GaussianProcessRegressor',
@@ -300,10 +330,12 @@ def make_error_plots(run, path, is_classification, label, model, train_X, test_X
         if is_validation:
             title = 'validation_cumulative_normalized_error'
             plot_cumulative_normalized_error(y_validation_true, y_validation_pred, join(path, title+'.png'), model, rf_error_method,
-                                             rf_error_percentile, X=validation_X, Xtrain=train_X, Xtest=test_X)
+                                             rf_error_percentile, X=validation_X, Xtrain=train_X, Xtest=test_X,
+                                             error_bars=run['error_bars_validation'])
             title = 'validation_normalized_error'
             plot_normalized_error(y_validation_true, y_validation_pred, join(path, title + '.png'), model, rf_error_method,
-                                  rf_error_percentile, X=validation_X, Xtrain=train_X, Xtest=test_X)
+                                  rf_error_percentile, X=validation_X, Xtrain=train_X, Xtest=test_X,
+                                  error_bars=run['error_bars_validation'])
             
             if model.__class__.__name__ in ['RandomForestRegressor', 'ExtraTreesRegressor', 'GaussianProcessRegressor',
                                             'GradientBoostingRegressor', 'EnsembleRegressor']:
@@ -1133,6 +1165,12 @@ def calc_inbag_modified(n_samples, forest, is_ensemble):
         raise ValueError(e_s)
 
     n_trees = forest.n_estimators
+    if is_ensemble:
+        # Count the occurrences of each training row in the bootstrap index arrays of all members at once
+        offsets = forest.bootstrapped_idxs[:n_trees].astype(np.int64) + n_samples * np.arange(n_trees)[:, np.newaxis]
+        counts = np.bincount(offsets.ravel(), minlength=n_samples * n_trees)
+        return counts.reshape(n_trees, n_samples).T.astype(float)
+
     inbag = np.zeros((n_samples, n_trees))
     sample_idx = []
     n_samples_bootstrap = _get_n_samples_bootstrap(
@@ -1141,21 +1179,17 @@ def calc_inbag_modified(n_samples, forest, is_ensemble):
     )
 
     for t_idx in range(n_trees):
-        if not is_ensemble:
-            sample_idx.append(
-                _generate_sample_indices(forest.estimators_[t_idx].random_state,
-                                         n_samples, n_samples_bootstrap))
-            inbag[:, t_idx] = np.bincount(sample_idx[-1], minlength=n_samples)
-        else:
-            sample_idx = forest.bootstrapped_idxs[t_idx]
-            inbag[:, t_idx] = np.bincount(sample_idx, minlength=n_samples)
+        sample_idx.append(
+            _generate_sample_indices(forest.estimators_[t_idx].random_state,
+                                     n_samples, n_samples_bootstrap))
+        inbag[:, t_idx] = np.bincount(sample_idx[-1], minlength=n_samples)
 
     return inbag
 
 # Credit to: http://contrib.scikit-learn.org/forest-confidence-interval/_modules/forestci/forestci.html
 def random_forest_error_modified(forest, is_ensemble, X_train, X_test, basic_IJ=False,inbag=None,
-                        calibrate=True, memory_constrained=False,
-                        memory_limit=None):
+                        calibrate=True, memory_constrained=None,
+                        memory_limit=None, approximate=False, sketch_size=None, random_state=None):
     """
     Calculate error bars from scikit-learn RandomForest estimators.
 
@@ -1196,11 +1230,28 @@ def random_forest_error_modified(forest, is_ensemble, X_train, X_test, basic_IJ=
         Whether or not there is a restriction on memory. If False, it is
         assumed that a ndarry of shape (n_train_sample,n_test_sample) fits
         in main memory. Setting to True can actually provide a speed up if
-        memory_limit is tuned to the optimal range.
+        memory_limit is tuned to the optimal range. If set to `None` (default)
+        it is set from the size of that array, see jackknife_memory_policy.
 
     memory_limit: int, optional.
         An upper bound for how much memory the itermediate matrices will take
-        up in Megabytes. This must be provided if memory_constrained=True.
+        up in Megabytes. If set to `None` (default) it is a fraction
+        JACKKNIFE_MEMORY_FRACTION of the available memory.
+
+    approximate: boolean, optional
+        Whether to estimate the infinitesimal jackknife from a count-sketch of
+        the centered inbag matrix, see sketch_inbag. The exact computation is
+        used instead, with a warning, unless use_inbag_sketch finds the sketch
+        cheaper.
+
+    sketch_size: int, optional
+        The number of rows of the sketch. The relative standard error of each
+        variance estimate is about sqrt(2 / sketch_size). If set to `None`
+        (default) it is JACKKNIFE_SKETCH_SIZE.
+
+    random_state: int or RandomState, optional
+        Seed or random number generator of the sketch. If set to `None`
+        (default) the global numpy random number generator is used.
 
     Returns
     -------
@@ -1224,22 +1275,22 @@ def random_forest_error_modified(forest, is_ensemble, X_train, X_test, basic_IJ=
     if inbag is None:
         inbag = calc_inbag_modified(X_train.shape[0], forest, is_ensemble)
 
-    if not is_ensemble:
-        pred = np.array([tree.predict(X_test) for tree in forest]).T
-    else:
-        pred = np.array([tree.predict(X_test) for tree in forest.model]).T
-        pred = pred[0]
+    pred = member_predictions(forest, np.asarray(X_test)).T
     pred_mean = np.mean(pred, 0)
     pred_centered = pred - pred_mean
     n_trees = forest.n_estimators
-    V_IJ = fci._core_computation(X_train, X_test, inbag, pred_centered, n_trees,
-                             memory_constrained, memory_limit)
-    V_IJ_unbiased = fci._bias_correction(V_IJ, inbag, pred_centered, n_trees)
-
-    # Correct for cases where resampling is done without replacement:
-    if np.max(inbag) == 1:
-        variance_inflation = 1 / (1 - np.mean(inbag)) ** 2
-        V_IJ_unbiased *= variance_inflation
+    if sketch_size is None:
+        sketch_size = JACKKNIFE_SKETCH_SIZE
+    if approximate and use_inbag_sketch(X_train.shape[0], X_test.shape[0], n_trees, sketch_size):
+        inbag_sketch = sketch_inbag(inbag, sketch_size, check_random_state(random_state))
+        n_rows = sketch_size
+    else:
+        inbag_sketch = None
+        n_rows = X_train.shape[0]
+    memory_constrained, memory_limit = jackknife_memory_policy(n_rows, X_test.shape[0], memory_constrained,
+                                                               memory_limit)
+    V_IJ, V_IJ_unbiased = _jackknife_variance(X_train, X_test, inbag, pred_centered, n_trees, memory_constrained,
+                                              memory_limit, inbag_sketch)
 
     if basic_IJ:
         return V_IJ
@@ -1254,23 +1305,14 @@ def random_forest_error_modified(forest, is_ensemble, X_train, X_test, basic_IJ=
 
         calibration_ratio = 2
         n_sample = np.ceil(n_trees / calibration_ratio)
-        new_forest = copy.deepcopy(forest) # NOTE may need to do explicitly this for EnsembleRegressor -> update: doesn't seem to cause any issues
-        if not is_ensemble:
-            new_forest.estimators_ =\
-                np.random.permutation(new_forest.estimators_)[:int(n_sample)]
-        else:
-            new_forest.model =\
-                np.random.permutation(new_forest.model)[:int(n_sample)]
-        new_forest.n_estimators = int(n_sample)
-
-        #results_ss = fci.random_forest_error(new_forest, X_train, X_test,
-        #                                 calibrate=False,
-        #                                 memory_constrained=memory_constrained,
-        #                                 memory_limit=memory_limit)
-        results_ss = random_forest_error_modified(new_forest, is_ensemble, X_train, X_test,
-                                         calibrate=False,
-                                         memory_constrained=memory_constrained,
-                                         memory_limit=memory_limit)
+        # The subsampled forest is a random subset of the trees (or ensemble members). Selecting the same columns of the
+        # inbag and prediction matrices gives its variance estimates without copying the forest or predicting again.
+        # The prediction columns are centered per tree, so they stay centered after the selection
+        sample_idx = np.random.permutation(n_trees)[:int(n_sample)]
+        # The sketch is linear in the rows of the inbag matrix, so the same holds for its columns
+        _, results_ss = _jackknife_variance(X_train, X_test, inbag[:, sample_idx], pred_centered[:, sample_idx],
+                                            int(n_sample), memory_constrained, memory_limit,
+                                            None if inbag_sketch is None else inbag_sketch[:, sample_idx])
         # Use this second set of variance estimates
         # to estimate scale of Monte Carlo noise
         sigma2_ss = np.mean((results_ss - V_IJ_unbiased)**2)
@@ -1282,7 +1324,164 @@ def random_forest_error_modified(forest, is_ensemble, X_train, X_test, basic_IJ=
 
         return V_IJ_calibrated
 
-def prediction_intervals(model, X, rf_error_method, rf_error_percentile, Xtrain, Xtest):
+def _jackknife_variance(X_train, X_test, inbag, pred_centered, n_trees, memory_constrained, memory_limit,
+                        inbag_sketch=None):
+    # Infinitesimal jackknife variance and its bias corrected version, from the inbag matrix and the centered tree
+    # predictions of one (sub)set of trees. With a sketch of the centered inbag matrix, V_IJ is estimated from the
+    # sketch instead.
+    # V_IJ is the squared norm of (inbag - 1) @ pred_centered.T / n_trees for each test row, which is also
+    # pred_centered @ G @ pred_centered.T / n_trees**2 with the (n_trees, n_trees) Gram matrix G of (inbag - 1). When
+    # there are more test rows than trees, going through G is cheaper and avoids the (n_train, n_test) intermediate
+    if X_test.shape[0] > n_trees:
+        centered = inbag - 1 if inbag_sketch is None else inbag_sketch
+        gram = np.dot(centered.T, centered)
+        V_IJ = np.einsum('ij,ij->i', np.dot(pred_centered, gram), pred_centered) / n_trees ** 2
+    elif inbag_sketch is None:
+        V_IJ = fci._core_computation(X_train, X_test, inbag, pred_centered, n_trees,
+                                 memory_constrained, memory_limit)
+    else:
+        chunk_size = X_test.shape[0]
+        if memory_constrained:
+            chunk_size = max(1, int(memory_limit * 1e6 / (8.0 * inbag_sketch.shape[0])))
+        V_IJ = np.concatenate([np.sum((np.dot(pred_centered[start:start + chunk_size], inbag_sketch.T) / n_trees) ** 2,
+                                      1)
+                               for start in range(0, X_test.shape[0], chunk_size)])
+    V_IJ_unbiased = fci._bias_correction(V_IJ, inbag, pred_centered, n_trees)
+
+    # Correct for cases where resampling is done without replacement:
+    if np.max(inbag) == 1:
+        variance_inflation = 1 / (1 - np.mean(inbag)) ** 2
+        V_IJ_unbiased *= variance_inflation
+    return V_IJ, V_IJ_unbiased
+
+def _jackknife_cost(n_rows, n_test, n_trees):
+    # Number of multiply-adds of V_IJ from an (n_rows, n_trees) centered inbag matrix or sketch, see _jackknife_variance
+    if n_test > n_trees:
+        return n_rows * n_trees ** 2 + n_test * n_trees ** 2
+    return n_rows * n_trees * n_test
+
+def use_inbag_sketch(n_train, n_test, n_trees, sketch_size):
+    """
+    Method to decide whether the approximate jackknife sketches the inbag matrix. The sketch is only used if sketching
+    and computing from the sketch costs less than the exact computation, which roughly means that the sketch has fewer
+    rows than the training set. Otherwise the approximation would be less accurate without being cheaper, so a warning
+    is logged and the exact computation is used
+
+    Args:
+
+        n_train: (int), number of training rows
+
+        n_test: (int), number of test rows
+
+        n_trees: (int), number of trees of the forest
+
+        sketch_size: (int), the number of rows of the sketch
+
+    Returns:
+
+        (bool), whether to use the sketch
+
+    """
+    exact_cost = _jackknife_cost(n_train, n_test, n_trees)
+    sketched_cost = n_train * n_trees + _jackknife_cost(sketch_size, n_test, n_trees)
+    if sketched_cost < exact_cost:
+        return True
+    logger.warning(f'The approximate jackknife with a sketch of {sketch_size} rows is not cheaper than the exact jackknife '
+                   f'for {n_trees} trees, {n_train} training rows and {n_test} test rows, using the exact jackknife '
+                   f'instead')
+    return False
+
+def sketch_inbag(inbag, sketch_size, rng):
+    """
+    Method to compute a count-sketch of the centered inbag matrix (inbag - 1). Each training row is added, with a random
+    sign, to one of sketch_size random rows, so the squared norms of the products of the sketch with the tree predictions
+    are unbiased estimates of those of the full matrix, which are the infinitesimal jackknife variances
+
+    Args:
+
+        inbag: (numpy array), array of shape (n_train, n_trees) of the number of times each training row is in each tree
+
+        sketch_size: (int), the number of rows of the sketch
+
+        rng: (numpy RandomState), random number generator of the rows and signs
+
+    Returns:
+
+        inbag_sketch: (numpy array), array of shape (sketch_size, n_trees)
+
+    """
+    n_train = inbag.shape[0]
+    buckets = rng.randint(0, sketch_size, size=n_train)
+    signs = rng.choice([-1.0, 1.0], size=n_train)
+    sketch = csr_matrix((signs, (buckets, np.arange(n_train))), shape=(sketch_size, n_train))
+    return np.asarray(sketch @ (inbag - 1))
+
+def jackknife_memory_policy(n_train, n_test, memory_constrained=None, memory_limit=None):
+    """
+    Method to decide whether the jackknife variance is computed in chunks of test rows, and with what memory limit. The
+    unchunked computation forms an (n_train, n_test) array of doubles, so it is chunked if that array doesn't fit in the
+    memory limit
+
+    Args:
+
+        n_train: (int), number of training rows
+
+        n_test: (int), number of test rows
+
+        memory_constrained: (bool), whether to compute in chunks. If None, it is decided from the memory limit
+
+        memory_limit: (float), memory limit of the intermediate arrays in Megabytes. If None, it is the fraction
+        JACKKNIFE_MEMORY_FRACTION of the available memory
+
+    Returns:
+
+        memory_constrained: (bool), whether to compute in chunks
+
+        memory_limit: (float), memory limit in Megabytes, raised if needed so that a chunk holds at least one test row
+
+    """
+    if memory_limit is None:
+        memory_limit = JACKKNIFE_MEMORY_FRACTION * psutil.virtual_memory().available / 1e6
+    if memory_constrained is None:
+        memory_constrained = 8.0 * n_train * n_test / 1e6 > memory_limit
+    # forestci floors the number of test rows per chunk from the limit, which must leave at least one row
+    min_limit = math.ceil(8.0 * n_train / 1e6)
+    if memory_constrained and memory_limit < min_limit:
+        logger.warning(f'A jackknife memory limit of {memory_limit:.1f} MB is too small for {n_train} training rows, '
+                       f'using {min_limit} MB instead')
+        memory_limit = min_limit
+    return memory_constrained, memory_limit
+
+def member_predictions(model, X):
+    """
+    Method to calculate the predictions of each tree of a tree ensemble, or of each member of an EnsembleRegressor, with
+    one predict call per tree on all rows. The trees of random forests and extra trees are predicted in parallel using
+    the n_jobs of the model
+
+    Args:
+
+        model: (scikit-learn model/estimator object), a fitted RandomForestRegressor, ExtraTreesRegressor,
+        GradientBoostingRegressor or EnsembleRegressor
+
+        X: (numpy array), array of X features
+
+    Returns:
+
+        preds: (numpy array), array of shape (n_members, n_rows) of the predictions of each member
+
+    """
+    if model.__class__.__name__ == 'GradientBoostingRegressor':
+        members = [stage[0] for stage in model.estimators_]
+    elif model.__class__.__name__ == 'EnsembleRegressor':
+        members = model.model
+    else:
+        members = model.estimators_
+    # Tree predictions release the GIL, so threads avoid copying the trees and X to other processes
+    preds = Parallel(n_jobs=getattr(model, 'n_jobs', None), prefer='threads')(
+        delayed(member.predict)(X) for member in members)
+    return np.vstack([np.reshape(pred, X.shape[0]) for pred in preds])
+
+def prediction_intervals(model, X, rf_error_method, rf_error_percentile, Xtrain, Xtest, inbag=None):
     """
     Method to calculate prediction intervals when using Random Forest and Gaussian Process regression models.
 
@@ -1299,6 +1498,9 @@ def prediction_intervals(model, X, rf_error_method, rf_error_percentile, Xtrain,
 
         percentile: (int), percentile for which to form error bars
 
+        inbag: (numpy array), inbag matrix of the model for the jackknife methods, see calc_inbag_modified. If None, it
+        is calculated from the model
+
     Returns:
 
         err_up: (list), list of upper bounds of error bars for each data point
@@ -1311,14 +1513,15 @@ def prediction_intervals(model, X, rf_error_method, rf_error_percentile, Xtrain,
     err_up = list()
     nan_indices = list()
     indices_TF = list()
-    X_aslist = X.values.tolist()
     if model.__class__.__name__ in ['RandomForestRegressor', 'GradientBoostingRegressor', 'ExtraTreesRegressor', 'EnsembleRegressor']:
 
         if rf_error_method == 'jackknife_calibrated':
             if 'EnsembleRegressor' in model.__class__.__name__:
-                rf_variances = random_forest_error_modified(model, True, X_train=Xtrain, X_test=Xtest, basic_IJ=False, calibrate=True)
+                rf_variances = random_forest_error_modified(model, True, X_train=Xtrain, X_test=Xtest, basic_IJ=False, calibrate=True,
+                                                            inbag=inbag)
             else:
-                rf_variances = random_forest_error_modified(model, False, X_train=Xtrain, X_test=Xtest, basic_IJ=False, calibrate=True)
+                rf_variances = random_forest_error_modified(model, False, X_train=Xtrain, X_test=Xtest, basic_IJ=False, calibrate=True,
+                                                            inbag=inbag)
             rf_stdevs = np.sqrt(rf_variances)
             nan_indices = np.where(np.isnan(rf_stdevs))
             nan_indices_sorted = np.array(sorted(nan_indices[0], reverse=True))
@@ -1331,9 +1534,11 @@ def prediction_intervals(model, X, rf_error_method, rf_error_percentile, Xtrain,
             err_up = err_down = rf_stdevs
         elif rf_error_method == 'jackknife_uncalibrated':
             if 'EnsembleRegressor' in model.__class__.__name__:
-                rf_variances = random_forest_error_modified(model, True, X_train=Xtrain, X_test=Xtest, basic_IJ=False, calibrate=False)
+                rf_variances = random_forest_error_modified(model, True, X_train=Xtrain, X_test=Xtest, basic_IJ=False, calibrate=False,
+                                                            inbag=inbag)
             else:
-                rf_variances = random_forest_error_modified(model, False, X_train=Xtrain, X_test=Xtest, basic_IJ=False, calibrate=False)
+                rf_variances = random_forest_error_modified(model, False, X_train=Xtrain, X_test=Xtest, basic_IJ=False, calibrate=False,
+                                                            inbag=inbag)
             rf_stdevs = np.sqrt(rf_variances)
             nan_indices = np.where(np.isnan(rf_stdevs))
             nan_indices_sorted = np.array(sorted(nan_indices[0], reverse=True))
@@ -1344,11 +1549,22 @@ def prediction_intervals(model, X, rf_error_method, rf_error_percentile, Xtrain,
                     indices_TF.append(True)
             rf_stdevs = rf_stdevs[~np.isnan(rf_stdevs)]
             err_up = err_down = rf_stdevs
+        elif rf_error_method == 'jackknife_approximate':
+            rf_variances = random_forest_error_modified(model, 'EnsembleRegressor' in model.__class__.__name__,
+                                                        X_train=Xtrain, X_test=Xtest, basic_IJ=False, calibrate=True,
+                                                        approximate=True, inbag=inbag)
+            rf_stdevs = np.sqrt(rf_variances)
+            nan_indices = np.where(np.isnan(rf_stdevs))
+            indices_TF = list(~np.isnan(rf_stdevs))
+            rf_stdevs = rf_stdevs[~np.isnan(rf_stdevs)]
+            err_up = err_down = rf_stdevs
         elif rf_error_method == 'jackknife_basic':
             if 'EnsembleRegressor' in model.__class__.__name__:
-                rf_variances = random_forest_error_modified(model, True, X_train=Xtrain, X_test=Xtest, basic_IJ=True, calibrate=False)
+                rf_variances = random_forest_error_modified(model, True, X_train=Xtrain, X_test=Xtest, basic_IJ=True, calibrate=False,
+                                                            inbag=inbag)
             else:
-                rf_variances = random_forest_error_modified(model, False, X_train=Xtrain, X_test=Xtest, basic_IJ=True, calibrate=False)
+                rf_variances = random_forest_error_modified(model, False, X_train=Xtrain, X_test=Xtest, basic_IJ=True, calibrate=False,
+                                                            inbag=inbag)
             rf_stdevs = np.sqrt(rf_variances)
             nan_indices = np.where(np.isnan(rf_stdevs))
             nan_indices_sorted = np.array(sorted(nan_indices[0], reverse=True))
@@ -1361,45 +1577,19 @@ def prediction_intervals(model, X, rf_error_method, rf_error_percentile, Xtrain,
             err_up = err_down = rf_stdevs
 
         else:
-            for x in range(len(X_aslist)):
-                preds = list()
-                if model.__class__.__name__ == 'RandomForestRegressor':
-                    for pred in model.estimators_:
-                        preds.append(pred.predict(np.array(X_aslist[x]).reshape(1,-1))[0])
-                elif model.__class__.__name__ == 'GradientBoostingRegressor':
-                    for pred in model.estimators_.tolist():
-                        preds.append(pred[0].predict(np.array(X_aslist[x]).reshape(1,-1))[0])
-                elif model.__class__.__name__ == 'EnsembleRegressor':
-                    for pred in model.model:
-                        preds.append(pred.predict(np.array(X_aslist[x]).reshape(1,-1))[0])
-                if rf_error_method == 'confint':
-                    #e_down = np.percentile(preds, (100 - int(rf_error_percentile)) / 2.)
-                    #e_up = np.percentile(preds, 100 - (100 - int(rf_error_percentile)) / 2.)
-                    e_down = np.percentile(preds, float(rf_error_percentile))
-                    e_up = np.percentile(preds, float(rf_error_percentile))
-
-                elif rf_error_method == 'stdev':
-                    e_down = np.std(preds)
-                    e_up = np.std(preds)
-                elif rf_error_method == 'False' or rf_error_method is False:
-                    # basically default to stdev
-                    e_down = np.std(preds)
-                    e_up = np.std(preds)
-                else:
-                    raise ValueError('rf_error_method must be one of ["stdev", "confint", "jackknife_basic", "jackknife_calibrated", "jackknife_uncalibrated"]')
-                #if e_up == 0.0:
-                #    e_up = 10 ** 10
-                #if e_down == 0.0:
-                #    e_down = 10 ** 10
-                err_down.append(e_down)
-                err_up.append(e_up)
+            if rf_error_method not in ['confint', 'stdev', 'False', False]:
+                raise ValueError('rf_error_method must be one of ["stdev", "confint", "jackknife_basic", "jackknife_calibrated", "jackknife_uncalibrated", "jackknife_approximate"]')
+            # (n_members, n_rows) matrix of the predictions of each tree or ensemble member
+            preds = member_predictions(model, X.values)
+            if rf_error_method == 'confint':
+                #e_down = np.percentile(preds, (100 - int(rf_error_percentile)) / 2., axis=0)
+                #e_up = np.percentile(preds, 100 - (100 - int(rf_error_percentile)) / 2., axis=0)
+                err_down = err_up = np.percentile(preds, float(rf_error_percentile), axis=0)
+            else:
+                # stdev, which is also the default
+                err_down = err_up = np.std(preds, axis=0)
             nan_indices = np.where(np.isnan(err_up))
-            nan_indices_sorted = np.array(sorted(nan_indices[0], reverse=True))
-            for i, val in enumerate(list(err_up)):
-                if i in nan_indices_sorted:
-                    indices_TF.append(False)
-                else:
-                    indices_TF.append(True)
+            indices_TF = list(~np.isnan(err_up))
 
     if model.__class__.__name__=='GaussianProcessRegressor':
         preds = model.predict(X, return_std=True)[1] # Get the stdev model error from the predictions of GPR
@@ -1415,9 +1605,45 @@ def prediction_intervals(model, X, rf_error_method, rf_error_percentile, Xtrain,
 
     return err_down, err_up, nan_indices, np.array(indices_TF)
 
+def model_error_bars(model, X, rf_error_method, rf_error_percentile, Xtrain, Xtest, inbag=None):
+    """
+    Method to calculate the error bars of a model once, so that they can be shared by several error plots
+
+    Args:
+
+        model: (scikit-learn model/estimator object), a scikit-learn model object
+
+        X: (numpy array), array of X features
+
+        rf_error_method: (str), type of error bar to formulate, see prediction_intervals
+
+        rf_error_percentile: (int), percentile for which to form error bars
+
+        Xtrain: (numpy array), array of X features the model was trained on
+
+        Xtest: (numpy array), array of X features of the test data
+
+        inbag: (numpy array), inbag matrix of the model for the jackknife methods, see prediction_intervals
+
+    Returns:
+
+        error_bars: (tuple), tuple of lists (err_down, err_up, nan_indices, indices_TF) as returned by
+        prediction_intervals, or None if the model has no error predictions
+
+    """
+    if model.__class__.__name__ not in ['RandomForestRegressor', 'ExtraTreesRegressor', 'GaussianProcessRegressor',
+                                        'GradientBoostingRegressor', 'EnsembleRegressor']:
+        return None
+    err_down, err_up, nan_indices, indices_TF = prediction_intervals(model, X, rf_error_method=rf_error_method,
+                                                                     rf_error_percentile=rf_error_percentile,
+                                                                     Xtrain=Xtrain, Xtest=Xtest, inbag=inbag)
+    # Plain lists, so that the error bars can also be written as arguments of the generated notebooks
+    return (np.asarray(err_down).tolist(), np.asarray(err_up).tolist(), np.asarray(nan_indices).ravel().tolist(),
+            np.asarray(indices_TF).tolist())
+
 @ipynb_maker
 def plot_normalized_error(y_true, y_pred, savepath, model, rf_error_method, rf_error_percentile, X=None, Xtrain=None,
-                          Xtest=None):
+                          Xtest=None, error_bars=None):
     """
     Method to plot the normalized residual errors of a model prediction
 
@@ -1435,6 +1661,8 @@ def plot_normalized_error(y_true, y_pred, savepath, model, rf_error_method, rf_e
 
         avg_stats: (dict), dict of calculated average metrics over all CV splits
 
+        error_bars: (tuple), error bars of X from model_error_bars. If None, they are calculated from the model
+
     Returns:
 
         None
@@ -1445,7 +1673,8 @@ def plot_normalized_error(y_true, y_pred, savepath, model, rf_error_method, rf_e
     # Here: if model is random forest or Gaussian process, get real error bars. Else, just residuals
     model_name = model.__class__.__name__
     # TODO: also add support for Gradient Boosted Regressor
-    models_with_error_predictions = ['RandomForestRegressor', 'GaussianProcessRegressor', 'GradientBoostingRegressor', 'EnsembleRegressor']
+    models_with_error_predictions = ['RandomForestRegressor', 'ExtraTreesRegressor', 'GaussianProcessRegressor', 'GradientBoostingRegressor',
+                                     'EnsembleRegressor']
     has_model_errors = False
 
     y_pred_ = y_pred
@@ -1453,8 +1682,10 @@ def plot_normalized_error(y_true, y_pred, savepath, model, rf_error_method, rf_e
 
     if model_name in models_with_error_predictions:
         has_model_errors = True
-        err_down, err_up, nan_indices, indices_TF = prediction_intervals(model, X, rf_error_method=rf_error_method,
-                                                rf_error_percentile=rf_error_percentile, Xtrain=Xtrain, Xtest=Xtest)
+        if error_bars is None:
+            error_bars = model_error_bars(model, X, rf_error_method, rf_error_percentile, Xtrain=Xtrain, Xtest=Xtest)
+        err_down, err_up, nan_indices, indices_TF = error_bars
+        indices_TF = np.array(indices_TF, dtype=bool)
 
     # Correct for nan indices being present
     if has_model_errors:
@@ -1509,7 +1740,7 @@ def plot_normalized_error(y_true, y_pred, savepath, model, rf_error_method, rf_e
 
 @ipynb_maker
 def plot_cumulative_normalized_error(y_true, y_pred, savepath, model, rf_error_method, rf_error_percentile, X=None,
-                                     Xtrain=None, Xtest=None):
+                                     Xtrain=None, Xtest=None, error_bars=None):
     """
     Method to plot the cumulative normalized residual errors of a model prediction
 
@@ -1527,6 +1758,8 @@ def plot_cumulative_normalized_error(y_true, y_pred, savepath, model, rf_error_m
 
         avg_stats: (dict), dict of calculated average metrics over all CV splits
 
+        error_bars: (tuple), error bars of X from model_error_bars. If None, they are calculated from the model
+
     Returns:
 
         None
@@ -1535,7 +1768,8 @@ def plot_cumulative_normalized_error(y_true, y_pred, savepath, model, rf_error_m
 
     # Here: if model is random forest or Gaussian process, get real error bars. Else, just residuals
     model_name = model.__class__.__name__
-    models_with_error_predictions = ['RandomForestRegressor', 'GaussianProcessRegressor', 'GradientBoostingRegressor', 'EnsembleRegressor']
+    models_with_error_predictions = ['RandomForestRegressor', 'ExtraTreesRegressor', 'GaussianProcessRegressor', 'GradientBoostingRegressor',
+                                     'EnsembleRegressor']
     has_model_errors = False
 
     y_pred_ = y_pred
@@ -1543,8 +1777,10 @@ def plot_cumulative_normalized_error(y_true, y_pred, savepath, model, rf_error_m
 
     if model_name in models_with_error_predictions:
         has_model_errors = True
-        err_down, err_up, nan_indices, indices_TF = prediction_intervals(model, X, rf_error_method=rf_error_method,
-                                                    rf_error_percentile=rf_error_percentile,  Xtrain=Xtrain, Xtest=Xtest)
+        if error_bars is None:
+            error_bars = model_error_bars(model, X, rf_error_method, rf_error_percentile, Xtrain=Xtrain, Xtest=Xtest)
+        err_down, err_up, nan_indices, indices_TF = error_bars
+        indices_TF = np.array(indices_TF, dtype=bool)
 
     # Need to remove NaN's before plotting. These will be present when doing validation runs. Note NaN's only show up in y_pred_
     # Correct for nan indices being present
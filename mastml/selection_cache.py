@@ -0,0 +1,216 @@
+"""
+This module contains a cache of feature selection results, so that runs repeating an identical feature selection (e.g.
+when only the models or plots in a conf file changed) can reuse the selected features instead of refitting the
+selector. The feature sets of each number of features of a feature learning curve are cached the same way. Results are
+stored in a small sqlite database, keyed on a hash of the selector input data, the selector parameters and the cross
+validation definition. The fitted selector and the files it wrote are stored in a folder next to the database, so they
+can be restored on a cache hit.
+"""
+
+import inspect
+import json
+import logging
+import os
+import pickle
+import shutil
+import sqlite3
+from datetime import datetime
+
+import joblib
+import numpy as np
+
+log = logging.getLogger('mastml')
+
+# Constructor parameters that don't change which features are selected
+_IGNORED_PARAMS = ['n_jobs', 'verbose']
+
+class SelectionCache(object):
+    """
+    Class that stores and looks up feature selection results in a sqlite database
+
+    Args:
+
+        path: (str), path of the sqlite database file. It is created if it doesn't exist. The fitted selectors and their
+        output files are stored in a folder of the same name, with _files in place of the file extension
+
+    Methods:
+
+        make_key: hashes the inputs of a feature selection
+
+            Args:
+
+                X: (dataframe), dataframe of X features the selector is fit on
+
+                y: (series), series of y data
+
+                groups: (dataframe), dataframe of group labels, may be empty
+
+                selector: (object), the unfitted feature selector instance
+
+            Returns:
+
+                (str), hex digest identifying the feature selection
+
+        get: looks up a feature selection
+
+            Args:
+
+                key: (str), key from make_key
+
+            Returns:
+
+                (dict), dict with the 'selected' feature names, the selection 'path' (None if no path was stored),
+                the fitted 'selector' (None if it wasn't stored) and the stored 'output_files' of the selector, or
+                None if not cached
+
+        put: stores a feature selection
+
+            Args:
+
+                key: (str), key from make_key
+
+                selector_name: (str), name of the selector, for reference
+
+                selected: (list), names of the selected features
+
+                path: (dict or list), the ranking or selection path of the selector (see selection_path), or the lists
+                of features selected for each number of features of a feature learning curve. None if only the final
+                selection is stored
+
+                selector: (object), the fitted feature selector. It is not stored if None or if it can't be pickled
+
+                output_files: (list), paths of the files the selector wrote while fitting, to copy into the cache
+
+            Returns:
+
+                None
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files_path = os.path.splitext(path)[0] + '_files'
+        with sqlite3.connect(self.path) as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS selections '
+                               '(key TEXT PRIMARY KEY, selector TEXT, selected TEXT, path TEXT, created TEXT)')
+
+    def make_key(self, X, y, groups, selector):
+        return joblib.hash((X, np.asarray(y), np.asarray(groups), _describe(selector)))
+
+    def get(self, key):
+        with sqlite3.connect(self.path) as connection:
+            row = connection.execute('SELECT selected, path FROM selections WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        selector = None
+        selector_file = os.path.join(self.files_path, key, 'selector.pkl')
+        if os.path.exists(selector_file):
+            selector = joblib.load(selector_file)
+        output_path = os.path.join(self.files_path, key, 'output')
+        output_files = list()
+        if os.path.isdir(output_path):
+            output_files = [os.path.join(output_path, name) for name in sorted(os.listdir(output_path))]
+        return {'selected': json.loads(row[0]), 'path': json.loads(row[1]), 'selector': selector,
+                'output_files': output_files}
+
+    def put(self, key, selector_name, selected, path=None, selector=None, output_files=()):
+        files_path = os.path.join(self.files_path, key)
+        shutil.rmtree(files_path, ignore_errors=True)
+        if selector is not None or len(output_files) > 0:
+            os.makedirs(os.path.join(files_path, 'output'))
+            for filename in output_files:
+                shutil.copy2(filename, os.path.join(files_path, 'output'))
+            if selector is not None:
+                try:
+                    joblib.dump(selector, os.path.join(files_path, 'selector.pkl'))
+                except (pickle.PicklingError, TypeError, AttributeError) as error:
+                    log.debug(f'Could not pickle {selector_name} for the selection cache: {error}')
+                    if os.path.exists(os.path.join(files_path, 'selector.pkl')):
+                        os.remove(os.path.join(files_path, 'selector.pkl'))
+        with sqlite3.connect(self.path) as connection:
+            connection.execute('INSERT OR REPLACE INTO selections VALUES (?, ?, ?, ?, ?)',
+                               (key, selector_name, json.dumps(selected), json.dumps(path, default=str),
+                                datetime.now().isoformat()))
+
+def selection_path(selector, columns):
+    """
+    Method that collects the ranking or selection path a fitted feature selector exposes, to store alongside the
+    selected features
+
+    Args:
+
+        selector: (object), a fitted feature selector
+
+        columns: (list), names of the features the selector was fit on
+
+    Returns:
+
+        path: (dict), dict of lists, e.g. the RFE 'ranking' or the MASTMLFeatureSelector 'avg_rmses' per selected feature
+
+    """
+    path = dict()
+    if hasattr(selector, 'ranking_'):
+        path['ranking'] = dict(zip(columns, np.asarray(selector.ranking_).tolist()))
+    if getattr(selector, 'scores_', None) is not None:
+        path['scores'] = dict(zip(columns, np.asarray(selector.scores_, dtype=float).tolist()))
+    if hasattr(selector, 'selected_feature_avg_rmses'):
+        path['avg_rmses'] = np.asarray(selector.selected_feature_avg_rmses, dtype=float).tolist()
+        path['std_rmses'] = np.asarray(selector.selected_feature_std_rmses, dtype=float).tolist()
+    return path
+
+def file_stamps(directory):
+    """
+    Method that records the modification time and size of the files in a directory, to find the files a selector writes
+
+    Args:
+
+        directory: (str), path of the directory
+
+    Returns:
+
+        (dict), dict of (modification time, size) tuples by file name
+
+    """
+    stamps = dict()
+    for name in os.listdir(directory):
+        filename = os.path.join(directory, name)
+        if os.path.isfile(filename):
+            stat = os.stat(filename)
+            stamps[name] = (stat.st_mtime_ns, stat.st_size)
+    return stamps
+
+def changed_files(directory, stamps):
+    """
+    Method that lists the files of a directory that were created or changed since file_stamps was called
+
+    Args:
+
+        directory: (str), path of the directory
+
+        stamps: (dict), the output of file_stamps before the change
+
+    Returns:
+
+        (list), paths of the new or changed files
+
+    """
+    return [os.path.join(directory, name) for name, stamp in file_stamps(directory).items() if stamps.get(name) != stamp]
+
+def _describe(obj):
+    # Describes an object by its class and constructor parameters, so equal configurations hash equally regardless of
+    # any fitted state
+    if isinstance(obj, (list, tuple)):
+        return [_describe(item) for item in obj]
+    if isinstance(obj, dict):
+        return {key: _describe(value) for key, value in obj.items()}
+    if isinstance(obj, (str, int, float, bool, type(None), np.generic, np.ndarray)):
+        return obj
+    if inspect.isfunction(obj) or inspect.isbuiltin(obj):
+        return f'{obj.__module__}.{obj.__name__}'
+    if hasattr(obj, 'get_params'):
+        params = obj.get_params(deep=False)
+    else:
+        names = [name for name in inspect.signature(obj.__class__.__init__).parameters if name != 'self']
+        params = {name: getattr(obj, name) for name in names if hasattr(obj, name)}
+    return (obj.__class__.__name__,
+            {name: _describe(value) for name, value in params.items() if name not in _IGNORED_PARAMS})
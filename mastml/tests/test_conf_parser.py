@@ -0,0 +1,11 @@
+from mastml import conf_parser
+
+def _conf(**sections):
+    conf = {'GeneralSetup': {}, 'Models': {'LinearRegression': {}}}
+    conf.update(sections)
+    return conf_parser.parse_conf_file(conf, from_dict=True)
+
+def test_empty_feature_screening_section_is_kept():
+    # An empty section turns the screening on with its defaults, a missing one leaves it off
+    assert 'FeatureScreening' in _conf(FeatureScreening={})
+    assert 'FeatureScreening' not in _conf()
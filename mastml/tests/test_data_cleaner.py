@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+from mastml import data_cleaner
+
+def _make_data():
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(rng.randn(200, 4), columns=['a', 'b', 'c', 'target'], index=np.arange(200) + 1000)
+    df.iloc[[3, 50, 120], 0] = [8.0, -9.0, 7.5]
+    df.iloc[[7, 80], 2] = [6.0, -6.5]
+    df.iloc[[10, 11], 3] = 20.0
+    return df
+
+def _loop_outliers(df, not_input_features, n_stdevs, method):
+    # Cell by cell scan, as flag_outliers did before it was vectorized
+    outliers = list()
+    for col in df.columns:
+        if col in not_input_features:
+            continue
+        if method == 'zscore':
+            center = np.average(df[col])
+            scale = np.std(df[col])
+        else:
+            center = np.median(df[col])
+            scale = 1.4826*np.median(np.abs(df[col] - center))
+        for row in range(df.shape[0]):
+            if abs(df[col].iloc[row] - center) > n_stdevs*scale:
+                outliers.append((df.index[row], col, df[col].iloc[row]))
+    return sorted(outliers)
+
+def test_flag_outliers_matches_loop(tmp_path):
+    df = _make_data()
+    for method in ['zscore', 'mad']:
+        outliers = data_cleaner.flag_outliers(df, ['target'], str(tmp_path), n_stdevs=3, method=method)
+        flagged = sorted(zip(outliers['Row'], outliers['Column'], outliers['Value']))
+        assert flagged == _loop_outliers(df, ['target'], 3, method)
+        assert 'target' not in set(outliers['Column'])
+
+    # Rows are reported by index label, and the report is written as csv
+    report = pd.read_csv(str(tmp_path / 'data_potential_outliers.csv'))
+    assert {1003, 1050, 1120}.issubset(set(report['Row']))
+
+def _reference_ppca(data, tol=1e-4):
+    # EM loop of the PPCA class that IncrementalPPCA replaced, returning the imputed data on its original scale
+    means = np.nanmean(data, axis=0)
+    stds = np.nanstd(data, axis=0)
+    data = (data - means) / stds
+    observed = ~np.isnan(data)
+    missing = np.sum(~observed)
+    data[~observed] = 0
+    N, D = data.shape
+    d = D
+
+    C = np.random.randn(D, d)
+    CC = np.dot(C.T, C)
+    X = np.dot(np.dot(data, C), np.linalg.inv(CC))
+    recon = np.dot(X, C.T)
+    recon[~observed] = 0
+    ss = np.sum((recon - data) ** 2) / (N * D - missing)
+    v0 = np.inf
+    counter = 0
+    while True:
+        Sx = np.linalg.inv(np.eye(d) + CC / ss)
+        ss0 = ss
+        proj = np.dot(X, C.T)
+        data[~observed] = proj[~observed]
+        X = np.dot(np.dot(data, C), Sx) / ss
+        XX = np.dot(X.T, X)
+        C = np.dot(np.dot(data.T, X), np.linalg.pinv(XX + N * Sx))
+        CC = np.dot(C.T, C)
+        recon = np.dot(X, C.T)
+        recon[~observed] = 0
+        ss = (np.sum((recon - data) ** 2) + N * np.sum(CC * Sx) + missing * ss0) / (N * D)
+        det = np.log(np.linalg.det(Sx))
+        if np.isinf(det):
+            det = abs(np.linalg.slogdet(Sx)[1])
+        v1 = N * (D * np.log(ss) + np.trace(Sx) - det) + np.trace(XX) - missing * np.log(ss0)
+        diff = abs(v1 / v0 - 1)
+        if (diff < tol) and (counter > 5):
+            break
+        counter += 1
+        v0 = v1
+    return data * stds + means
+
+def test_incremental_ppca_matches_reference():
+    rng = np.random.RandomState(0)
+    latent = rng.randn(150, 2)
+    data = np.dot(latent, rng.randn(2, 5)) + 0.1 * rng.randn(150, 5) + np.arange(5)
+    data[rng.rand(*data.shape) < 0.1] = np.nan
+    missing = np.isnan(data)
+
+    np.random.seed(1)
+    expected = _reference_ppca(data.copy())
+    for batch_size in [None, 16]:
+        ppca = data_cleaner.IncrementalPPCA(batch_size=batch_size, random_state=1).fit(data.copy())
+        imputed = ppca.inverse_standardize()
+        np.testing.assert_allclose(imputed[~missing], data[~missing])
+        np.testing.assert_allclose(imputed[missing], expected[missing], rtol=1e-6, atol=1e-8)
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from mastml import data_loader
+
+def test_set_precision_casts_numeric_columns_only():
+    df = pd.DataFrame({'a': np.arange(4, dtype=np.float64), 'b': np.arange(4), 'flag': [True, False, True, False],
+                       'name': ['w', 'x', 'y', 'z']})
+    cast = data_loader.set_precision(df, 'float32')
+
+    assert cast['a'].dtype == np.float32
+    assert cast['b'].dtype == np.float32
+    assert cast['flag'].dtype == np.bool_
+    assert cast['name'].dtype == df['name'].dtype
+    np.testing.assert_array_equal(cast['b'], df['b'])
+    # The input dataframe is left as is
+    assert df['a'].dtype == np.float64
+
+def test_set_precision_returns_input_when_nothing_to_cast():
+    df = pd.DataFrame({'a': np.arange(4, dtype=np.float32), 'name': ['w', 'x', 'y', 'z']})
+    assert data_loader.set_precision(df, 'float32') is df
+
+def test_load_data_precision(tmp_path):
+    path = str(tmp_path / 'data.csv')
+    pd.DataFrame({'x1': [0.1, 0.2, 0.3], 'x2': [1, 2, 3], 'group': [0, 1, 0], 'y': [1.0, 2.0, 3.0]}).to_csv(path, index=False)
+    df, X, X_noinput, X_grouped, y = data_loader.load_data(path, input_features=['x1', 'x2', 'group'], input_target='y',
+                                                           feature_blacklist=['group'], dtype='float32')
+
+    assert list(X.columns) == ['x1', 'x2']
+    assert (X.dtypes == np.float32).all()
+    # The target is not cast
+    assert y.dtype == np.float64
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+from mastml.legos import feature_normalizers
+
+def test_dataframify_transform_leaves_input_and_params_untouched():
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(rng.rand(20, 3), columns=['a', 'b', 'c'], index=np.arange(20) + 100)
+    original = df.copy()
+    for normalizer in [StandardScaler(), MinMaxScaler()]:
+        normalizer.fit(df)
+        params = normalizer.get_params()
+        transformed = normalizer.transform(df)
+
+        pd.testing.assert_frame_equal(df, original)
+        assert normalizer.get_params() == params
+        assert list(transformed.columns) == list(df.columns)
+        assert (transformed.index == df.index).all()
+        np.testing.assert_allclose(transformed.values, type(normalizer).transform.__wrapped__(normalizer, original))
+
+def test_mean_stdev_scaler_all_columns_matches_subset_path():
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(rng.rand(20, 3).astype(np.float32), columns=['a', 'b', 'c'])
+    scaled = feature_normalizers.MeanStdevScaler(mean=1, stdev=2).fit(df).transform(df)
+
+    assert scaled.dtypes.eq(np.float32).all()
+    expected = (df.values - df.values.mean()) / df.values.std() * 2 + 1
+    np.testing.assert_allclose(scaled.values, expected, rtol=1e-5)
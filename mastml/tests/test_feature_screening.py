@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from mastml.feature_screening import FeatureStore, screen_features
+
+def test_feature_store_remove_keeps_read_columns(tmp_path):
+    path = str(tmp_path / 'feature_store')
+    df = pd.DataFrame(np.arange(20.0).reshape(5, 4), columns=['a', 'b', 'c', 'd'])
+    store = FeatureStore(path)
+    store.append(df)
+
+    selected = store.read(['b', 'd'])
+    store.remove()
+
+    # The columns read from the store are in memory, so they outlive the store files
+    assert not os.path.exists(path)
+    pd.testing.assert_frame_equal(selected, df[['b', 'd']])
+
+def test_feature_store_chunks_and_screening_match_in_memory(tmp_path):
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(rng.rand(50, 7), columns=[f'feature_{i}' for i in range(7)])
+    df['feature_2'] = 1.0
+    df['feature_5'] = df['feature_4'] * 3 + 1
+    y = pd.Series(df['feature_0'] + df['feature_4'] + 0.1 * rng.rand(50))
+
+    store = FeatureStore(str(tmp_path / 'feature_store'), chunk_size=3)
+    store.append(df)
+    # Columns are written 3 at a time, and read back in blocks that don't line up with the chunks
+    assert len(os.listdir(str(tmp_path / 'feature_store'))) == 3
+    assert store.columns == list(df.columns)
+    pd.testing.assert_frame_equal(store.read(list(df.columns)), df)
+
+    report = screen_features(store, y, target_correlation_threshold=0.01, redundancy_threshold=0.99, block_size=4)
+    expected_corrs = df.corrwith(y)
+    np.testing.assert_allclose(report['target_correlation'].drop('feature_2'), expected_corrs.drop('feature_2'))
+    assert report.loc['feature_2', 'removed_because'] == 'variance'
+    # feature_5 is a linear function of feature_4, so only one of them is kept
+    assert sorted(report.loc[['feature_4', 'feature_5'], 'removed_because']) == ['', 'redundancy']
+    assert report['kept'].sum() == 5
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.model_selection import KFold
+
+from mastml.legos.feature_selectors import MASTMLFeatureSelector, PearsonSelector
+
+def test_pearson_selector_constant_column(tmp_path):
+    # A constant column has no finite correlation to the target. Asking for all columns used to lower the threshold
+    # forever, as it could never be selected
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame(rng.rand(30, 6), columns=[f'feature_{i}' for i in range(6)])
+    X['feature_3'] = 1.0
+    y = pd.Series(X['feature_0'] + 0.1 * rng.rand(30))
+
+    selector = PearsonSelector(threshold_between_features=0.99, threshold_with_target=0.9,
+                               remove_highly_correlated_features=False, k_features=6)
+    selector.fit(X, str(tmp_path), y)
+
+    assert len(selector.selected_features) == 5
+    assert 'feature_3' not in selector.selected_features
+    assert selector.selected_features[0] == 'feature_0'
+
+class RefitLinearRegression(LinearRegression):
+    # Subclasses aren't scored by the Cholesky extension, so these are refit for every candidate
+    pass
+
+class RefitRidge(Ridge):
+    pass
+
+def _forward_selection_data():
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame(rng.rand(60, 8), columns=[f'feature_{i}' for i in range(8)])
+    # A column collinear with another one can't be solved by the factor update and is refit instead
+    X['feature_7'] = 2 * X['feature_1']
+    y = pd.Series(3 * X['feature_0'] - 2 * X['feature_1'] + X['feature_4'] + 0.1 * rng.rand(60))
+    return X, y
+
+def _select(estimator, X, y, savepath, n_jobs=None):
+    selector = MASTMLFeatureSelector(estimator, n_features_to_select=5, cv=KFold(n_splits=4, shuffle=True, random_state=0),
+                                     n_jobs=n_jobs)
+    return selector.fit(X, y, savepath, Xgroups=pd.DataFrame())
+
+def test_forward_selection_linear_matches_refit(tmp_path):
+    X, y = _forward_selection_data()
+    for estimator, refit_estimator in [(LinearRegression(), RefitLinearRegression()),
+                                       (Ridge(alpha=0.5), RefitRidge(alpha=0.5))]:
+        incremental = _select(estimator, X, y, str(tmp_path))
+        refit = _select(refit_estimator, X, y, str(tmp_path))
+
+        assert incremental.selected_feature_names == refit.selected_feature_names
+        np.testing.assert_allclose(incremental.selected_feature_avg_rmses, refit.selected_feature_avg_rmses, rtol=1e-8)
+        np.testing.assert_allclose(incremental.selected_feature_std_rmses, refit.selected_feature_std_rmses, rtol=1e-6,
+                                   atol=1e-10)
+
+def test_forward_selection_same_with_n_jobs(tmp_path):
+    X, y = _forward_selection_data()
+    serial = _select(RefitRidge(alpha=0.5), X, y, str(tmp_path))
+    parallel = _select(RefitRidge(alpha=0.5), X, y, str(tmp_path), n_jobs=2)
+
+    assert serial.selected_feature_names == parallel.selected_feature_names
+    np.testing.assert_allclose(serial.selected_feature_avg_rmses, parallel.selected_feature_avg_rmses)
+
+def _early_stopping_data():
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame(rng.rand(80, 6), columns=[f'feature_{i}' for i in range(6)])
+    # Only two features carry signal, the others only fit noise
+    y = pd.Series(3 * X['feature_2'] - 2 * X['feature_4'] + 0.01 * rng.rand(80))
+    return X, y
+
+def test_forward_selection_stops_on_patience(tmp_path):
+    X, y = _early_stopping_data()
+    cv = KFold(n_splits=4, shuffle=True, random_state=0)
+    full = MASTMLFeatureSelector(Ridge(alpha=1e-3), n_features_to_select=6, cv=cv).fit(X, y, str(tmp_path),
+                                                                                       Xgroups=pd.DataFrame())
+    stopped = MASTMLFeatureSelector(Ridge(alpha=1e-3), n_features_to_select=6, cv=cv, patience=2,
+                                    min_improvement=1e-3).fit(X, y, str(tmp_path), Xgroups=pd.DataFrame())
+
+    # Two more features are tried after the best one, and then dropped again
+    assert stopped.selected_feature_names == full.selected_feature_names[:2]
+    assert sorted(stopped.selected_feature_names) == ['feature_2', 'feature_4']
+    np.testing.assert_allclose(stopped.selected_feature_avg_rmses, full.selected_feature_avg_rmses[:2])
+    assert len(stopped.selected_feature_std_rmses) == 2
+
+    # The reported path is the truncated one, in the file of the last feature tried
+    report = pd.read_csv(str(tmp_path / 'MASTMLFeatureSelector_data_feature_3.csv'), index_col=0)
+    assert report.loc['Full feature set Names', '3'] == str(stopped.selected_feature_names)
+    assert report.loc['Stopped because', '3'] == 'no improvement in the last 2 features'
+
+def test_forward_selection_stops_on_max_time(tmp_path):
+    X, y = _early_stopping_data()
+    cv = KFold(n_splits=4, shuffle=True, random_state=0)
+    # The budget is checked after each feature is added, so a zero budget stops after the first one
+    stopped = MASTMLFeatureSelector(Ridge(alpha=1e-3), n_features_to_select=6, cv=cv, max_time=0).fit(
+        X, y, str(tmp_path), Xgroups=pd.DataFrame())
+
+    assert len(stopped.selected_feature_names) == 1
+    assert len(stopped.selected_feature_avg_rmses) == 1
+    report = pd.read_csv(str(tmp_path / 'MASTMLFeatureSelector_data_feature_0.csv'), index_col=0)
+    assert report.loc['Full feature set Names', '0'] == str(stopped.selected_feature_names)
+    assert report.loc['Stopped because', '0'] == 'max_time of 0 seconds exceeded'
@@ -0,0 +1,162 @@
+import os
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import Ridge
+from sklearn.model_selection import KFold
+
+from mastml import mastml_driver
+from mastml.legos.hyper_opt import BayesianSearch, GridSearch, SuccessiveHalving
+
+class CountingRidge(Ridge):
+    n_fits = 0
+
+    def fit(self, X, y, sample_weight=None):
+        CountingRidge.n_fits += 1
+        return super(CountingRidge, self).fit(X, y, sample_weight=sample_weight)
+
+def _bayesian_search(n_iter):
+    return BayesianSearch(CountingRidge(), cv=KFold(n_splits=3, shuffle=True, random_state=0), param_names='alpha',
+                          param_values='-3 2 10 log float', scoring='neg_mean_squared_error', n_iter=n_iter,
+                          random_state=0)
+
+def _run(outdir, n_iter, X, y):
+    # Mirrors a MAST-ML run: the driver sets the default state_dir and the search saves its output inside outdir
+    search = _bayesian_search(n_iter)
+    mastml_driver._set_default_hyperopt_state_dirs([('BayesianSearch', search)], outdir)
+    dirname = os.path.join(outdir, 'BayesianSearch')
+    os.makedirs(dirname)
+    search.fit(X, y, savepath=os.path.join(dirname, 'CountingRidge.csv'))
+    return search
+
+def test_bayesian_search_resumes_after_outdir_is_moved(tmp_path):
+    rng = np.random.RandomState(0)
+    X = rng.rand(40, 3)
+    y = X @ np.array([1.0, 2.0, 3.0]) + 0.1 * rng.rand(40)
+    outdir = str(tmp_path / 'results')
+
+    first = _run(outdir, 3, X, y)
+    # A rerun into the same outdir moves the previous results aside, as check_paths does
+    os.rename(outdir, outdir + '_previous')
+    CountingRidge.n_fits = 0
+    second = _run(outdir, 5, X, y)
+
+    # Only the 2 additional candidates are cross validated, plus the refit of the best one
+    assert CountingRidge.n_fits == 2 * 3 + 1
+
+    assert len(second.cv_results_['params']) == 5
+    assert second.cv_results_['params'][:3] == first.cv_results_['params']
+    np.testing.assert_allclose(second.cv_results_['mean_test_score'][:3], first.cv_results_['mean_test_score'])
+    assert os.listdir(os.path.join(str(tmp_path), 'mastml_bayesian_state'))
+
+def _linear_data(n_rows=90):
+    rng = np.random.RandomState(0)
+    X = rng.rand(n_rows, 3)
+    y = X @ np.array([1.0, 2.0, 3.0]) + 0.1 * rng.rand(n_rows)
+    return X, y
+
+def test_successive_halving_rounds_and_survivors(tmp_path):
+    X, y = _linear_data()
+    search = SuccessiveHalving(Ridge(), cv=KFold(n_splits=3, shuffle=True, random_state=0), param_names='alpha',
+                               param_values='-3 3 9 log float', scoring='neg_mean_squared_error', factor=3,
+                               random_state=0)
+    search.fit(X, y, savepath=str(tmp_path / 'Ridge.csv'))
+    results = search.cv_results_
+
+    # 9 candidates are cut to 3 and then 1, while the training rows of each fold grow from 10 to 30 to all 60
+    np.testing.assert_array_equal(results['iteration'], [0] * 9 + [1] * 3 + [2])
+    np.testing.assert_array_equal(results['resource'], [10] * 9 + [30] * 3 + [60])
+    for iteration in [1, 2]:
+        previous = results['iteration'] == iteration - 1
+        scores = results['mean_test_score'][previous]
+        params = [results['params'][i] for i in np.flatnonzero(previous)]
+        survivors = [params[i] for i in np.argsort(-scores, kind='mergesort')[:int(np.ceil(len(params) / 3))]]
+        assert [results['params'][i] for i in np.flatnonzero(results['iteration'] == iteration)] == survivors
+    assert search.best_params_ == results['params'][-1]
+
+def _pruned_search(n_jobs):
+    return GridSearch(Ridge(), cv=KFold(n_splits=5, shuffle=True, random_state=0), param_names='alpha',
+                      param_values='-4 4 12 log float', scoring='neg_mean_squared_error', n_jobs=n_jobs,
+                      prune=True, prune_min_folds=2, prune_min_trials=1)
+
+def test_pruning_spares_first_batch_and_prunes_later_candidates(tmp_path):
+    X, y = _linear_data()
+    for n_jobs in [1, 2]:
+        search = _pruned_search(n_jobs)
+        search.fit(X, y, savepath=str(tmp_path / 'Ridge.csv'))
+        pruned = search.cv_results_['pruned']
+        n_folds = search.cv_results_['n_folds']
+
+        # The first batch has no earlier candidates to be compared with
+        assert not pruned[:n_jobs].any()
+        assert (n_folds[:n_jobs] == 5).all()
+        # The alphas increase along the grid, so the strongly regularized candidates of later batches are pruned
+        assert pruned[-3:].all()
+        assert ((n_folds[pruned] >= 2) & (n_folds[pruned] < 5)).all()
+        assert (n_folds[~pruned] == 5).all()
+        assert not pruned[search.cv_results_['params'].index(search.best_params_)]
+
+def test_memmap_search_data_matches_input(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    X, y = _linear_data()
+    cv = KFold(n_splits=3, shuffle=True, random_state=0)
+    search = SuccessiveHalving(Ridge(), cv=cv, param_names='alpha', param_values='-3 3 9 log float',
+                               scoring='neg_mean_squared_error', random_state=0, memmap=True)
+
+    X_search, y_search, folds = search._search_data(X, y)
+    assert isinstance(X_search, np.memmap) and isinstance(y_search, np.memmap)
+    np.testing.assert_array_equal(X_search, X)
+    np.testing.assert_array_equal(y_search, y)
+    for (train, test), (expected_train, expected_test) in zip(folds, cv.split(X, y)):
+        np.testing.assert_array_equal(train, expected_train)
+        np.testing.assert_array_equal(test, expected_test)
+    search._release_search_data()
+    assert os.listdir(str(tmp_path)) == []
+
+    # The search results are the same with and without memmap, and no memory mapped files are left behind
+    search.fit(X, y, savepath=str(tmp_path / 'memmap.csv'))
+    plain = SuccessiveHalving(Ridge(), cv=cv, param_names='alpha', param_values='-3 3 9 log float',
+                              scoring='neg_mean_squared_error', random_state=0)
+    plain.fit(X, y, savepath=str(tmp_path / 'plain.csv'))
+    np.testing.assert_allclose(search.cv_results_['mean_test_score'], plain.cv_results_['mean_test_score'])
+    assert sorted(os.listdir(str(tmp_path))) == ['memmap.csv', 'plain.csv']
+
+def test_memmap_files_removed_when_search_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    X, y = _linear_data()
+    search = SuccessiveHalving(Ridge(), cv=KFold(n_splits=3), param_names='alpha', param_values='-3 3 9 log float',
+                               resource='not_a_parameter', max_resource=10, memmap=True)
+    with pytest.raises(SystemExit):
+        search.fit(X, y, savepath=str(tmp_path / 'Ridge.csv'))
+    assert os.listdir(str(tmp_path)) == []
+
+def test_identical_hyperopt_branch_reuses_result(tmp_path):
+    X, y = _linear_data()
+    X = pd.DataFrame(X, columns=['a', 'b', 'c'])
+    y = pd.Series(y, name='target')
+    search = _bayesian_search(3)
+    search.state_dir = str(tmp_path / 'state')
+    description = joblib.hash(search)
+    hyperopt_results = dict()
+
+    CountingRidge.n_fits = 0
+    first = mastml_driver._run_hyperopt(search, description, X, y, str(tmp_path / 'first.csv'), hyperopt_results)
+    n_fits = CountingRidge.n_fits
+    second = mastml_driver._run_hyperopt(search, description, X.copy(), y.copy(), str(tmp_path / 'second.csv'),
+                                         hyperopt_results)
+
+    # The second branch runs no search, gets its own copy of the best estimator and the same results csv
+    assert CountingRidge.n_fits == n_fits
+    assert second is not first
+    assert second.get_params() == first.get_params()
+    np.testing.assert_allclose(second.coef_, first.coef_)
+    with open(str(tmp_path / 'first.csv')) as f_first, open(str(tmp_path / 'second.csv')) as f_second:
+        assert f_first.read() == f_second.read()
+
+    # Different selected features run the search again
+    mastml_driver._run_hyperopt(search, description, X[['a', 'b']], y, str(tmp_path / 'third.csv'), hyperopt_results)
+    assert CountingRidge.n_fits > n_fits
+    assert len(hyperopt_results) == 2
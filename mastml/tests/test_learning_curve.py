@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import SGDRegressor
+from sklearn.metrics import make_scorer, mean_squared_error
+from sklearn.model_selection import KFold
+
+from mastml import learning_curve
+
+def _data():
+    rng = np.random.RandomState(0)
+    X = rng.rand(80, 3)
+    y = X @ np.array([1.0, 2.0, 3.0]) + 0.1 * rng.rand(80)
+    return X, y
+
+def test_incremental_sample_learning_curve_only_for_partial_fit():
+    X, y = _data()
+    cv = KFold(n_splits=4, shuffle=True, random_state=0)
+    scoring = make_scorer(mean_squared_error)
+
+    # Tree ensembles are refit for every fraction, so the incremental curve is the same as the regular one
+    forest = RandomForestRegressor(n_estimators=10, random_state=0)
+    regular = learning_curve.sample_learning_curve(X, y, forest, cv, scoring, Xgroups=pd.DataFrame())
+    incremental = learning_curve.sample_learning_curve(X, y, forest, cv, scoring, Xgroups=pd.DataFrame(),
+                                                       incremental=True)
+    for regular_values, incremental_values in zip(regular, incremental):
+        np.testing.assert_allclose(regular_values, incremental_values)
+
+    # partial_fit models see each chunk of training data once, so their curve differs from full refits
+    sgd = SGDRegressor(random_state=0)
+    regular = learning_curve.sample_learning_curve(X, y, sgd, cv, scoring, Xgroups=pd.DataFrame())
+    incremental = learning_curve.sample_learning_curve(X, y, sgd, cv, scoring, Xgroups=pd.DataFrame(), incremental=True)
+    np.testing.assert_array_equal(regular[0], incremental[0])
+    assert not np.allclose(regular[2], incremental[2])
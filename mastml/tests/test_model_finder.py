@@ -0,0 +1,103 @@
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import Ridge
+from sklearn.tree import DecisionTreeRegressor
+
+from mastml.legos import model_finder
+
+def _data():
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame(rng.rand(60, 3), columns=['a', 'b', 'c'])
+    y = pd.Series(X.values @ np.array([1.0, 2.0, 3.0]) + 0.1 * rng.rand(60), name='target')
+    return X, y
+
+def _ensemble(n_jobs=1):
+    members = [Ridge(alpha=0.1 * (i + 1)) for i in range(6)] + \
+              [DecisionTreeRegressor(max_depth=3, random_state=i) for i in range(6)]
+    return model_finder.EnsembleRegressor(n_estimators=12, num_samples=40, model_list=members, num_models=[1] * 12,
+                                          n_jobs=n_jobs, random_state=0)
+
+class FakeKerasRegressor(model_finder.KerasRegressor):
+    # Stands in for a Keras member, without building a Keras model
+    def __init__(self):
+        pass
+
+    def fit(self, X, Y):
+        self.mean_ = np.mean(Y)
+        return self
+
+    def predict(self, X):
+        return np.full((len(X), 1), self.mean_)
+
+def test_ensemble_predict_matches_row_loop(tmp_path):
+    X, y = _data()
+    ensemble = _ensemble()
+    ensemble.setup(str(tmp_path))
+    ensemble.fit(X, y)
+    preds = ensemble.predict(X)
+
+    # One predict call per row and member, as predict did before it was batched
+    loop_preds = list()
+    means = list()
+    for x_i in range(len(X)):
+        sample_X = np.expand_dims(X.values[x_i], 0)
+        row = [np.squeeze(member.predict(sample_X)) for member in ensemble.model]
+        loop_preds.append(row)
+        means.append(np.mean(row))
+    np.testing.assert_allclose(preds, means)
+
+    # The (n_rows, n_estimators) matrix is kept for stats_check_models
+    assert ensemble.all_preds.shape == (len(X), 12)
+    np.testing.assert_allclose(ensemble.all_preds, loop_preds)
+    np.testing.assert_allclose(ensemble.stats_check_models(X, y), means)
+
+def test_ensemble_fits_keras_members_serially(monkeypatch):
+    X, y = _data()
+    used_n_jobs = list()
+
+    class RecordingParallel(joblib.Parallel):
+        def __init__(self, n_jobs=None, **kwargs):
+            used_n_jobs.append(n_jobs)
+            super(RecordingParallel, self).__init__(n_jobs=n_jobs, **kwargs)
+
+    monkeypatch.setattr(model_finder.joblib, 'Parallel', RecordingParallel)
+
+    serial = _ensemble(n_jobs=1)
+    serial.fit(X, y)
+    parallel = _ensemble(n_jobs=2)
+    parallel.fit(X, y)
+    # Members fit in worker processes are returned fitted, and give the same predictions
+    np.testing.assert_allclose(parallel.predict(X), serial.predict(X))
+
+    with_keras = _ensemble(n_jobs=2)
+    with_keras.model[0] = FakeKerasRegressor()
+    with_keras.fit(X, y)
+    assert used_n_jobs == [1, 2, 1]
+    bootstrap_mean = np.mean(y.values[with_keras.bootstrapped_idxs[0]])
+    np.testing.assert_allclose(with_keras.model[0].predict(X.values[:2]), [[bootstrap_mean]] * 2)
+
+def test_ensemble_bootstraps_are_reproducible():
+    X, y = _data()
+    first = _ensemble()
+    first.fit(X, y)
+    second = _ensemble()
+    second.fit(X, y)
+
+    assert first.bootstrapped_idxs.dtype == np.int32
+    assert first.bootstrapped_idxs.shape == (12, 40)
+    np.testing.assert_array_equal(first.bootstrapped_idxs, second.bootstrapped_idxs)
+    assert not np.array_equal(first.bootstrapped_idxs, _fitted_ensemble(X, y, random_state=1).bootstrapped_idxs)
+
+    # The bootstrapped datasets are rebuilt from the indices, with the rows each member was fit on
+    for i in range(first.n_estimators):
+        np.testing.assert_array_equal(first.bootstrapped_dataset(i), X.values[first.bootstrapped_idxs[i]])
+    np.testing.assert_allclose(first.model[0].coef_,
+                               Ridge(alpha=0.1).fit(first.bootstrapped_dataset(0),
+                                                    y.values[first.bootstrapped_idxs[0]]).coef_)
+
+def _fitted_ensemble(X, y, random_state):
+    ensemble = model_finder.EnsembleRegressor(n_estimators=12, num_samples=40, model_list=[Ridge() for _ in range(12)],
+                                              num_models=[1] * 12, random_state=random_state)
+    ensemble.fit(X, y)
+    return ensemble
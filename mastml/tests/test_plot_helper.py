@@ -0,0 +1,67 @@
+import numpy as np
+from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor
+
+from mastml import plot_helper
+
+def _forest(n_train, n_test, n_trees):
+    rng = np.random.RandomState(0)
+    X = rng.rand(n_train + n_test, 4)
+    y = np.sin(4 * X[:, 0]) + X[:, 1] + 0.3 * rng.randn(n_train + n_test)
+    forest = RandomForestRegressor(n_estimators=n_trees, min_samples_leaf=5, random_state=0).fit(X[:n_train],
+                                                                                               y[:n_train])
+    inbag = plot_helper.calc_inbag_modified(n_train, forest, False)
+    return forest, inbag, X[:n_train], X[n_train:]
+
+def test_use_inbag_sketch():
+    # The sketch is used whenever it is cheaper than the exact computation, also with more rows than there are trees
+    assert plot_helper.use_inbag_sketch(200000, 50, 500, 200)
+    assert plot_helper.use_inbag_sketch(200000, 50, 100, plot_helper.JACKKNIFE_SKETCH_SIZE)
+    assert plot_helper.use_inbag_sketch(200000, 5000, 100, plot_helper.JACKKNIFE_SKETCH_SIZE)
+    assert not plot_helper.use_inbag_sketch(150, 50, 500, 200)
+    assert not plot_helper.use_inbag_sketch(2000, 50, 100, plot_helper.JACKKNIFE_SKETCH_SIZE)
+
+def test_sketch_inbag_uses_given_random_state():
+    inbag = np.random.RandomState(0).poisson(1.0, size=(500, 30)).astype(float)
+    state = np.random.get_state()
+    first = plot_helper.sketch_inbag(inbag, 50, np.random.RandomState(1))
+    second = plot_helper.sketch_inbag(inbag, 50, np.random.RandomState(1))
+    np.testing.assert_array_equal(first, second)
+    assert not np.array_equal(first, plot_helper.sketch_inbag(inbag, 50, np.random.RandomState(2)))
+    # The global random state is left alone
+    assert np.array_equal(np.random.get_state()[1], state[1])
+    assert first.shape == (50, 30)
+
+def test_approximate_jackknife_error_is_bounded():
+    n_train, n_test, n_trees, sketch_size = 3000, 60, 300, 200
+    forest, inbag, X_train, X_test = _forest(n_train, n_test, n_trees)
+    assert plot_helper.use_inbag_sketch(n_train, n_test, n_trees, sketch_size)
+
+    exact = plot_helper.random_forest_error_modified(forest, False, X_train, X_test, basic_IJ=True, inbag=inbag)
+    approximate = plot_helper.random_forest_error_modified(forest, False, X_train, X_test, basic_IJ=True, inbag=inbag,
+                                                           approximate=True, sketch_size=sketch_size, random_state=0)
+
+    # The sketched variances are unbiased, with a relative standard error of about sqrt(2 / sketch_size) = 0.1. The
+    # errors of the test rows are correlated, as they share one sketch, so their mean doesn't average out
+    relative_error = approximate / exact - 1
+    assert abs(np.mean(relative_error)) < 0.3
+    assert np.median(np.abs(relative_error)) < 0.3
+    assert np.max(np.abs(relative_error)) < 0.6
+
+def test_approximate_jackknife_falls_back_to_exact():
+    forest, inbag, X_train, X_test = _forest(500, 40, 50)
+    exact = plot_helper.random_forest_error_modified(forest, False, X_train, X_test, calibrate=False, inbag=inbag)
+    approximate = plot_helper.random_forest_error_modified(forest, False, X_train, X_test, calibrate=False,
+                                                           inbag=inbag, approximate=True)
+    np.testing.assert_array_equal(approximate, exact)
+
+def test_member_predictions_match_estimators():
+    rng = np.random.RandomState(0)
+    X = rng.rand(80, 4)
+    y = X[:, 0] + np.sin(4 * X[:, 1]) + 0.1 * rng.randn(80)
+    for forest in [RandomForestRegressor(n_estimators=20, random_state=0, n_jobs=2),
+                   ExtraTreesRegressor(n_estimators=20, random_state=0)]:
+        forest.fit(X[:60], y[:60])
+        preds = plot_helper.member_predictions(forest, X[60:])
+        assert preds.shape == (20, 20)
+        np.testing.assert_array_equal(preds, [estimator.predict(X[60:]) for estimator in forest.estimators_])
+        np.testing.assert_allclose(preds.mean(axis=0), forest.predict(X[60:]))
@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import make_scorer, mean_squared_error
+from sklearn.model_selection import KFold
+
+from mastml import learning_curve, mastml_driver, selection_cache
+from mastml.legos.feature_selectors import MASTMLFeatureSelector, PearsonSelector
+from mastml.selection_cache import SelectionCache
+
+def _data():
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame(rng.rand(30, 4), columns=['a', 'b', 'c', 'd'])
+    y = pd.Series(X['a'] + 2 * X['c'] + 0.1 * rng.rand(30))
+    return X, y
+
+def test_selection_cache_round_trip(tmp_path):
+    cache = SelectionCache(str(tmp_path / 'cache.sqlite'))
+    cache.put('key', 'SelectKBest', ['a', 'b'])
+    cache.put('path_key', 'feature_learning_curve_SelectKBest', ['a', 'b'], [['a'], ['a', 'b']])
+
+    assert cache.get('missing') is None
+    assert cache.get('key') == {'selected': ['a', 'b'], 'path': None, 'selector': None, 'output_files': []}
+    assert cache.get('path_key')['path'] == [['a'], ['a', 'b']]
+
+def test_selection_cache_restores_selector_and_files(tmp_path):
+    X, y = _data()
+    savepath = tmp_path / 'output'
+    savepath.mkdir()
+    (savepath / 'existing.csv').write_text('not written by the selector')
+    stamps = selection_cache.file_stamps(str(savepath))
+    selector = MASTMLFeatureSelector(LinearRegression(), 2, KFold(n_splits=3)).fit(X, y, str(savepath),
+                                                                                    Xgroups=pd.DataFrame())
+    output_files = selection_cache.changed_files(str(savepath), stamps)
+    assert sorted(os.path.basename(f) for f in output_files) == ['MASTMLFeatureSelector_data_feature_0.csv',
+                                                                  'MASTMLFeatureSelector_data_feature_1.csv']
+
+    cache = SelectionCache(str(tmp_path / 'cache.sqlite'))
+    path = selection_cache.selection_path(selector, X.columns.tolist())
+    cache.put('key', 'MASTMLFeatureSelector', selector.selected_feature_names, path=path, selector=selector,
+              output_files=output_files)
+    cached = cache.get('key')
+
+    assert cached['selected'] == selector.selected_feature_names
+    assert cached['path'] == {'avg_rmses': list(selector.selected_feature_avg_rmses),
+                              'std_rmses': list(selector.selected_feature_std_rmses)}
+    assert cached['selector'].selected_feature_names == selector.selected_feature_names
+    assert [os.path.basename(f) for f in cached['output_files']] == sorted(os.path.basename(f) for f in output_files)
+    for filename in cached['output_files']:
+        with open(filename) as cached_file, open(os.path.join(str(savepath), os.path.basename(filename))) as output_file:
+            assert cached_file.read() == output_file.read()
+
+def test_selection_cache_key_ignores_fitted_state(tmp_path):
+    X, y = _data()
+    cache = SelectionCache(str(tmp_path / 'cache.sqlite'))
+    # The threshold is too high to select 3 features, so fitting lowers it on the selector
+    selector = PearsonSelector(threshold_between_features=0.99, threshold_with_target=0.99,
+                               remove_highly_correlated_features=False, k_features=3)
+    key = cache.make_key(X, y, pd.DataFrame(), selector)
+
+    # The driver fits a copy of the configured selector, so the key of the next normalizer is the same
+    mastml_driver._run_selector('PearsonSelector', selector, X, y, pd.DataFrame(), str(tmp_path), cache)
+    assert selector.threshold_with_target == 0.99
+    assert cache.make_key(X, y, pd.DataFrame(), selector) == key
+
+def test_run_selector_restores_output_files_on_cache_hit(tmp_path):
+    X, y = _data()
+    cache = SelectionCache(str(tmp_path / 'cache.sqlite'))
+    selector = MASTMLFeatureSelector(LinearRegression(), 2, KFold(n_splits=3))
+    first_output, second_output = tmp_path / 'first', tmp_path / 'second'
+    first_output.mkdir()
+    second_output.mkdir()
+
+    first = mastml_driver._run_selector('MASTMLFeatureSelector', selector, X, y, pd.DataFrame(), str(first_output), cache)
+    second = mastml_driver._run_selector('MASTMLFeatureSelector', selector, X, y, pd.DataFrame(), str(second_output),
+                                         cache)
+
+    assert first == second
+    assert sorted(os.listdir(str(first_output))) == sorted(os.listdir(str(second_output)))
+    for name in os.listdir(str(first_output)):
+        assert (first_output / name).read_text() == (second_output / name).read_text()